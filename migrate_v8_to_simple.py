@@ -1,52 +1,125 @@
+"""
+v8 スキーマ（civitai_prompts / prompt_categories）から簡易スキーマ（prompts）へ移す。
+
+- civitai_prompts.id の範囲ごとに INSERT ... SELECT 1 本で移す（カテゴリは group_concat で連結）
+- チャンクごとに 1 トランザクションで、進み具合を migration_state に同じトランザクションで記録する。
+  途中で止めても再実行で続きから進み、最後まで終わったら記録を消す（次回は全件を同期し直す）
+- 終わったら簡易スキーマの集計（simple_category_counts）があれば作り直す
+
+    python migrate_v8_to_simple.py --db civitai_dataset.db [--chunk-size 50000] [--restart]
+"""
+import argparse
 import sqlite3
+import sys
+import time
+from datetime import datetime
 from pathlib import Path
 
+ROOT = Path(__file__).resolve().parent
+SRC = str(ROOT / "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from collector import category_counts, schema
+from collector.db import CREATE_PROMPTS_TABLE
+
 DB = "test_collect.db"  # 実運用DBを使う場合はファイル名を置き換えてください
+STATE_NAME = "v8_to_simple"
+DEFAULT_CHUNK_SIZE = 50_000
+
+CREATE_STATE_TABLE = """
+CREATE TABLE IF NOT EXISTS migration_state (
+    name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL,
+    updated_at TIMESTAMP
+);
+"""
+
+# civitai_id があればそれを id に、無ければ civitai_prompts.id を使う。カテゴリは重複を除いて名前順に連結
+MIGRATE_CHUNK_SQL = """
+INSERT INTO prompts (id, model_id, prompt, categories, created_at)
+SELECT COALESCE(NULLIF(p.civitai_id, ''), CAST(p.id AS TEXT)), p.model_id, p.full_prompt,
+       (SELECT group_concat(category, ',') FROM (
+            SELECT DISTINCT c.category FROM prompt_categories c WHERE c.prompt_id = p.id ORDER BY c.category
+       )),
+       p.collected_at
+FROM civitai_prompts p
+WHERE p.id > ? AND p.id <= ?
+ORDER BY p.id
+ON CONFLICT(id) DO UPDATE SET
+    model_id=excluded.model_id,
+    prompt=excluded.prompt,
+    categories=excluded.categories,
+    created_at=excluded.created_at
+"""
+
 
-def migrate(db_path: str):
+def _load_state(conn, restart):
+    if restart:
+        with conn:
+            conn.execute("DELETE FROM migration_state WHERE name = ?", (STATE_NAME,))
+        return 0
+    row = conn.execute("SELECT last_id FROM migration_state WHERE name = ?", (STATE_NAME,)).fetchone()
+    return row[0] if row else 0
+
+
+def migrate(db_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, restart: bool = False) -> int:
+    """civitai_prompts を prompts に UPSERT する。返却: 今回移した行数"""
     conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-
-    # ensure target table exists (same schema as db.py expects)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS prompts (
-        id TEXT PRIMARY KEY,
-        model_id TEXT,
-        prompt TEXT,
-        categories TEXT,
-        created_at TEXT
-    );
-    """)
-
-    # read v8 prompts
-    cur.execute("SELECT id, civitai_id, full_prompt, collected_at, model_id FROM civitai_prompts")
-    rows = cur.fetchall()
-    for row in rows:
-        row_id, civitai_id, full_prompt, collected_at, model_id = row
-        # collect categories for this prompt_id
-        cur.execute("SELECT category FROM prompt_categories WHERE prompt_id = ?", (row_id,))
-        cats = [r[0] for r in cur.fetchall()]
-        categories = ",".join(sorted(set(cats))) if cats else None
-
-        # upsert into prompts (use civitai_id as id if available, otherwise civitai_prompts.id)
-        target_id = civitai_id or str(row_id)
-        cur.execute("""
-        INSERT INTO prompts (id, model_id, prompt, categories, created_at)
-        VALUES (?, ?, ?, ?, ?)
-        ON CONFLICT(id) DO UPDATE SET
-            model_id=excluded.model_id,
-            prompt=excluded.prompt,
-            categories=excluded.categories,
-            created_at=excluded.created_at
-        """, (target_id, model_id, full_prompt, categories, collected_at))
-
-    conn.commit()
-    conn.close()
-    print("migration complete")
+    try:
+        schema.apply_pragmas(conn)
+        conn.executescript(CREATE_PROMPTS_TABLE + CREATE_STATE_TABLE)
+        # 相関サブクエリが prompt_categories(prompt_id) の索引を使えるようにする
+        schema.migrate(conn)
+
+        last = _load_state(conn, restart)
+        if last:
+            print(f"[migrate] resuming after id {last}")
+        total = conn.execute("SELECT COUNT(*) FROM civitai_prompts WHERE id > ?", (last,)).fetchone()[0]
+        done, start = 0, time.time()
+        while True:
+            bounds = conn.execute(
+                "SELECT MAX(id), COUNT(*) FROM (SELECT id FROM civitai_prompts WHERE id > ? ORDER BY id LIMIT ?)",
+                (last, chunk_size),
+            ).fetchone()
+            if not bounds[1]:
+                break
+            upper, n = bounds
+            with conn:
+                conn.execute(MIGRATE_CHUNK_SQL, (last, upper))
+                conn.execute(
+                    "INSERT INTO migration_state (name, last_id, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET last_id=excluded.last_id, updated_at=excluded.updated_at",
+                    (STATE_NAME, upper, datetime.now().isoformat()),
+                )
+            last = upper
+            done += n
+            rate = done / max(time.time() - start, 1e-9)
+            print(f"[migrate] {done}/{total} rows ({rate:.0f} rows/sec)")
+
+        with conn:
+            conn.execute("DELETE FROM migration_state WHERE name = ?", (STATE_NAME,))
+        # prompts.categories を直接書いたので簡易スキーマの集計を作り直す（v8 の category_counts は別テーブル）
+        if category_counts.has_simple(conn):
+            category_counts.rebuild_simple(conn)
+        schema.optimize(conn)
+        print("migration complete")
+        return done
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="v8 スキーマの civitai_prompts を簡易スキーマの prompts に移す")
+    p.add_argument("--db", default=DB)
+    p.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    p.add_argument("--restart", action="store_true", help="前回の途中経過を捨てて先頭からやり直す")
+    args = p.parse_args(argv)
+    if not Path(args.db).exists():
+        print("DB not found:", args.db)
+        return
+    migrate(args.db, chunk_size=args.chunk_size, restart=args.restart)
+
 
 if __name__ == "__main__":
-    dbfile = DB
-    if not Path(dbfile).exists():
-        print("DB not found:", dbfile)
-    else:
-        migrate(dbfile)
\ No newline at end of file
+    main()
@@ -9,21 +9,32 @@ if SRC not in sys.path:
     sys.path.insert(0, SRC)
 
 from collector.categorizer import categorize_prompts_batch
+from collector.embedding_store import EmbeddingStore
 
-def load_prompts(conn):
+def load_prompts(conn, unique=True):
     cur = conn.cursor()
-    cur.execute("SELECT id, full_prompt FROM civitai_prompts")
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(civitai_prompts)")]
+    if unique and "group_id" in cols:
+        # ほぼ同じプロンプトは代表行だけを使う
+        cur.execute("SELECT id, full_prompt FROM civitai_prompts WHERE group_id IS NULL OR group_id = id")
+    else:
+        cur.execute("SELECT id, full_prompt FROM civitai_prompts")
     return cur.fetchall()
 
-def main(db="test_collect.db", min_cluster_size=3):
+def main(db="test_collect.db", min_cluster_size=3, use_cache=True, unique=True):
     if not Path(db).exists():
         print("DB not found:", db); return
     conn = sqlite3.connect(db)
-    items = load_prompts(conn)
+    items = load_prompts(conn, unique=unique)
     if not items:
         print("no prompts"); return
     ids, texts = zip(*items)
-    res = categorize_prompts_batch(list(texts), use_clustering=True, min_cluster_size=min_cluster_size)
+    kwargs = {}
+    if use_cache:
+        # 埋め込みは DB 横のキャッシュから読み、新規・変更プロンプトだけを計算する
+        with EmbeddingStore(db) as store:
+            kwargs["embeddings"] = store.get_or_compute(list(texts))
+    res = categorize_prompts_batch(list(texts), use_clustering=True, min_cluster_size=min_cluster_size, **kwargs)
     labels = res.get("clusters", {}).get("labels", [])
     summaries = res.get("summaries", {})
     print("cluster_info:", res.get("clusters", {}).get("cluster_info"))
@@ -34,5 +45,7 @@ if __name__ == "__main__":
     p = argparse.ArgumentParser()
     p.add_argument("--db", default="test_collect.db")
     p.add_argument("--min-cluster-size", type=int, default=3)
+    p.add_argument("--no-cache", action="store_true", help="埋め込みキャッシュを使わず毎回全件を埋め込む")
+    p.add_argument("--all", action="store_true", help="ほぼ同じプロンプトもまとめずに全行をクラスタリングする")
     args = p.parse_args()
-    main(db=args.db, min_cluster_size=args.min_cluster_size)
\ No newline at end of file
+    main(db=args.db, min_cluster_size=args.min_cluster_size, use_cache=not args.no_cache, unique=not args.all)
\ No newline at end of file
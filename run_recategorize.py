@@ -0,0 +1,12 @@
+from pathlib import Path
+import sys
+
+ROOT = Path(__file__).resolve().parent
+SRC = str(ROOT / "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from collector.recategorize import main
+
+if __name__ == "__main__":
+    main()
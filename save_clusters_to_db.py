@@ -1,47 +1,95 @@
 from pathlib import Path
 import sys
 import sqlite3
+import argparse
 
 ROOT = Path(__file__).resolve().parent
 SRC = str(ROOT / "src")
 if SRC not in sys.path:
     sys.path.insert(0, SRC)
 
-from collector.categorizer import categorize_prompts_batch
+from collector.categorizer import keyword_categorize
+from collector.category_counts import has_simple, rebuild_simple
+from collector.cluster_model import ClusterModel, default_model_path
+from collector.embedding_store import EmbeddingStore
 
 DB = "test_collect.db"  # 必要に応じて置き換えてください
 
-def load_prompts(conn):
+def ensure_categories_column(conn):
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(civitai_prompts)")]
+    if "categories" not in cols:
+        conn.execute("ALTER TABLE civitai_prompts ADD COLUMN categories TEXT")
+        conn.commit()
+
+def load_prompts(conn, only_unlabeled=False):
     cur = conn.cursor()
-    cur.execute("SELECT id, full_prompt FROM civitai_prompts")
+    if only_unlabeled:
+        cur.execute("SELECT id, full_prompt FROM civitai_prompts WHERE categories IS NULL")
+    else:
+        cur.execute("SELECT id, full_prompt FROM civitai_prompts")
     return cur.fetchall()
 
-def save_categories(conn, prompt_id, categories):
-    cur = conn.cursor()
-    # prompts テーブルがある場合はそちらも更新
-    cur.execute("UPDATE civitai_prompts SET categories = ? WHERE id = ?", (categories, prompt_id))
-    if conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='prompts'").fetchone():
-        conn.execute("UPDATE prompts SET categories = ? WHERE id = ?", (categories, prompt_id))
-    conn.commit()
-
-def main():
-    conn = sqlite3.connect(DB)
+def save_categories(conn, rows):
+    """rows: [(prompt_id, categories), ...] を 1 トランザクションで更新"""
+    has_prompts = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='prompts'").fetchone()
+    with conn:
+        conn.executemany("UPDATE civitai_prompts SET categories = ? WHERE id = ?", [(c, pid) for pid, c in rows])
+        # prompts テーブルがある場合はそちらも更新
+        if has_prompts:
+            conn.executemany("UPDATE prompts SET categories = ? WHERE id = ?", [(c, pid) for pid, c in rows])
+    if has_prompts and has_simple(conn):
+        rebuild_simple(conn)
+
+def category_strings(texts, labels):
+    out = []
+    for text, lbl in zip(texts, labels):
+        kw = keyword_categorize(text)
+        kw_str = ",".join(kw) if kw else ""
+        out.append(kw_str + (f"|cluster:{int(lbl)}" if lbl is not None else ""))
+    return out
+
+def embed(db, texts):
+    with EmbeddingStore(db) as store:
+        return store.get_or_compute(list(texts))
+
+def main(db=DB, incremental=False, min_cluster_size=3):
+    conn = sqlite3.connect(db)
+    ensure_categories_column(conn)
+    model_path = default_model_path(db)
+
+    if incremental and Path(model_path).exists():
+        items = load_prompts(conn, only_unlabeled=True)
+        if not items:
+            print("no new prompts")
+            conn.close()
+            return
+        ids, texts = zip(*items)
+        model = ClusterModel.load(model_path)
+        embs = embed(db, texts)
+        labels = model.assign(embs)
+        if not model.needs_refit(labels, embs):
+            save_categories(conn, list(zip(ids, category_strings(texts, labels))))
+            print("saved categories for", len(ids), "new prompts")
+            conn.close()
+            return
+        print("noise/drift threshold exceeded, refitting on all prompts")
+
     items = load_prompts(conn)
     if not items:
         print("no prompts")
+        conn.close()
         return
     ids, texts = zip(*items)
-    res = categorize_prompts_batch(list(texts), use_clustering=True, min_cluster_size=3)
-    labels = res.get("clusters", {}).get("cluster_info")
-    # res["clusters"]["labels"] はクラスタラベル配列
-    cluster_labels = res.get("clusters", {}).get("labels")
-    keyword_lists = res.get("keyword", [])
-    for pid, kw, lbl in zip(ids, keyword_lists, cluster_labels):
-        kw_str = ",".join(kw) if kw else ""
-        cat = kw_str + (f"|cluster:{int(lbl)}" if lbl is not None else "")
-        save_categories(conn, pid, cat)
+    model = ClusterModel.fit(embed(db, texts), min_cluster_size=min_cluster_size)
+    model.save(model_path)
+    save_categories(conn, list(zip(ids, category_strings(texts, model.labels_))))
     print("saved categories for", len(ids))
     conn.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    p = argparse.ArgumentParser()
+    p.add_argument("--db", default=DB)
+    p.add_argument("--min-cluster-size", type=int, default=3)
+    p.add_argument("--incremental", action="store_true", help="保存済みクラスタモデルで未ラベルの行だけを割り当てる")
+    args = p.parse_args()
+    main(db=args.db, incremental=args.incremental, min_cluster_size=args.min_cluster_size)
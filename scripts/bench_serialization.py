@@ -0,0 +1,84 @@
+"""
+ページのデコード → raw_metadata 用の再エンコード → カテゴリ keywords のエンコードにかかる時間を
+旧実装（標準 json）と collector.serialization で比較する。
+
+    python scripts/bench_serialization.py --pages 200 --items 100
+    COLLECTOR_JSON_BACKEND=json python scripts/bench_serialization.py   # バックエンドを固定
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+# Add the `src` directory to the Python module search path
+src_path = Path(__file__).resolve().parent.parent / "src"
+if str(src_path) not in sys.path:
+    sys.path.insert(0, str(src_path))
+
+from collector import serialization
+
+TAGS = [
+    "masterpiece", "best quality", "1girl", "solo", "long hair", "smile", "looking at viewer", "blue eyes",
+    "cinematic lighting", "city", "night", "rain", "桜", "着物", "forest", "castle", "dragon", "armor",
+]
+
+
+def make_page(n_items, rng):
+    items = []
+    for i in range(n_items):
+        items.append({
+            "id": rng.randrange(10**8), "url": f"https://image.civitai.com/x/{i}.jpeg", "width": 512, "height": 768,
+            "nsfwLevel": "None", "createdAt": "2025-09-01T12:00:00.000Z", "postId": rng.randrange(10**7),
+            "stats": {"cryCount": 0, "laughCount": 1, "likeCount": rng.randrange(500), "heartCount": 3, "commentCount": 2},
+            "meta": {
+                "prompt": ", ".join(rng.sample(TAGS, 10)), "negativePrompt": "lowres, bad anatomy, worst quality",
+                "sampler": "DPM++ 2M Karras", "cfgScale": 7, "steps": 30, "seed": rng.randrange(10**9),
+                "Size": "512x768", "Model": "anything-v5", "resources": [{"name": "detail", "type": "lora", "weight": 0.8}],
+            },
+            "username": f"user{i}",
+        })
+    return json.dumps({"items": items, "metadata": {"nextPage": "https://civitai.com/api/v1/images?cursor=x"}},
+                      ensure_ascii=False).encode("utf-8")
+
+
+def legacy(bodies):
+    for body in bodies:
+        data = json.loads(body)
+        for item in data.get("items", []):
+            json.dumps(item, ensure_ascii=False)
+            for _ in range(3):
+                json.dumps(["masterpiece", "best quality"], ensure_ascii=False)
+
+
+def current(bodies):
+    for body in bodies:
+        items, _metadata = serialization.decode_page(body)
+        for item in items:
+            serialization.item_bytes(item)
+            for _ in range(3):
+                serialization.dumps(["masterpiece", "best quality"])
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--pages", type=int, default=200)
+    p.add_argument("--items", type=int, default=100)
+    args = p.parse_args()
+    rng = random.Random(0)
+    bodies = [make_page(args.items, rng) for _ in range(args.pages)]
+    n = args.pages * args.items
+
+    results = {}
+    for name, fn in (("legacy json", legacy), (f"serialization[{serialization.BACKEND}]", current)):
+        start = time.perf_counter()
+        fn(bodies)
+        results[name] = time.perf_counter() - start
+        print(f"{name:28s} {results[name]:.3f}s  ({n / results[name]:.0f} items/sec)")
+    base, new = results.values()
+    print(f"speedup: {base / new:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import random
+import sys
+import time
+from pathlib import Path
+
+# Add the `src` directory to the Python module search path
+src_path = Path(__file__).resolve().parent.parent / "src"
+if str(src_path) not in sys.path:
+    sys.path.insert(0, str(src_path))
+
+import numpy as np
+from collector.categorizer import summarize_clusters
+
+VOCAB = [
+    "masterpiece", "best quality", "1girl", "solo", "long hair", "smile", "looking at viewer", "blue eyes",
+    "cinematic lighting", "city", "night", "rain", "umbrella", "forest", "river", "castle", "dragon", "armor",
+    "sword", "kimono", "school uniform", "beach", "sunset", "neon", "cyberpunk", "steampunk", "watercolor",
+    "oil painting", "sketch", "flowers", "cat ears", "glasses", "red dress", "snow", "winter", "autumn leaves",
+]
+
+
+def legacy_summarize(prompts, labels, top_n=5):
+    """旧実装（ラベルごとに行を集めて平均）の TF-IDF 部分。比較用"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.feature_extraction import _stop_words
+    from collector.categorizer import REPRESENTATIVE_STOPWORDS
+    import re
+    cleaned = [re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", p.lower())).strip() for p in prompts]
+    stop_words = list(set(_stop_words.ENGLISH_STOP_WORDS).union(REPRESENTATIVE_STOPWORDS))
+    vect = TfidfVectorizer(max_df=0.9, min_df=1, stop_words=stop_words, ngram_range=(1, 3), max_features=10000)
+    X = vect.fit_transform(cleaned)
+    terms = np.array(vect.get_feature_names_out())
+    out = {}
+    for lbl in sorted(set(int(l) for l in labels)):
+        idxs = [i for i, v in enumerate(labels) if int(v) == lbl]
+        if lbl == -1:
+            out[lbl] = "noise"
+            continue
+        vec = np.asarray(X[idxs].mean(axis=0)).ravel()
+        top = [t for t in terms[vec.argsort()[::-1][:top_n]] if t.strip()]
+        out[lbl] = ", ".join(top[:top_n])
+    return out
+
+
+def make_corpus(n, k, seed=0):
+    rng = random.Random(seed)
+    prompts = [", ".join(rng.sample(VOCAB, rng.randint(4, 12))) + f", seed{rng.randint(0, 5000)}" for _ in range(n)]
+    labels = np.array([rng.randint(-1, k - 1) for _ in range(n)])
+    return prompts, labels
+
+
+def main():
+    print(f"{'n':>8} {'k':>6} {'legacy[s]':>10} {'vectorised[s]':>14}")
+    for n, k in [(2000, 20), (2000, 200), (20000, 20), (20000, 200), (50000, 500)]:
+        prompts, labels = make_corpus(n, k)
+        t0 = time.perf_counter()
+        new = summarize_clusters(prompts, labels)
+        t1 = time.perf_counter()
+        legacy_time = float("nan")
+        if n * k <= 4_000_000:
+            old = legacy_summarize(prompts, labels)
+            legacy_time = time.perf_counter() - t1
+            # 同点語の並びは旧実装では不定なので、語の集合で比較する
+            same = sum(set(old[l].split(", ")) == set(new[l].split(", ")) for l in old)
+            print(f"  same top terms: {same}/{len(old)}")
+        print(f"{n:>8} {k:>6} {legacy_time:>10.2f} {t1 - t0:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
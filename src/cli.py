@@ -7,6 +7,11 @@ def main():
     parser.add_argument("--model-id", help="モデルID（省略で全体）", default=None)
     parser.add_argument("--model-name", help="モデル名（表示用）", default=None)
     parser.add_argument("--max-items", type=int, default=5000, help="1モデルあたり最大件数")
+    parser.add_argument("--concurrency", type=int, default=1, help="並行収集するモデル数（2以上で非同期エンジン）")
+    parser.add_argument("--requests-per-second", type=float, default=None,
+                        help="API へのリクエスト上限（req/s、省略で既定の 2.0）")
+    parser.add_argument("--no-resume", action="store_true", help="チェックポイントを無視して先頭から収集する")
+    parser.add_argument("--incremental", action="store_true", help="新着順に取得し、収集済みの ID に達したら打ち切る")
     parser.add_argument("--no-show", action="store_true", help="可視化のウィンドウを表示しない")
     args = parser.parse_args()
 
@@ -16,10 +21,14 @@ def main():
         setattr(collector, "api_key", api_key)
 
     models = {args.model_name or "ALL_MODELS": args.model_id} if args.model_id or args.model_name else {"ALL_MODELS": None}
-    results = collector.collect_for_models(models, max_per_model=args.max_items)
+    results = collector.collect_for_models(models, max_per_model=args.max_items, concurrency=args.concurrency,
+                                           requests_per_second=args.requests_per_second,
+                                           resume=not args.no_resume, incremental=args.incremental)
     print("収集結果:", results)
 
-    collector.visualize_category_distribution(models_to_plot=list(models.keys()), normalize_percent=True, show=not args.no_show)
+    # 簡易スキーマの可視化は model_id で絞り込む（指定なしなら全モデル）
+    collector.visualize_category_distribution(models_to_plot=[args.model_id] if args.model_id else None,
+                                              normalize_percent=True, show=not args.no_show)
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,6 @@
 from .collector import CivitaiPromptCollector
 from .config import CATEGORIES, DB_DEFAULT, CIVITAI_API_ENV
-from .db import init_db, save_prompt, count_prompts
+from .db import PromptStore, init_db, save_prompt, count_prompts
 from .categorizer import categorize_prompt
 from .visualizer import visualize_category_distribution
 
@@ -9,6 +9,7 @@ __all__ = [
     "CATEGORIES",
     "DB_DEFAULT",
     "CIVITAI_API_ENV",
+    "PromptStore",
     "init_db",
     "save_prompt",
     "count_prompts",
@@ -0,0 +1,99 @@
+import asyncio
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+from .civitai_collector_v8 import DEFAULT_SORT, INCREMENTAL_SORT, KNOWN_PAGE_RATIO
+
+# 既定の同時ストリーム数
+DEFAULT_CONCURRENCY = 4
+
+
+class AsyncCollectionEngine:
+    """
+    複数の modelVersionId を asyncio で並行収集するエンジン。
+    - HTTP 取得は collector.fetch_batch をスレッドに逃がして実行（セッション/リトライ処理はそのまま）
+    - 同時実行数はグローバル上限とホスト単位の上限で制御
+    - 送信ペースは collector.rate_limiter（全ストリーム共有）が決める。requests_per_second はその上限
+    - DB 書き込みはイベントループのスレッドで save_prompt_batch を呼ぶ（SQLite 接続を共有しない）
+    """
+
+    def __init__(self, collector, max_concurrency: int = DEFAULT_CONCURRENCY,
+                 requests_per_second: Optional[float] = None, per_host_limit: Optional[int] = None):
+        self.collector = collector
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.per_host_limit = max(1, int(per_host_limit or self.max_concurrency))
+        if requests_per_second:
+            collector.rate_limiter.set_max_rate(requests_per_second)
+
+    def _host_of(self, url_or_params) -> str:
+        url = url_or_params if isinstance(url_or_params, str) else self.collector.base_url
+        return urlparse(url).netloc
+
+    async def _fetch(self, url_or_params):
+        host_sem = self._host_limits.setdefault(self._host_of(url_or_params), asyncio.Semaphore(self.per_host_limit))
+        async with self._global_limit, host_sem:
+            return await asyncio.to_thread(self.collector.fetch_page, url_or_params)
+
+    async def collect_model(self, model_id=None, model_name=None, max_items: int = 5000, resume: bool = True,
+                            incremental: bool = False) -> Dict[str, int]:
+        """1 モデル分を収集（collect_dataset と同じページング・保存・チェックポイント・差分収集のフロー）"""
+        label = model_name or model_id or "ALL_MODELS"
+        params = {"limit": 20, "sort": INCREMENTAL_SORT if incremental else DEFAULT_SORT}
+        if model_id:
+            params["modelVersionId"] = model_id
+
+        collected = 0
+        saved = 0
+        next_page = None
+        known_ids = self.collector.load_known_ids(model_id) if incremental else None
+        if resume and not incremental:
+            checkpoint = self.collector.load_checkpoint(model_id, params["sort"])
+            if checkpoint:
+                next_page, collected = checkpoint["next_page"], checkpoint["collected"]
+                print(f"[async_collect] {label}: resuming from checkpoint (collected: {collected})")
+
+        finished = collected >= max_items
+        while collected < max_items:
+            batch, next_page, ok = await self._fetch(next_page or params)
+            if not batch:
+                finished = ok
+                break
+            rows, consumed = self.collector.prepare_page(batch, model_id, model_name, max_items - collected)
+            collected += consumed
+            checkpoint = {"model_id": model_id, "sort": params["sort"], "next_page": next_page, "collected": collected}
+            saved += self.collector.save_prompt_batch(rows, checkpoint=checkpoint, skip_unchanged=incremental)["saved"]
+            print(f"[async_collect] {label}: saved {saved}/{collected}")
+            if not next_page:
+                finished = True
+                break
+            if known_ids is not None and self.collector.known_ratio(batch[:consumed], known_ids) >= KNOWN_PAGE_RATIO:
+                finished = True
+                break
+        if finished or collected >= max_items:
+            self.collector.clear_checkpoint(model_id, params["sort"])
+        return {"collected": collected, "saved": saved}
+
+    async def collect_all(self, models: Dict[str, Optional[str]], max_per_model: int = 5000,
+                          resume: bool = True, incremental: bool = False) -> Dict[str, Dict[str, Any]]:
+        self._global_limit = asyncio.Semaphore(self.max_concurrency)
+        self._host_limits = {}
+
+        names = list(models.keys())
+        outcomes = await asyncio.gather(
+            *(self.collect_model(models[name], name, max_per_model, resume=resume, incremental=incremental)
+              for name in names),
+            return_exceptions=True,
+        )
+        results = {}
+        for name, res in zip(names, outcomes):
+            if isinstance(res, Exception):
+                print(f"[async_collect] {name} failed: {res}")
+                res = {"collected": 0, "saved": 0, "error": str(res)}
+            results[name] = res
+        return results
+
+    def run(self, models: Dict[str, Optional[str]], max_per_model: int = 5000,
+            resume: bool = True, incremental: bool = False) -> Dict[str, Dict[str, Any]]:
+        """同期コードから呼ぶための入口"""
+        return asyncio.run(self.collect_all(models, max_per_model=max_per_model, resume=resume,
+                                            incremental=incremental))
@@ -1,37 +1,35 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 from .config import CATEGORIES, REPRESENTATIVE_STOPWORDS
+from .matcher import KeywordMatcher
+from . import large_clustering
+
+# config.CATEGORIES から一度だけ構築する照合器
+_MATCHER = KeywordMatcher(CATEGORIES)
 
 # キーワードマッチ実装
 def keyword_categorize(text: str) -> List[str]:
-    text_lower = (text or "").lower()
-    hits = set()
-    for cat, keywords in CATEGORIES.items():
-        for kw in keywords:
-            if kw.lower() in text_lower:
-                hits.add(cat)
-                break
-    return sorted(hits)
+    return sorted(_MATCHER.match(text or ""))
 
 # 互換ラッパー
 def categorize_prompt(text: str) -> List[str]:
     return keyword_categorize(text)
 
 # 埋め込み/次元削減/クラスタリング
-def cluster_prompts(prompts: List[str], min_cluster_size: int = 5, umap_n_neighbors: int = 15, umap_n_components: int = 5):
-    if not prompts:
-        return {"labels": [], "embedding": None, "cluster_info": {}}
-    try:
-        import numpy as np
-        from .embeddings import embed_texts
-        import umap
-        import hdbscan
-    except Exception as e:
-        raise RuntimeError("必要な依存がありません: sentence-transformers, umap-learn, hdbscan") from e
+def reduce_and_cluster(embs, min_cluster_size: int = 5, umap_n_neighbors: int = 15, umap_n_components: int = 5,
+                       prediction_data: bool = False):
+    """
+    UMAP（失敗時は PCA / 素の埋め込み）で次元削減して HDBSCAN（少数時は KMeans）でクラスタリングする。
+    返却: (labels, 低次元座標, reducer or None, clusterer or None)
+    prediction_data=True で HDBSCAN に approximate_predict 用のデータを持たせる。
+    """
+    import numpy as np
+    import umap
+    import hdbscan
 
-    embs = embed_texts(prompts)
-    n_samples = len(prompts)
+    n_samples = len(embs)
     adj_components = max(1, min(umap_n_components, max(1, n_samples - 1)))
 
+    reducer = None
     try:
         reducer = umap.UMAP(n_neighbors=umap_n_neighbors, n_components=adj_components, metric="cosine", random_state=42)
         low = reducer.fit_transform(embs)
@@ -40,36 +38,83 @@ def cluster_prompts(prompts: List[str], min_cluster_size: int = 5, umap_n_neighb
         try:
             from sklearn.decomposition import PCA
             pca_n = min(adj_components, embs.shape[1])
-            low = PCA(n_components=pca_n, random_state=42).fit_transform(embs)
+            reducer = PCA(n_components=pca_n, random_state=42)
+            low = reducer.fit_transform(embs)
         except Exception:
+            reducer = None
             low = embs
 
     # --- 追加: 少数サンプルは KMeans にフォールバック（HDBSCAN は少数で noise にしやすい） ---
     labels = None
+    clusterer = None
     try:
         if n_samples < 5:
             from sklearn.cluster import KMeans
             k = min(2, n_samples)
-            km = KMeans(n_clusters=k, random_state=42)
-            labels = km.fit_predict(low)
+            clusterer = KMeans(n_clusters=k, random_state=42)
+            labels = clusterer.fit_predict(low)
         else:
             # HDBSCAN の min_cluster_size は最低 2 にする（1 を渡すと例外になる）
             hdb_min_cluster = max(2, int(min_cluster_size))
             # min_samples を安全に設定（None だと自動、ここは半分を目安）
             hdb_min_samples = max(1, hdb_min_cluster // 2)
-            clusterer = hdbscan.HDBSCAN(min_cluster_size=hdb_min_cluster, min_samples=hdb_min_samples, metric="euclidean")
+            clusterer = hdbscan.HDBSCAN(min_cluster_size=hdb_min_cluster, min_samples=hdb_min_samples, metric="euclidean",
+                                        prediction_data=prediction_data)
             labels = clusterer.fit_predict(low)
     except Exception as e:
         print(f"[cluster_prompts] clustering failed ({e}), marking all as noise")
-        import numpy as _np
-        labels = _np.array([-1] * n_samples)
+        clusterer = None
+        labels = np.array([-1] * n_samples)
     # --- 追加終了 ---
+    return labels, low, reducer, clusterer
+
+def cluster_prompts(prompts: List[str], min_cluster_size: int = 5, umap_n_neighbors: int = 15, umap_n_components: int = 5,
+                    embeddings=None, embed_batch_size: Optional[int] = None, embed_num_threads: Optional[int] = None,
+                    mode: str = "auto", sample_size: Optional[int] = None, chunk_size: Optional[int] = None):
+    """
+    embeddings を渡すと再計算せずにそれを使う（EmbeddingStore の結果など。prompts と同じ順序）。
+    embed_batch_size / embed_num_threads は embed_texts に渡す。
+    mode: "full"（全件で UMAP + HDBSCAN）/ "large"（サンプルで学習し残りをチャンク単位で割り当て）/
+          "auto"（件数と空きメモリから選ぶ）
+    """
+    if mode not in ("auto", "full", "large"):
+        raise ValueError(f"unknown mode: {mode}")
+    if not prompts:
+        return {"labels": [], "embedding": None, "cluster_info": {}}
+    try:
+        import numpy as np
+        from .embeddings import embed_texts
+        import umap
+        import hdbscan
+    except Exception as e:
+        raise RuntimeError("必要な依存がありません: sentence-transformers, umap-learn, hdbscan") from e
+
+    if embeddings is None:
+        embs = embed_texts(prompts, batch_size=embed_batch_size, num_threads=embed_num_threads)
+    else:
+        embs = embeddings
+    if mode == "auto":
+        mode = large_clustering.choose_mode(len(embs), int(np.shape(embs)[1]), umap_n_neighbors)
+    if mode == "large":
+        labels = large_clustering.cluster_large(
+            embs, min_cluster_size=min_cluster_size, umap_n_neighbors=umap_n_neighbors,
+            umap_n_components=umap_n_components,
+            sample_size=sample_size or large_clustering.DEFAULT_SAMPLE_SIZE,
+            chunk_size=chunk_size or large_clustering.DEFAULT_CHUNK_SIZE,
+        )
+    else:
+        labels, _low, _reducer, _clusterer = reduce_and_cluster(
+            embs, min_cluster_size=min_cluster_size, umap_n_neighbors=umap_n_neighbors, umap_n_components=umap_n_components
+        )
 
     unique, counts = np.unique(labels, return_counts=True)
     cluster_info = {int(k): int(v) for k, v in zip(unique.tolist(), counts.tolist())}
     return {"labels": labels, "embedding": embs, "cluster_info": cluster_info}
 
 # 代表キーワード抽出（簡易）
+# 重心行列を密にするときのクラスタ数の単位（k × 語彙数の一時配列を抑える）
+SUMMARY_BLOCK = 256
+
 def summarize_clusters(prompts: List[str], labels, top_n: int = 5, ngram_range=(1,3)) -> Dict[int, str]:
     """
     TF-IDF による代表語抽出（前処理付き、フォールバックあり）。
@@ -107,19 +152,30 @@ def summarize_clusters(prompts: List[str], labels, top_n: int = 5, ngram_range=(
         X = vect.fit_transform(cleaned)
         terms = _np.array(vect.get_feature_names_out())
 
-        unique_labels = sorted(set(int(l) for l in labels))
-        for lbl in unique_labels:
-            idxs = [i for i, v in enumerate(labels) if int(v) == lbl]
-            if not idxs:
-                summaries[int(lbl)] = ""
-                continue
-            if lbl == -1:
-                summaries[int(lbl)] = "noise"
-                continue
-            cluster_vec = _np.asarray(X[idxs].mean(axis=0)).ravel()
-            top_idx = cluster_vec.argsort()[::-1][:top_n]
-            top_terms = [t for t in terms[top_idx] if t.strip()]
-            summaries[int(lbl)] = ", ".join(top_terms[:top_n]) if top_terms else ""
+        # ラベル指示行列 (k × n, 値は 1/クラスタ件数) との積 1 回で全クラスタの TF-IDF 平均を求める
+        from scipy import sparse
+        unique_labels, inverse = _np.unique(_np.asarray(labels, dtype=int), return_inverse=True)
+        sizes = _np.bincount(inverse, minlength=len(unique_labels))
+        indicator = sparse.csr_matrix(
+            (1.0 / sizes[inverse], (inverse, _np.arange(len(inverse)))),
+            shape=(len(unique_labels), len(inverse)),
+        )
+        centroids = (indicator @ X).tocsr()
+
+        n_top = min(top_n, len(terms))
+        for start in range(0, len(unique_labels), SUMMARY_BLOCK):
+            block = centroids[start:start + SUMMARY_BLOCK].toarray()
+            # 上位 n_top 語を argpartition で取り出し、その中だけ降順に並べる
+            top = _np.argpartition(-block, n_top - 1, axis=1)[:, :n_top] if n_top else _np.zeros((len(block), 0), int)
+            top_scores = _np.take_along_axis(block, top, axis=1)
+            # 同点の語は語彙順（アルファベット順）に並べて結果を決定的にする
+            top = _np.take_along_axis(top, _np.lexsort((top, -top_scores), axis=1), axis=1)
+            for row, lbl in enumerate(unique_labels[start:start + SUMMARY_BLOCK]):
+                if lbl == -1:
+                    summaries[int(lbl)] = "noise"
+                    continue
+                top_terms = [t for t in terms[top[row]] if t.strip()]
+                summaries[int(lbl)] = ", ".join(top_terms[:top_n]) if top_terms else ""
         return summaries
 
     except Exception:
@@ -0,0 +1,190 @@
+"""
+カテゴリごとのプロンプト数を持つ集計テーブル。可視化はこれ（モデル数 × カテゴリ数の行）だけを読めばよく、
+コーパス全体を走査しない。v8 と簡易スキーマは同じ DB に同居するので、テーブルを分けている。
+
+- v8 スキーマ: category_counts(model_id, model_name, category, count, unique_count)。
+  prompt_categories / civitai_prompts のトリガで増減する（バッチ保存・再分類・移行のどれからでも追従）。
+  unique_count は代表行（group_id が NULL か自分自身）だけを数えた値。
+  テーブル・トリガ・既存データからの組み立ては schema.MIGRATIONS の 1 段として user_version で 1 度だけ流す
+- 簡易スキーマ: simple_category_counts(model_id, category, count)。prompts.categories（カンマ区切り）から数え、
+  db.PromptStore が保存前後の差分を適用する。テーブルの作成と既存行からの組み立ては同じトランザクションで行う
+"""
+import sqlite3
+from typing import Dict, List, Optional, Sequence, Tuple
+
+CREATE_CATEGORY_COUNTS = """
+CREATE TABLE IF NOT EXISTS category_counts (
+    model_id TEXT NOT NULL,
+    model_name TEXT NOT NULL,
+    category TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    unique_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (model_id, model_name, category)
+);
+"""
+
+_CANONICAL = "(p.group_id IS NULL OR p.group_id = p.id)"
+
+CREATE_V8_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS category_counts_ai AFTER INSERT ON prompt_categories BEGIN
+    INSERT INTO category_counts (model_id, model_name, category, count, unique_count)
+    SELECT COALESCE(p.model_id, ''), COALESCE(p.model_name, ''), new.category, 1, {_CANONICAL}
+    FROM civitai_prompts p WHERE p.id = new.prompt_id
+    ON CONFLICT(model_id, model_name, category) DO UPDATE SET
+        count = count + excluded.count, unique_count = unique_count + excluded.unique_count;
+END;
+CREATE TRIGGER IF NOT EXISTS category_counts_ad AFTER DELETE ON prompt_categories BEGIN
+    UPDATE category_counts SET
+        count = count - 1,
+        unique_count = unique_count - (SELECT {_CANONICAL} FROM civitai_prompts p WHERE p.id = old.prompt_id)
+    WHERE category = old.category AND (model_id, model_name) =
+        (SELECT COALESCE(p.model_id, ''), COALESCE(p.model_name, '') FROM civitai_prompts p WHERE p.id = old.prompt_id);
+END;
+CREATE TRIGGER IF NOT EXISTS category_counts_prompt_au
+AFTER UPDATE OF model_id, model_name, group_id ON civitai_prompts
+WHEN old.model_id IS NOT new.model_id OR old.model_name IS NOT new.model_name OR old.group_id IS NOT new.group_id
+BEGIN
+    UPDATE category_counts SET
+        count = count - 1,
+        unique_count = unique_count - (old.group_id IS NULL OR old.group_id = old.id)
+    WHERE model_id = COALESCE(old.model_id, '') AND model_name = COALESCE(old.model_name, '')
+        AND category IN (SELECT category FROM prompt_categories WHERE prompt_id = old.id);
+    INSERT INTO category_counts (model_id, model_name, category, count, unique_count)
+    SELECT COALESCE(new.model_id, ''), COALESCE(new.model_name, ''), category, COUNT(*),
+           COUNT(*) * (new.group_id IS NULL OR new.group_id = new.id)
+    FROM prompt_categories WHERE prompt_id = new.id GROUP BY category
+    ON CONFLICT(model_id, model_name, category) DO UPDATE SET
+        count = count + excluded.count, unique_count = unique_count + excluded.unique_count;
+END;
+CREATE TRIGGER IF NOT EXISTS category_counts_prompt_bd BEFORE DELETE ON civitai_prompts BEGIN
+    UPDATE category_counts SET
+        count = count - 1,
+        unique_count = unique_count - (old.group_id IS NULL OR old.group_id = old.id)
+    WHERE model_id = COALESCE(old.model_id, '') AND model_name = COALESCE(old.model_name, '')
+        AND category IN (SELECT category FROM prompt_categories WHERE prompt_id = old.id);
+END;
+"""
+
+
+FILL_V8 = f"""
+INSERT INTO category_counts (model_id, model_name, category, count, unique_count)
+SELECT COALESCE(p.model_id, ''), COALESCE(p.model_name, ''), c.category, COUNT(*), SUM({_CANONICAL})
+FROM prompt_categories c JOIN civitai_prompts p ON p.id = c.prompt_id
+GROUP BY 1, 2, 3
+"""
+
+# schema.MIGRATIONS から流す（既存 DB では以前のコードで数えた値も捨てて組み立て直す）
+V8_MIGRATION = CREATE_CATEGORY_COUNTS + CREATE_V8_TRIGGERS + "DELETE FROM category_counts;\n" + FILL_V8 + ";"
+
+CREATE_SIMPLE_COUNTS = """
+CREATE TABLE IF NOT EXISTS simple_category_counts (
+    model_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (model_id, category)
+);
+"""
+
+# prompts.categories（"a,b|cluster:3"）をカンマで分割して model_id × カテゴリで数える。
+# "|" 以降（クラスタ番号）は除く。{filter} には model_id の絞り込みが入る（idx_prompts_model_id を使う）
+SPLIT_COUNT_SQL = """
+WITH RECURSIVE split(model_id, category, rest) AS (
+    SELECT model_id, '', substr(categories, 1, instr(categories || '|', '|') - 1) || ','
+    FROM prompts WHERE categories IS NOT NULL {filter}
+    UNION ALL
+    SELECT model_id, substr(rest, 1, instr(rest, ',') - 1), substr(rest, instr(rest, ',') + 1)
+    FROM split WHERE rest != ''
+)
+SELECT COALESCE(model_id, ''), category, COUNT(*) FROM split WHERE category != '' GROUP BY 1, 2
+"""
+
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone() is not None
+
+
+# --- v8 スキーマ ---
+def rebuild_v8(conn: sqlite3.Connection):
+    """prompt_categories × civitai_prompts から作り直す（トリガがずれた場合の修復用）"""
+    with conn:
+        conn.execute("DELETE FROM category_counts")
+        conn.execute(FILL_V8)
+
+
+# --- 簡易スキーマ ---
+def split_categories(categories: Optional[str]) -> List[str]:
+    """prompts.categories（"a,b|cluster:3" 形式も可）をカテゴリ名のリストにする"""
+    return [c for c in (categories or "").split("|", 1)[0].split(",") if c]
+
+
+def create_simple(conn: sqlite3.Connection):
+    """
+    simple_category_counts を作る。作るときは既存の prompts からの組み立てまで同じトランザクションで行うので、
+    テーブルがあれば組み立て済み（このテーブルは他の経路では作らない）
+    """
+    if _table_exists(conn, "simple_category_counts"):
+        return
+    with conn:
+        conn.execute(CREATE_SIMPLE_COUNTS)
+        _fill_simple(conn)
+
+
+def has_simple(conn: sqlite3.Connection) -> bool:
+    return _table_exists(conn, "simple_category_counts")
+
+
+def _fill_simple(conn: sqlite3.Connection):
+    if _table_exists(conn, "prompts"):
+        conn.execute(
+            "INSERT INTO simple_category_counts (model_id, category, count) " + SPLIT_COUNT_SQL.format(filter="")
+        )
+
+
+def rebuild_simple(conn: sqlite3.Connection):
+    """prompts から simple_category_counts を作り直す（prompts.categories を直接書き換えた後に呼ぶ）"""
+    with conn:
+        conn.execute("DELETE FROM simple_category_counts")
+        _fill_simple(conn)
+
+
+def apply_simple_delta(conn: sqlite3.Connection, old: Optional[Tuple[Optional[str], Optional[str]]],
+                       new: Tuple[Optional[str], Optional[str]]):
+    """prompts の 1 行が (model_id, categories) old -> new に変わった分を反映する（old は新規なら None）"""
+    deltas: Dict[Tuple[str, str], int] = {}
+    for sign, row in ((-1, old), (1, new)):
+        if row is None:
+            continue
+        for c in split_categories(row[1]):
+            key = (row[0] or "", c)
+            deltas[key] = deltas.get(key, 0) + sign
+    conn.executemany(
+        "INSERT INTO simple_category_counts (model_id, category, count) VALUES (?, ?, ?) "
+        "ON CONFLICT(model_id, category) DO UPDATE SET count = count + excluded.count",
+        [(m, c, d) for (m, c), d in deltas.items() if d],
+    )
+
+
+# --- 読み出し ---
+def load_counts(conn: sqlite3.Connection, by: str = "model_name", unique: bool = False,
+                models: Optional[Sequence[str]] = None) -> List[Tuple[str, str, int]]:
+    """v8 の [(model_name または model_id, category, 件数), ...]。models を渡すとそのモデルだけ"""
+    if by not in ("model_name", "model_id"):
+        raise ValueError(f"unknown key: {by}")
+    col = "unique_count" if unique else "count"
+    sql = f"SELECT {by}, category, SUM({col}) FROM category_counts"
+    params: list = []
+    if models is not None:
+        sql += f" WHERE {by} IN ({','.join('?' * len(models))})"
+        params = [str(m) for m in models]
+    sql += f" GROUP BY {by}, category HAVING SUM({col}) > 0"
+    return conn.execute(sql, params).fetchall()
+
+
+def load_simple_counts(conn: sqlite3.Connection, models: Optional[Sequence[str]] = None) -> List[Tuple[str, str, int]]:
+    """簡易スキーマの [(model_id, category, 件数), ...]。models を渡すとそのモデルだけ"""
+    sql = "SELECT model_id, category, count FROM simple_category_counts WHERE count > 0"
+    params: list = []
+    if models is not None:
+        sql += f" AND model_id IN ({','.join('?' * len(models))})"
+        params = [str(m) for m in models]
+    return conn.execute(sql, params).fetchall()
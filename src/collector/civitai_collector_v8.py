@@ -7,7 +7,8 @@
 # - 可視化: モデルごとカテゴリ分布をスタック棒グラフで表示
 
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
 import sqlite3
 import time
 from datetime import datetime
@@ -16,49 +17,158 @@ import matplotlib.pyplot as plt
 import numpy as np
 import sys
 import re
+import hashlib
 import os  # 追加
 
+from .matcher import KeywordMatcher
+from .ratelimit import AdaptiveRateLimiter
+from . import category_counts, dedup, schema, search, serialization, tags
+from .raw_store import RawMetadataStore, load_raw_metadata
+from .sqlutil import chunked
+
+# 既定の並び順（チェックポイントのキーにも使う）
+DEFAULT_SORT = "Most Reactions"
+
+# 差分収集（incremental）で使う並び順と、打ち切り判定の既知 ID 割合
+INCREMENTAL_SORT = "Newest"
+KNOWN_PAGE_RATIO = 0.8
+
+# 同一ホストに張り続ける keep-alive 接続数
+HTTP_POOL_SIZE = 10
+
+UPSERT_PROMPT_SQL = '''
+INSERT INTO civitai_prompts
+(civitai_id, full_prompt, negative_prompt, quality_score,
+ reaction_count, comment_count, download_count, prompt_length, tag_count,
+ model_name, model_id, collected_at, raw_metadata, content_hash, search_prompt, search_negative)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(civitai_id) DO UPDATE SET
+    full_prompt=excluded.full_prompt,
+    negative_prompt=excluded.negative_prompt,
+    quality_score=excluded.quality_score,
+    reaction_count=excluded.reaction_count,
+    comment_count=excluded.comment_count,
+    download_count=excluded.download_count,
+    prompt_length=excluded.prompt_length,
+    tag_count=excluded.tag_count,
+    model_name=excluded.model_name,
+    model_id=excluded.model_id,
+    collected_at=excluded.collected_at,
+    raw_metadata=excluded.raw_metadata,
+    content_hash=excluded.content_hash,
+    search_prompt=excluded.search_prompt,
+    search_negative=excluded.search_negative
+'''
+
+INSERT_CATEGORY_SQL = '''
+INSERT INTO prompt_categories (prompt_id, category, keywords, confidence)
+VALUES (?, ?, ?, ?)
+'''
+
+
+# カテゴリ定義（必要に応じて語彙を追加してください）
+V8_CATEGORIES = {
+    "realism_quality": ["realistic skin", "intricate details", "ultra-detailed", "photorealistic"],
+    "lighting": ["cinematic lighting", "dynamic lighting", "soft lighting", "studio lighting", "dramatic lighting", "golden hour", "backlight", "rim light"],
+    "composition": ["portrait", "full body", "close-up", "upper body", "headshot", "wide shot", "rule of thirds"],
+    "character_features": ["detailed face", "expressive eyes", "facial features", "beautiful", "hands detail"],
+    "technical": ["highres", "masterpiece", "best quality", "high resolution", "8k", "ultra high res"],
+    "texture": ["skin texture", "hair detail", "fabric detail", "detailed texture", "rough texture"],
+    "style": ["anime", "manga", "3d render", "oil painting", "watercolor", "digital art", "photorealism", "realistic"],
+    "mood": ["melancholic", "cheerful", "mysterious", "elegant", "energetic", "moody", "dark"],
+    "nsfw_safe": ["clothed", "sfw", "dress", "casual wear", "fully clothed", "covered"],
+    "nsfw_suggestive": ["cleavage", "revealing clothing", "tight clothing", "suggestive pose", "see-through"],
+    "nsfw_mature": ["lingerie", "underwear", "bikini", "swimsuit", "partial nudity", "braless"],
+    "nsfw_explicit": ["nude", "naked", "nsfw", "explicit", "uncensored", "full nudity"]
+}
+
+
+class V8Categorizer:
+    """v8 のカテゴリ辞書によるキーワード分類器。DB や HTTP に依存しないのでプロセスプールでも使える"""
+
+    def __init__(self, categories=None):
+        self.categories = categories if categories is not None else V8_CATEGORIES
+        # 単純化のため、キーワードマッチングは小文字で比較する
+        self._matcher = KeywordMatcher(self.categories)
+        # prompt_categories.keywords には従来どおり re.escape 済みの語を保存する（既存データと互換）
+        self._keyword_labels = {
+            kw.lower(): re.escape(kw.lower()) for keywords in self.categories.values() for kw in keywords
+        }
+
+    def categorize(self, prompt_text):
+        """返却: {category: {keywords: [...], confidence: float}}"""
+        categories_found = {}
+        text = (prompt_text or "").lower()
+
+        # 全カテゴリのキーワードを 1 回の走査で照合する
+        for category, hits in self._matcher.match(text).items():
+            found = [self._keyword_labels[kw] for kw in hits]
+            # 簡易 confidence = マッチ語数 / 定義語数
+            confidence = float(len(found)) / max(1, len(self.categories.get(category, [])))
+            categories_found[category] = {"keywords": found, "confidence": confidence}
+
+        # NSFW 系が一切見つからなければ safe と仮定
+        if not any(k.startswith("nsfw_") for k in categories_found.keys()):
+            categories_found.setdefault("nsfw_safe", {"keywords": ["default_safe"], "confidence": 0.5})
+
+        return categories_found
+
+    def category_rows(self, prompt_id, prompt_text):
+        """prompt_categories へ挿入する行タプルのリスト"""
+        return [
+            (prompt_id, category, serialization.dumps(data["keywords"]), data["confidence"])
+            for category, data in self.categorize(prompt_text).items()
+        ]
+
+
 class CivitaiPromptCollector:
-    def __init__(self, db_path="civitai_dataset.db", user_agent=None):
+    def __init__(self, db_path="civitai_dataset.db", user_agent=None, raw_storage="compressed"):
         self.base_url = "https://civitai.com/api/v1/images"
         self.db_path = db_path
         self.user_agent = user_agent or "CivitaiPromptCollector/1.0 (+https://example.com)"
+        # 書き込み用の長寿命接続（_get_conn で遅延生成、close で解放）
+        self._conn = None
+        # raw_metadata の保存先: "compressed"（prompt_raw に圧縮）/ "inline"（従来どおり civitai_prompts の列）
+        if raw_storage not in ("compressed", "inline"):
+            raise ValueError(f"unknown raw_storage: {raw_storage}")
+        self.raw_storage = raw_storage
+        self._raw_store = None
         self.setup_database()
 
-        # カテゴリ定義（必要に応じて語彙を追加してください）
-        self.categories = {
-            "realism_quality": ["realistic skin", "intricate details", "ultra-detailed", "photorealistic"],
-            "lighting": ["cinematic lighting", "dynamic lighting", "soft lighting", "studio lighting", "dramatic lighting", "golden hour", "backlight", "rim light"],
-            "composition": ["portrait", "full body", "close-up", "upper body", "headshot", "wide shot", "rule of thirds"],
-            "character_features": ["detailed face", "expressive eyes", "facial features", "beautiful", "hands detail"],
-            "technical": ["highres", "masterpiece", "best quality", "high resolution", "8k", "ultra high res"],
-            "texture": ["skin texture", "hair detail", "fabric detail", "detailed texture", "rough texture"],
-            "style": ["anime", "manga", "3d render", "oil painting", "watercolor", "digital art", "photorealism", "realistic"],
-            "mood": ["melancholic", "cheerful", "mysterious", "elegant", "energetic", "moody", "dark"],
-            "nsfw_safe": ["clothed", "sfw", "dress", "casual wear", "fully clothed", "covered"],
-            "nsfw_suggestive": ["cleavage", "revealing clothing", "tight clothing", "suggestive pose", "see-through"],
-            "nsfw_mature": ["lingerie", "underwear", "bikini", "swimsuit", "partial nudity", "braless"],
-            "nsfw_explicit": ["nude", "naked", "nsfw", "explicit", "uncensored", "full nudity"]
-        }
+        # HTTP は keep-alive のセッションを使い回し、ヘッダーも構築時に 1 回だけ作る
+        self.headers = self._build_headers()
+        self.session = self._create_session()
+        # fetch_batch（同期・非同期エンジンとも）が共有するレートリミッター
+        self.rate_limiter = AdaptiveRateLimiter()
+
+        # カテゴリ定義（語彙の追加は V8_CATEGORIES へ。インスタンスごとに変更してもよい）
+        self.categories = {cat: list(kws) for cat, kws in V8_CATEGORIES.items()}
 
         # 単純化のため、キーワードマッチングは小文字で比較する
         self._prepare_keyword_patterns()
 
     def _prepare_keyword_patterns(self):
-        """キーワードリストから正規表現パターンを作る（語順や小文字化に強くする）"""
-        self.category_patterns = {}
-        for cat, keywords in self.categories.items():
-            # escape each keyword, match word boundaries when appropriate
-            patterns = []
-            for kw in keywords:
-                kw_escaped = re.escape(kw.lower())
-                # allow matching inside prompt text (simple contains); use word boundaries for single-word tokens
-                patterns.append(re.compile(kw_escaped))
-            self.category_patterns[cat] = patterns
+        """カテゴリ辞書から単一パスの分類器を作る（categories を変更したら再実行）"""
+        self._categorizer = V8Categorizer(self.categories)
+
+    def _get_conn(self):
+        """長寿命の SQLite 接続を返す（初回呼び出し時に接続し、WAL などの PRAGMA を適用）"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path)
+            schema.apply_pragmas(self._conn)
+        return self._conn
+
+    def close(self):
+        """保持している DB 接続と HTTP セッションを閉じる"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if getattr(self, "session", None) is not None:
+            self.session.close()
 
     def setup_database(self):
         """SQLite データベースとテーブルを作成"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._get_conn()
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -76,9 +186,12 @@ class CivitaiPromptCollector:
             model_name TEXT,
             model_id TEXT,
             collected_at TIMESTAMP,
-            raw_metadata TEXT
+            raw_metadata TEXT,
+            content_hash TEXT
         )
         ''')
+        # 既存 DB には content_hash / group_id 列が無いので追加する
+        schema.ensure_columns(conn)
 
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS prompt_categories (
@@ -91,15 +204,40 @@ class CivitaiPromptCollector:
         )
         ''')
 
+        # (model_id, sort) ごとの再開用カーソル。バッチ保存と同じトランザクションで更新する
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS collection_checkpoints (
+            model_id TEXT NOT NULL,
+            sort TEXT NOT NULL,
+            next_page TEXT,
+            total_collected INTEGER,
+            updated_at TIMESTAMP,
+            PRIMARY KEY (model_id, sort)
+        )
+        ''')
+
+        dedup.create_tables(conn)
+        tags.create_tables(conn)
         conn.commit()
-        conn.close()
+        search.create_fts(conn)
+        if self.raw_storage == "compressed":
+            self._raw_store = RawMetadataStore(conn)
+            conn.commit()
+        # 索引など後から足したものは user_version で管理し、既存 DB にも未適用分だけ流す
+        schema.migrate(conn)
 
-    def fetch_batch(self, url_or_params, max_retries=3):
-        """APIから1ページ分を取得（nextPage/cursor対応、リトライ付き）"""
+    def optimize_database(self):
+        """大量に書き込んだ後にプランナの統計を更新する（collect_for_models の最後に呼ばれる）"""
+        schema.optimize(self._get_conn())
+
+    def _build_headers(self):
+        """リクエストヘッダーを構築（API キー付与・Latin-1 安全化）"""
         headers = {
             "User-Agent": self.user_agent,
             "Accept": "application/json",
         }
+        # gzip/deflate に加え、brotli（/zstd）が入っていれば urllib3 が自動で追加する
+        headers["Accept-Encoding"] = make_headers(accept_encoding=True)["accept-encoding"]
         from .config import CIVITAI_API_ENV  # type: ignore
         api_key = os.getenv(CIVITAI_API_ENV)
         if api_key:
@@ -120,32 +258,56 @@ class CivitaiPromptCollector:
         if unsafe:
             print(f"[fetch_batch] sanitized headers with non-latin1 characters: {unsafe}")
         # --- 追加終了 ---
+        return headers
+
+    def _create_session(self, pool_size=HTTP_POOL_SIZE):
+        """コネクションプール付きの requests.Session を作る（リトライは fetch_batch 側で制御）"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(self.headers)
+        return session
 
+    def fetch_batch(self, url_or_params, max_retries=3):
+        """APIから1ページ分を取得（nextPage/cursor対応、リトライ付き）"""
+        items, next_page, _ok = self.fetch_page(url_or_params, max_retries=max_retries)
+        return items, next_page
+
+    def fetch_page(self, url_or_params, max_retries=3):
+        """fetch_batch と同じだが、取得失敗かどうかを第3要素で返す: (items, next_page, ok)"""
         for attempt in range(1, max_retries + 1):
+            # 送信ペースは共有のレートリミッターが決める（バックオフ中はここで待つ）
+            self.rate_limiter.acquire()
             try:
                 if isinstance(url_or_params, dict):
-                    response = requests.get(self.base_url, params=url_or_params, headers=headers, timeout=(5, 100))
+                    response = self.session.get(self.base_url, params=url_or_params, timeout=(5, 100))
                 else:
-                    response = requests.get(url_or_params, headers=headers, timeout=(5, 100))
+                    response = self.session.get(url_or_params, timeout=(5, 100))
+                self.rate_limiter.on_response(response.status_code, response.headers)
                 if response.status_code == 200:
-                    data = response.json()
-                    items = data.get("items", [])
-                    next_page = data.get("metadata", {}).get("nextPage")
-                    return items, next_page
-                elif response.status_code == 429:
-                    wait = 60
-                    print(f"[fetch_batch] 429 Rate limited. Waiting {wait} seconds... (attempt {attempt}/{max_retries})")
-                    time.sleep(wait)
+                    # 本文の bytes を直接デコードする（msgspec なら item ごとの元 bytes も保持）
+                    try:
+                        items, metadata = serialization.decode_page(response.content)
+                    except serialization.DECODE_ERRORS as e:
+                        # 200 でも HTML のエラーページや途中で切れた本文が返ることがあるので再試行する
+                        wait = self.rate_limiter.backoff(attempt)
+                        print(f"[fetch_batch] Invalid JSON body: {e} (retry in {wait:.1f} seconds)")
+                        continue
+                    return items, metadata.get("nextPage"), True
+                elif response.status_code == 429 or response.status_code >= 500:
+                    wait = self.rate_limiter.backoff(attempt, response.headers)
+                    print(f"[fetch_batch] HTTP {response.status_code}. Backing off {wait:.1f} seconds... (attempt {attempt}/{max_retries})")
                     continue
                 else:
                     print(f"[fetch_batch] HTTP {response.status_code}: {response.text[:200]}")
-                    return [], None
+                    return [], None, False
             except requests.exceptions.RequestException as e:
-                print(f"[fetch_batch] Attempt {attempt} failed: {e}")
-                time.sleep(3 * attempt)
+                wait = self.rate_limiter.backoff(attempt)
+                print(f"[fetch_batch] Attempt {attempt} failed: {e} (retry in {wait:.1f} seconds)")
                 continue
         print("[fetch_batch] All retries failed for:", url_or_params)
-        return [], None
+        return [], None, False
 
     def extract_prompt_data(self, item):
         """API レスポンス項目から必要フィールドを抜き出す"""
@@ -165,19 +327,40 @@ class CivitaiPromptCollector:
                 "download_count": stats.get("downloadCount", 0),
                 "model_name": meta.get("Model") or meta.get("model") or item.get("model") or "",
                 "model_id": str(item.get("modelId") or meta.get("ModelId") or ""),
-                "raw_metadata": json.dumps(item, ensure_ascii=False)
+                # UTF-8 の JSON バイト列。レスポンスの元 bytes があれば再エンコードしない
+                "raw_metadata": serialization.item_bytes(item)
             }
 
             prompt_text = prompt_data["full_prompt"] or ""
             prompt_data["prompt_length"] = len(prompt_text)
             prompt_data["tag_count"] = len([t for t in [s.strip() for s in prompt_text.split(",")] if t])
             prompt_data["quality_score"] = self.calculate_quality_score(prompt_text, stats)
+            prompt_data["content_hash"] = self.content_hash(full_prompt, negative_prompt)
+            prompt_data["minhash"] = dedup.minhash_signature(full_prompt)
+            prompt_data["tags"] = tags.parse_tags(full_prompt)
+            # 全文検索はこの正規化済みテキストを索引する（search.search_text と同じ）
+            prompt_data["search_prompt"] = ", ".join(prompt_data["tags"])
+            prompt_data["search_negative"] = search.search_text(negative_prompt)
 
             return prompt_data
         except Exception as e:
             print("[extract_prompt_data] Error:", e)
             return None
 
+    @staticmethod
+    def _raw_text(raw):
+        """inline 保存用に raw_metadata を TEXT にする"""
+        return raw.decode("utf-8") if isinstance(raw, bytes) else raw
+
+    @staticmethod
+    def content_hash(full_prompt, negative_prompt):
+        """プロンプト本文の変更検知用ハッシュ（差分収集で UPSERT を省くのに使う）"""
+        h = hashlib.sha1()
+        h.update((full_prompt or "").encode("utf-8"))
+        h.update(b"\x1f")
+        h.update((negative_prompt or "").encode("utf-8"))
+        return h.hexdigest()
+
     def calculate_quality_score(self, prompt, stats):
         """シンプルな品質スコア計算（キーワード＋リアクション）"""
         score = 0
@@ -200,174 +383,302 @@ class CivitaiPromptCollector:
 
     def categorize_prompt(self, prompt_text):
         """キーワードマッチベースのカテゴリ分け。返却: {category: {keywords: [...], confidence: float}}"""
-        categories_found = {}
-        text = (prompt_text or "").lower()
-
-        # キーワードのパターンでマッチを探す
-        for category, patterns in self.category_patterns.items():
-            found = []
-            for pat in patterns:
-                if pat.search(text):
-                    # マッチした語句を取り出（pattern.pattern から人間用に加工）
-                    found.append(pat.pattern)
-            if found:
-                # 簡易 confidence = マッチ語数 / 定義語数
-                confidence = float(len(found)) / max(1, len(self.categories.get(category, [])))
-                categories_found[category] = {"keywords": found, "confidence": confidence}
-
-        # NSFW 系が一切見つからなければ safe と仮定
-        if not any(k.startswith("nsfw_") for k in categories_found.keys()):
-            categories_found.setdefault("nsfw_safe", {"keywords": ["default_safe"], "confidence": 0.5})
-
-        return categories_found
+        return self._categorizer.categorize(prompt_text)
 
     def save_prompt_data(self, prompt_data):
-        """DB に保存。既存の civitai_id があれば更新して prompt_id を返す"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """DB に 1 件保存（save_prompt_batch の単件ラッパー）。成功時 True"""
+        return self.save_prompt_batch([prompt_data])["saved"] > 0
+
+    def _lookup_prompt_ids(self, conn, civitai_ids, column="id"):
+        """civitai_id -> civitai_prompts.<column>（既定は id）の対応を IN 句でまとめて引く"""
+        ids = {}
+        for chunk in chunked(list(civitai_ids)):
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT civitai_id, {column} FROM civitai_prompts WHERE civitai_id IN ({placeholders})", chunk
+            ).fetchall()
+            ids.update(rows)
+        return ids
+
+    def load_known_ids(self, model_id=None):
+        """保存済み civitai_id の集合（model_id 指定時はそのモデル分のみ）"""
+        conn = self._get_conn()
+        if model_id:
+            cur = conn.execute("SELECT civitai_id FROM civitai_prompts WHERE model_id = ?", (str(model_id),))
+        else:
+            cur = conn.execute("SELECT civitai_id FROM civitai_prompts")
+        return {r[0] for r in cur}
+
+    @staticmethod
+    def known_ratio(batch, known_ids):
+        """ページ内で既に保存済みの項目の割合"""
+        if not batch:
+            return 0.0
+        return sum(1 for it in batch if str(it.get("id", "")) in known_ids) / len(batch)
+
+    def save_prompt_batch(self, prompt_datas, checkpoint=None, skip_unchanged=False):
+        """extract_prompt_data の結果をまとめて 1 トランザクションで保存する。
+        civitai_prompts は executemany で UPSERT、prompt_categories は削除→一括挿入。
+        checkpoint（{"model_id", "sort", "next_page", "collected"}）を渡すと同じトランザクションで記録する。
+        skip_unchanged=True のとき content_hash が保存済みと同じ行は UPSERT/再分類しない。
+        返却: {"saved": 件数, "skipped": 件数, "elapsed": 秒, "rows_per_sec": 件/秒}
+        """
+        # 同一バッチ内で civitai_id が重複した場合は後勝ち
+        by_id = {}
+        for pd in prompt_datas:
+            if pd:
+                by_id[pd["civitai_id"]] = pd
+        if not by_id and checkpoint is None:
+            return {"saved": 0, "skipped": 0, "elapsed": 0.0, "rows_per_sec": 0.0}
+
+        start = time.perf_counter()
+        now = datetime.now().isoformat()
+        conn = self._get_conn()
+        ids = {}
+        skipped = 0
         try:
-            # UPSERT 相当の処理: 既存なら更新、存在しなければ挿入
-            cursor.execute('''
-            INSERT INTO civitai_prompts
-            (civitai_id, full_prompt, negative_prompt, quality_score,
-             reaction_count, comment_count, download_count, prompt_length, tag_count,
-             model_name, model_id, collected_at, raw_metadata)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(civitai_id) DO UPDATE SET
-                full_prompt=excluded.full_prompt,
-                negative_prompt=excluded.negative_prompt,
-                quality_score=excluded.quality_score,
-                reaction_count=excluded.reaction_count,
-                comment_count=excluded.comment_count,
-                download_count=excluded.download_count,
-                prompt_length=excluded.prompt_length,
-                tag_count=excluded.tag_count,
-                model_name=excluded.model_name,
-                model_id=excluded.model_id,
-                collected_at=excluded.collected_at,
-                raw_metadata=excluded.raw_metadata
-            ''', (
-                prompt_data["civitai_id"],
-                prompt_data["full_prompt"],
-                prompt_data["negative_prompt"],
-                prompt_data["quality_score"],
-                prompt_data["reaction_count"],
-                prompt_data["comment_count"],
-                prompt_data["download_count"],
-                prompt_data["prompt_length"],
-                prompt_data["tag_count"],
-                prompt_data["model_name"],
-                prompt_data["model_id"],
-                datetime.now().isoformat(),
-                prompt_data["raw_metadata"]
-            ))
-            conn.commit()
-
-            # prompt_id を取得
-            cursor.execute('SELECT id FROM civitai_prompts WHERE civitai_id = ?', (prompt_data["civitai_id"],))
-            row = cursor.fetchone()
-            prompt_id = row[0] if row else None
-
-            # 既存のカテゴリを一旦削除してから新規挿入（重複防止）
-            if prompt_id:
-                cursor.execute('DELETE FROM prompt_categories WHERE prompt_id = ?', (prompt_id,))
-                categories = self.categorize_prompt(prompt_data["full_prompt"])
-                for category, data in categories.items():
-                    cursor.execute('''
-                    INSERT INTO prompt_categories (prompt_id, category, keywords, confidence)
-                    VALUES (?, ?, ?, ?)
-                    ''', (
-                        prompt_id,
-                        category,
-                        json.dumps(data["keywords"], ensure_ascii=False),
-                        data["confidence"]
-                    ))
-                conn.commit()
-            return True
-        except Exception as e:
-            print("[save_prompt_data] Database error:", e)
-            return False
-        finally:
-            conn.close()
-
-    def collect_dataset(self, model_id=None, model_name=None, max_items=5000):
+            with conn:
+                if checkpoint is not None:
+                    self._write_checkpoint(conn, checkpoint, now)
+                if skip_unchanged and by_id:
+                    stored = self._lookup_prompt_ids(conn, by_id.keys(), column="content_hash")
+                    for civitai_id in [cid for cid, pd in by_id.items() if stored.get(cid) == pd.get("content_hash")]:
+                        del by_id[civitai_id]
+                        skipped += 1
+                conn.executemany(UPSERT_PROMPT_SQL, [
+                    (
+                        pd["civitai_id"],
+                        pd["full_prompt"],
+                        pd["negative_prompt"],
+                        pd["quality_score"],
+                        pd["reaction_count"],
+                        pd["comment_count"],
+                        pd["download_count"],
+                        pd["prompt_length"],
+                        pd["tag_count"],
+                        pd["model_name"],
+                        pd["model_id"],
+                        now,
+                        None if self._raw_store is not None else self._raw_text(pd["raw_metadata"]),
+                        pd.get("content_hash"),
+                        pd["search_prompt"] if "search_prompt" in pd else search.search_text(pd["full_prompt"]),
+                        pd["search_negative"] if "search_negative" in pd else search.search_text(pd["negative_prompt"]),
+                    )
+                    for pd in by_id.values()
+                ])
+
+                ids = self._lookup_prompt_ids(conn, by_id.keys())
+                # 既存のカテゴリを一旦削除してから新規挿入（重複防止）
+                conn.executemany(
+                    "DELETE FROM prompt_categories WHERE prompt_id = ?",
+                    [(pid,) for pid in ids.values()],
+                )
+                category_rows = []
+                for civitai_id, pd in by_id.items():
+                    prompt_id = ids.get(civitai_id)
+                    if prompt_id:
+                        category_rows.extend(self._categorizer.category_rows(prompt_id, pd["full_prompt"]))
+                conn.executemany(INSERT_CATEGORY_SQL, category_rows)
+                if self._raw_store is not None:
+                    self._raw_store.put_many([(ids[cid], pd["raw_metadata"]) for cid, pd in by_id.items() if cid in ids])
+                tags.store_prompt_tags(conn, [
+                    (ids[cid], pd["model_id"], pd["tags"] if "tags" in pd else tags.parse_tags(pd["full_prompt"]))
+                    for cid, pd in by_id.items() if cid in ids
+                ])
+
+                # ほぼ同じプロンプトを代表行にまとめる
+                groups = dedup.link_groups(conn, [
+                    (ids[cid], pd.get("minhash")) for cid, pd in by_id.items() if cid in ids
+                ])
+                conn.executemany(
+                    "UPDATE civitai_prompts SET group_id = ? WHERE id = ?",
+                    [(gid, pid) for pid, gid in groups.items()],
+                )
+        except sqlite3.Error as e:
+            print("[save_prompt_batch] Database error:", e)
+            return {"saved": 0, "skipped": 0, "elapsed": time.perf_counter() - start, "rows_per_sec": 0.0}
+
+        elapsed = time.perf_counter() - start
+        saved = len(ids)
+        return {"saved": saved, "skipped": skipped, "elapsed": elapsed,
+                "rows_per_sec": saved / elapsed if elapsed > 0 else float(saved)}
+
+    def _write_checkpoint(self, conn, checkpoint, now):
+        conn.execute('''
+        INSERT INTO collection_checkpoints (model_id, sort, next_page, total_collected, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(model_id, sort) DO UPDATE SET
+            next_page=excluded.next_page,
+            total_collected=excluded.total_collected,
+            updated_at=excluded.updated_at
+        ''', (str(checkpoint.get("model_id") or ""), checkpoint["sort"], checkpoint.get("next_page"),
+              checkpoint.get("collected", 0), now))
+
+    def get_raw_metadata(self, civitai_id):
+        """保存した API 項目（dict）を読み出す。圧縮保存分はここで初めて展開する"""
+        ids = self._lookup_prompt_ids(self._get_conn(), [str(civitai_id)])
+        if not ids:
+            return None
+        return load_raw_metadata(self._get_conn(), ids[str(civitai_id)], store=self._raw_store)
+
+    def search_prompts(self, query, limit=20, model_id=None, column=None, raw=False):
+        """full_prompt / negative_prompt の全文検索（search.search_prompts 参照）"""
+        return search.search_prompts(self._get_conn(), query, limit=limit, model_id=model_id, column=column, raw=raw)
+
+    def load_checkpoint(self, model_id, sort=DEFAULT_SORT):
+        """保存済みカーソルを返す。無ければ None: {"next_page": str, "collected": int}"""
+        row = self._get_conn().execute(
+            "SELECT next_page, total_collected FROM collection_checkpoints WHERE model_id = ? AND sort = ?",
+            (str(model_id or ""), sort),
+        ).fetchone()
+        if not row or not row[0]:
+            return None
+        return {"next_page": row[0], "collected": row[1] or 0}
+
+    def clear_checkpoint(self, model_id, sort=DEFAULT_SORT):
+        """最後まで収集できたらカーソルを消して次回は先頭から取り直す"""
+        conn = self._get_conn()
+        with conn:
+            conn.execute("DELETE FROM collection_checkpoints WHERE model_id = ? AND sort = ?",
+                         (str(model_id or ""), sort))
+
+    def prepare_page(self, batch, model_id=None, model_name=None, limit=None):
+        """1ページ分の API 項目を保存用の prompt_data に変換する。
+        limit 件まで消費し、(保存対象リスト, 消費件数) を返す
+        """
+        rows = []
+        items = batch if limit is None else batch[:max(0, limit)]
+        for item in items:
+            prompt_data = self.extract_prompt_data(item)
+            if prompt_data:
+                if model_name and not prompt_data.get("model_name"):
+                    prompt_data["model_name"] = model_name
+                if model_id and not prompt_data.get("model_id"):
+                    prompt_data["model_id"] = str(model_id)
+                if prompt_data.get("full_prompt"):
+                    rows.append(prompt_data)
+        return rows, len(items)
+
+    def collect_dataset(self, model_id=None, model_name=None, max_items=5000, pages_per_commit=1, resume=True,
+                        incremental=False):
         """1モデル分（もしくは全体）の収集。model_id を None にすると modelId フィルタ無しで取得
         nextPage/cursorベースでページング対応
+        pages_per_commit ページ分をまとめて save_prompt_batch で 1 トランザクション保存する
+        resume=True のとき前回中断時のチェックポイント（nextPage）から再開する
+        incremental=True のときは新しい順に取得し、既知 ID が大半のページに達したら打ち切る
+        （本文ハッシュが変わっていない行は UPSERT しない）
         """
         print(f"\n=== Collecting: {model_name or 'ALL_MODELS'} (model_id={model_id}) ===")
         collected = 0
         saved = 0
-        params = {"limit": 20, "sort": "Most Reactions"}
+        pending = []
+        pending_pages = 0
+        write_elapsed = 0.0
+        params = {"limit": 20, "sort": INCREMENTAL_SORT if incremental else DEFAULT_SORT}
+        next_page_url = None
+        known_ids = None
+        if incremental:
+            # 差分収集は毎回最新から辿るのでカーソル再開はしない
+            resume = False
+            known_ids = self.load_known_ids(model_id)
+            print(f"[collect_dataset] Incremental mode: {len(known_ids)} known ids")
+
+        def flush():
+            nonlocal saved, write_elapsed, pending, pending_pages
+            checkpoint = {"model_id": model_id, "sort": params["sort"], "next_page": next_page_url, "collected": collected}
+            res = self.save_prompt_batch(pending, checkpoint=checkpoint, skip_unchanged=incremental)
+            saved += res["saved"]
+            write_elapsed += res["elapsed"]
+            print(f"[collect_dataset] Wrote {res['saved']} rows ({res['rows_per_sec']:.0f} rows/sec)")
+            pending = []
+            pending_pages = 0
+
         # デバッグ: APIパラメータ
         print(f"[collect_dataset] API params: {params}")
         if model_id:
             params["modelVersionId"] = model_id
             print(f"[collect_dataset] modelVersionId set: {model_id}")
 
-        next_page_url = None
+        if resume:
+            checkpoint = self.load_checkpoint(model_id, params["sort"])
+            if checkpoint:
+                next_page_url = checkpoint["next_page"]
+                collected = checkpoint["collected"]
+                print(f"[collect_dataset] Resuming from checkpoint (collected: {collected}/{max_items})")
+
         page_count = 1
+        finished = collected >= max_items
         while collected < max_items:
             if next_page_url:
                 print(f"[collect_dataset] Fetching nextPage (collected: {collected}/{max_items})")
-                batch, next_page_url = self.fetch_batch(next_page_url)
+                batch, fetched_next, ok = self.fetch_page(next_page_url)
             else:
                 print(f"[collect_dataset] Fetching page {page_count} (collected: {collected}/{max_items})")
-                batch, next_page_url = self.fetch_batch(params)
+                batch, fetched_next, ok = self.fetch_page(params)
             # デバッグ: APIレスポンス件数
             print(f"[collect_dataset] API batch items: {len(batch)}")
             if not batch:
+                # 取得失敗ならカーソルは進めずにチェックポイントを残し、次回このページから再開する
+                finished = ok
                 print("[collect_dataset] No more items returned by API for this page/params.")
                 break
-            for item in batch:
-                if collected >= max_items:
-                    break
-                prompt_data = self.extract_prompt_data(item)
-                if prompt_data:
-                    if model_name and not prompt_data.get("model_name"):
-                        prompt_data["model_name"] = model_name
-                    if model_id and not prompt_data.get("model_id"):
-                        prompt_data["model_id"] = str(model_id)
-                    if prompt_data.get("full_prompt"):
-                        ok = self.save_prompt_data(prompt_data)
-                        if ok:
-                            saved += 1
-                collected += 1
+            next_page_url = fetched_next
+            rows, consumed = self.prepare_page(batch, model_id, model_name, max_items - collected)
+            pending.extend(rows)
+            collected += consumed
             page_count += 1
-            time.sleep(1.2)
-            if not next_page_url:
+            pending_pages += 1
+            if pending_pages >= pages_per_commit:
+                flush()
+            if not next_page_url or collected >= max_items:
+                finished = True
                 break
-        print(f"[collect_dataset] Completed: saved {saved}/{collected} items for model '{model_name or model_id}'")
+            if known_ids is not None:
+                ratio = self.known_ratio(batch[:consumed], known_ids)
+                if ratio >= KNOWN_PAGE_RATIO:
+                    print(f"[collect_dataset] Reached already-collected items ({ratio:.0%} known). Stopping.")
+                    finished = True
+                    break
+        if pending:
+            flush()
+        if finished:
+            self.clear_checkpoint(model_id, params["sort"])
+        rate = saved / write_elapsed if write_elapsed > 0 else 0.0
+        print(f"[collect_dataset] Completed: saved {saved}/{collected} items for model '{model_name or model_id}' (DB write {rate:.0f} rows/sec)")
         return {"collected": collected, "saved": saved}
 
-    def collect_for_models(self, models: dict, max_per_model=5000):
+    def collect_for_models(self, models: dict, max_per_model=5000, concurrency=1, requests_per_second=None, resume=True,
+                           incremental=False):
         """複数モデルを順に収集するユーティリティ
            models: {"Model Name": "modelId", ...}
+           concurrency > 1 のときは AsyncCollectionEngine で複数モデルを並行収集する
+           requests_per_second は共有レートリミッターの上限（逐次・並行のどちらにも効く）
         """
-        results = {}
-        for name, mid in models.items():
-            res = self.collect_dataset(model_id=mid, model_name=name, max_items=max_per_model)
-            results[name] = res
-            # モデル間に短い待機を入れてAPI負荷を下げる
-            time.sleep(2)
+        if requests_per_second:
+            self.rate_limiter.set_max_rate(requests_per_second)
+        if concurrency and concurrency > 1:
+            from .async_collector import AsyncCollectionEngine
+            engine = AsyncCollectionEngine(self, max_concurrency=concurrency)
+            results = engine.run(models, max_per_model=max_per_model, resume=resume, incremental=incremental)
+        else:
+            results = {}
+            for name, mid in models.items():
+                res = self.collect_dataset(model_id=mid, model_name=name, max_items=max_per_model, resume=resume,
+                                           incremental=incremental)
+                results[name] = res
+        self.optimize_database()
         return results
 
-    def visualize_category_distribution(self, models_to_plot=None, normalize_percent=True, show=True, save_path=None):
+    def visualize_category_distribution(self, models_to_plot=None, normalize_percent=True, show=True, save_path=None,
+                                        unique_prompts=True):
         """
         DB から model_name × category の出現数を集計しスタック棒グラフ表示
         - models_to_plot: None -> DB 内の全モデル。リストを渡すとその順で表示。
         - normalize_percent: True のとき各モデルを 100% 正規化して割合表示
+        - unique_prompts: True のときほぼ同じプロンプトのグループは代表行だけを数える
+        集計は書き込み時に更新される category_counts から読む（全件の JOIN はしない）
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-        SELECT p.model_name, c.category, COUNT(*) as cnt
-        FROM civitai_prompts p
-        JOIN prompt_categories c ON p.id = c.prompt_id
-        GROUP BY p.model_name, c.category
-        ''')
-        rows = cursor.fetchall()
-        conn.close()
+        rows = category_counts.load_counts(self._get_conn(), by="model_name", unique=unique_prompts)
 
         if not rows:
             print("[visualize] No category data found in DB. Run collection first.")
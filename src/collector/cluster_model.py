@@ -0,0 +1,101 @@
+import pickle
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+# 新規分の noise 率・埋め込み平均のずれ（コサイン距離）がこれを超えたら全件で再学習する
+DEFAULT_MAX_NOISE_RATIO = 0.5
+DEFAULT_MAX_DRIFT = 0.15
+
+
+def default_model_path(db_path: str) -> str:
+    """DB と同じディレクトリに置くクラスタモデルのパス"""
+    return str(Path(db_path).with_suffix("")) + ".clusters.pkl"
+
+
+def _unit(v: np.ndarray) -> np.ndarray:
+    n = np.linalg.norm(v)
+    return v / n if n else v
+
+
+class ClusterModel:
+    """
+    学習済みの次元削減 + クラスタリング一式（UMAP reducer、prediction_data 付き HDBSCAN、クラスタ重心）。
+    全件で fit した後は assign で新規プロンプトだけにラベルを付け、
+    needs_refit が True になったら全件で作り直す。
+    """
+
+    def __init__(self, reducer, clusterer, centroids: Dict[int, np.ndarray], embedding_mean: np.ndarray,
+                 noise_ratio: float, n_fit: int, labels: Optional[np.ndarray] = None,
+                 max_noise_ratio: float = DEFAULT_MAX_NOISE_RATIO, max_drift: float = DEFAULT_MAX_DRIFT):
+        self.reducer = reducer
+        self.clusterer = clusterer
+        self.centroids = centroids
+        self.embedding_mean = embedding_mean
+        self.noise_ratio = noise_ratio
+        self.n_fit = n_fit
+        self.labels_ = labels
+        self.max_noise_ratio = max_noise_ratio
+        self.max_drift = max_drift
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray, min_cluster_size: int = 5, umap_n_neighbors: int = 15,
+            umap_n_components: int = 5, **kwargs) -> "ClusterModel":
+        from .categorizer import reduce_and_cluster
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        labels, low, reducer, clusterer = reduce_and_cluster(
+            embeddings, min_cluster_size=min_cluster_size, umap_n_neighbors=umap_n_neighbors,
+            umap_n_components=umap_n_components, prediction_data=True,
+        )
+        labels = np.asarray(labels)
+        centroids = {int(l): low[labels == l].mean(axis=0) for l in np.unique(labels) if l != -1}
+        return cls(reducer, clusterer, centroids, embeddings.mean(axis=0),
+                   noise_ratio=float(np.mean(labels == -1)) if len(labels) else 0.0,
+                   n_fit=len(embeddings), labels=labels, **kwargs)
+
+    def _transform(self, embeddings: np.ndarray) -> np.ndarray:
+        return self.reducer.transform(embeddings) if self.reducer is not None else embeddings
+
+    def assign(self, embeddings: np.ndarray) -> np.ndarray:
+        """学習済みモデルで新規埋め込みにラベルを付ける（再学習はしない）"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if not len(embeddings):
+            return np.zeros(0, dtype=int)
+        low = self._transform(embeddings)
+        if self.clusterer is not None and getattr(self.clusterer, "prediction_data_", None) is not None:
+            import hdbscan
+            labels, _strengths = hdbscan.approximate_predict(self.clusterer, low)
+            return np.asarray(labels)
+        if self.clusterer is not None and hasattr(self.clusterer, "predict"):
+            return np.asarray(self.clusterer.predict(low))
+        if not self.centroids:
+            return np.full(len(low), -1)
+        # フォールバック: 最も近いクラスタ重心
+        keys = np.array(list(self.centroids))
+        cents = np.stack([self.centroids[k] for k in keys])
+        d = ((low[:, None, :] - cents[None, :, :]) ** 2).sum(axis=2)
+        return keys[d.argmin(axis=1)]
+
+    def drift(self, embeddings: np.ndarray) -> float:
+        """学習時と新規分の埋め込み平均のコサイン距離"""
+        if not len(embeddings):
+            return 0.0
+        return float(1.0 - _unit(np.asarray(embeddings).mean(axis=0)) @ _unit(self.embedding_mean))
+
+    def needs_refit(self, labels: np.ndarray, embeddings: np.ndarray) -> bool:
+        labels = np.asarray(labels)
+        noise = float(np.mean(labels == -1)) if len(labels) else 0.0
+        drift = self.drift(embeddings)
+        print(f"[cluster_model] new={len(labels)} noise_ratio={noise:.2f} drift={drift:.3f}")
+        return noise > self.max_noise_ratio or drift > self.max_drift
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path: str) -> "ClusterModel":
+        with open(path, "rb") as f:
+            return pickle.load(f)
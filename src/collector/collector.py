@@ -1,7 +1,7 @@
 import os
 from typing import Dict, Any, Optional
 from . import config
-from .db import init_db, save_prompt
+from .db import init_db, PromptStore
 from .categorizer import categorize_prompt
 
 # 既存の v8 実装があれば取り込む（存在しない場合は代替スタブ）
@@ -27,40 +27,48 @@ class CivitaiPromptCollector:
         else:
             self._v8 = None
 
-    def collect_for_models(self, models: Dict[str, Optional[str]], max_per_model: int = 5000):
+    def collect_for_models(self, models: Dict[str, Optional[str]], max_per_model: int = 5000, concurrency: int = 1,
+                           resume: bool = True, incremental: bool = False):
         """
         v8 の collect_for_models が存在すればそれを優先して実行。
         なければ既存の個別保存フローで処理する。
+        concurrency > 1 で v8 の非同期エンジンによる並行収集を使う。
+        resume=True で前回中断したカーソルから再開する（v8 のみ）。
+        incremental=True で前回以降の新着分だけを収集する（v8 のみ）。
         """
         # v8 による完全実装がある場合はそれを呼び出して終了
         if self._v8 is not None and hasattr(self._v8, "collect_for_models"):
-            return self._v8.collect_for_models(models, max_per_model=max_per_model)
+            return self._v8.collect_for_models(models, max_per_model=max_per_model, concurrency=concurrency,
+                                               resume=resume, incremental=incremental)
 
-        # フォールバック（既存ロジック）
+        # フォールバック（既存ロジック）。接続は 1 本を使い回し、モデルごとに 1 トランザクションで保存する
         results = {}
-        for name, model_id in models.items():
-            items = []
-            if self._v8 is not None:
-                if hasattr(self._v8, "collect_for_model"):
-                    items = self._v8.collect_for_model(model_id, max_items=max_per_model)
-                elif hasattr(self._v8, "collect"):
-                    items = self._v8.collect(model_id, max_items=max_per_model)
-                else:
-                    items = []
-            # items は dict のリストを想定（id, model_id, prompt, created_at）
-            for it in items:
-                categories = categorize_prompt(it.get("prompt", ""))
-                rec = {
-                    "id": it.get("id"),
-                    "model_id": it.get("model_id", model_id),
-                    "prompt": it.get("prompt"),
-                    "categories": ",".join(categories),
-                    "created_at": it.get("created_at"),
-                }
-                save_prompt(self.db_path, rec)
-            results[name] = {"count": len(items)}
+        with PromptStore(self.db_path) as store:
+            for name, model_id in models.items():
+                results[name] = self._collect_fallback(store, model_id, max_per_model)
         return results
 
+    def _collect_fallback(self, store: PromptStore, model_id: Optional[str], max_per_model: int):
+        items = []
+        if self._v8 is not None:
+            if hasattr(self._v8, "collect_for_model"):
+                items = self._v8.collect_for_model(model_id, max_items=max_per_model)
+            elif hasattr(self._v8, "collect"):
+                items = self._v8.collect(model_id, max_items=max_per_model)
+        # items は dict のリストを想定（id, model_id, prompt, created_at）
+        records = []
+        for it in items:
+            categories = categorize_prompt(it.get("prompt", ""))
+            records.append({
+                "id": it.get("id"),
+                "model_id": it.get("model_id", model_id),
+                "prompt": it.get("prompt"),
+                "categories": ",".join(categories),
+                "created_at": it.get("created_at"),
+            })
+        store.save_many(records)
+        return {"count": len(items)}
+
     def visualize_category_distribution(self, *args, **kwargs):
         # visualizer を遅延インポート（循環回避）
         from .visualizer import visualize_category_distribution as viz
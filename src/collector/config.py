@@ -11,6 +11,10 @@ if env_path.exists():
 DB_DEFAULT = "civitai_dataset.db"
 CIVITAI_API_ENV = "CIVITAI_API_KEY"
 
+# 埋め込み計算のバッチサイズと torch のスレッド数（None は torch の既定）
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_NUM_THREADS = int(os.getenv("EMBED_NUM_THREADS", "0")) or None
+
 # 代表語抽出で除外したいドメイン固有ストップワード（必要に応じて編集）
 REPRESENTATIVE_STOPWORDS = [
     "photo", "image", "picture", "portrait", "character", "style",
@@ -1,5 +1,7 @@
 import sqlite3
-from typing import Optional, Dict, Any, Union
+from typing import Optional, Dict, Any, Iterable, Union
+
+from . import category_counts, schema
 
 CREATE_PROMPTS_TABLE = """
 CREATE TABLE IF NOT EXISTS prompts (
@@ -9,39 +11,86 @@ CREATE TABLE IF NOT EXISTS prompts (
     categories TEXT,
     created_at TEXT
 );
+CREATE INDEX IF NOT EXISTS idx_prompts_model_id ON prompts(model_id);
 """
 
+_COLUMNS = ("id", "model_id", "prompt", "categories", "created_at")
+
+
+class PromptStore:
+    """
+    prompts テーブルへの書き込み口。1 本の接続を持ち回り、save_many はバッチごとに 1 トランザクションで保存する。
+    パスを渡すと接続を開いて PRAGMA とスキーマを適用し、close / with の終了で閉じる。
+    既存の接続を渡した場合はそれを使うだけで、閉じない。
+    """
+
+    def __init__(self, target: Union[str, sqlite3.Connection]):
+        if isinstance(target, sqlite3.Connection):
+            self.conn = target
+            self._owns = False
+            return
+        self.conn = sqlite3.connect(target)
+        self._owns = True
+        # パスから開いた接続にだけ適用する（呼び出し側が渡した接続の設定は変えない）
+        schema.apply_pragmas(self.conn)
+        self.conn.executescript(CREATE_PROMPTS_TABLE)
+        self.conn.commit()
+        category_counts.create_simple(self.conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._owns:
+            self.conn.close()
+
+    def save(self, record: Dict[str, Any]):
+        self.save_many([record])
+
+    def save_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        """records を INSERT OR REPLACE する（id が無い行があれば何も書かずに ValueError）。返却: 保存件数"""
+        records = list(records)
+        for record in records:
+            if not record.get("id"):
+                raise ValueError("The 'id' field is required and cannot be None.")
+        if not records:
+            return 0
+
+        with self.conn:
+            cur = self.conn.cursor()
+            # simple_category_counts がある DB では置き換え前後のカテゴリ差分を集計に反映する
+            has_counts = category_counts.has_simple(self.conn)
+            if has_counts:
+                for record in records:
+                    old = cur.execute("SELECT model_id, categories FROM prompts WHERE id = ?", (record["id"],)).fetchone()
+                    category_counts.apply_simple_delta(self.conn, old, (record.get("model_id"), record.get("categories")))
+                    # 同じバッチ内で同じ id が続いても差分がずれないよう 1 行ずつ書く
+                    cur.execute(
+                        "INSERT OR REPLACE INTO prompts (id, model_id, prompt, categories, created_at) VALUES (?, ?, ?, ?, ?)",
+                        tuple(record.get(c) for c in _COLUMNS),
+                    )
+            else:
+                cur.executemany(
+                    "INSERT OR REPLACE INTO prompts (id, model_id, prompt, categories, created_at) VALUES (?, ?, ?, ?, ?)",
+                    [tuple(r.get(c) for c in _COLUMNS) for r in records],
+                )
+        return len(records)
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM prompts").fetchone()[0]
+
+
 def init_db(db_path: str):
-    conn = sqlite3.connect(db_path)
-    conn.execute(CREATE_PROMPTS_TABLE)
-    conn.commit()
-    conn.close()
+    with PromptStore(db_path):
+        pass
 
 def save_prompt(conn: Union[str, sqlite3.Connection], record: Dict[str, Any]):
-    if isinstance(conn, str):
-        conn = sqlite3.connect(conn)
-
-    # Validate input data
-    if not record.get("id"):
-        raise ValueError("The 'id' field is required and cannot be None.")
-
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT OR REPLACE INTO prompts (id, model_id, prompt, categories, created_at) VALUES (?, ?, ?, ?, ?)",
-        (
-            record.get("id"),
-            record.get("model_id"),
-            record.get("prompt"),
-            record.get("categories"),
-            record.get("created_at"),
-        ),
-    )
-    conn.commit()
+    with PromptStore(conn) as store:
+        store.save(record)
 
 def count_prompts(db_path: str) -> int:
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM prompts")
-    n = cur.fetchone()[0]
-    conn.close()
-    return n
+    with PromptStore(db_path) as store:
+        return store.count()
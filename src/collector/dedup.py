@@ -0,0 +1,137 @@
+"""
+ほぼ同じプロンプト（同じテンプレートで一部のタグだけ違うもの）をまとめるための MinHash + LSH。
+
+- シングルはカンマ区切りのタグ（小文字化・空白の圧縮）
+- 署名は 64 個の uint32（256 バイトの BLOB）。LSH は 16 バンド × 4 行で候補を引き、
+  署名の一致率（推定 Jaccard）が閾値以上の既存プロンプトのグループに入れる
+- 署名・バケットは SQLite（prompt_minhash / minhash_buckets）に持つ
+"""
+import hashlib
+import re
+import sqlite3
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .sqlutil import chunked
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+DEFAULT_THRESHOLD = 0.8
+
+_rng = np.random.default_rng(20240601)
+# multiply-shift ハッシュ: (a*x + b) mod 2^64 の上位 32 ビット（a は奇数）
+_PERM_A = _rng.integers(0, np.iinfo(np.uint64).max, size=NUM_PERM, dtype=np.uint64, endpoint=True) | np.uint64(1)
+_PERM_B = _rng.integers(0, np.iinfo(np.uint64).max, size=NUM_PERM, dtype=np.uint64, endpoint=True)
+
+CREATE_DEDUP_TABLES = """
+CREATE TABLE IF NOT EXISTS prompt_minhash (
+    prompt_id INTEGER PRIMARY KEY,
+    group_id INTEGER NOT NULL,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS minhash_buckets (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    prompt_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_minhash_buckets_key ON minhash_buckets(band, bucket);
+CREATE INDEX IF NOT EXISTS idx_minhash_buckets_prompt ON minhash_buckets(prompt_id);
+"""
+
+
+def tag_shingles(text: str) -> Set[str]:
+    return {t for t in (re.sub(r"\s+", " ", s).strip() for s in (text or "").lower().split(",")) if t}
+
+
+def minhash_signature(text: str) -> Optional[bytes]:
+    """タグ集合の MinHash 署名（タグが無ければ None）"""
+    shingles = tag_shingles(text)
+    if not shingles:
+        return None
+    x = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles],
+        dtype=np.uint64,
+    )
+    hv = (_PERM_A[:, None] * x[None, :] + _PERM_B[:, None]) >> np.uint64(32)
+    return hv.min(axis=1).astype(np.uint32).tobytes()
+
+
+def similarity(sig_a: bytes, sig_b: bytes) -> float:
+    """署名の一致率（Jaccard 係数の推定値）"""
+    return float(np.mean(np.frombuffer(sig_a, dtype=np.uint32) == np.frombuffer(sig_b, dtype=np.uint32)))
+
+
+def band_keys(signature: bytes) -> List[Tuple[int, int]]:
+    width = ROWS_PER_BAND * 4
+    return [
+        (band, int.from_bytes(hashlib.blake2b(signature[band * width:(band + 1) * width], digest_size=8).digest(),
+                              "little", signed=True))
+        for band in range(BANDS)
+    ]
+
+
+def create_tables(conn: sqlite3.Connection):
+    conn.executescript(CREATE_DEDUP_TABLES)
+
+
+def bucket_query(n: int) -> str:
+    """1 バンド分のバケット n 個を引く SQL（band の等値 + bucket の IN で idx_minhash_buckets_key を使う）"""
+    return f"SELECT bucket, prompt_id FROM minhash_buckets WHERE band = ? AND bucket IN ({','.join('?' * n)})"
+
+
+def link_groups(conn: sqlite3.Connection, items: Sequence[Tuple[int, Optional[bytes]]],
+                threshold: float = DEFAULT_THRESHOLD) -> Dict[int, int]:
+    """
+    items: [(prompt_id, 署名 or None), ...] を LSH に登録し、各 prompt_id の group_id（代表プロンプトの id）を返す。
+    既存プロンプトと推定 Jaccard が threshold 以上なら最も近いもののグループに、無ければ自分が代表になる。
+    同じバッチ内の重複も先に出たものへまとめる。呼び出し側のトランザクション内で実行する想定。
+    """
+    pids = [pid for pid, _ in items]
+    # 再保存された行は古いバケットを外してから登録し直す
+    conn.executemany("DELETE FROM minhash_buckets WHERE prompt_id = ?", [(pid,) for pid in pids])
+
+    keys = {pid: band_keys(sig) for pid, sig in items if sig is not None}
+    buckets: Dict[Tuple[int, int], List[int]] = {}
+    wanted: Dict[int, Set[int]] = {}
+    for ks in keys.values():
+        for band, bucket in ks:
+            wanted.setdefault(band, set()).add(bucket)
+    for band, band_buckets in sorted(wanted.items()):
+        for chunk in chunked(sorted(band_buckets)):
+            for bucket, pid in conn.execute(bucket_query(len(chunk)), [band, *chunk]):
+                buckets.setdefault((band, bucket), []).append(pid)
+
+    known: Dict[int, Tuple[bytes, int]] = {}
+    cand_ids = sorted({pid for ps in buckets.values() for pid in ps})
+    for chunk in chunked(cand_ids):
+        rows = conn.execute(
+            f"SELECT prompt_id, signature, group_id FROM prompt_minhash WHERE prompt_id IN ({','.join('?' * len(chunk))})",
+            list(chunk),
+        ).fetchall()
+        known.update((pid, (sig, gid)) for pid, sig, gid in rows)
+
+    groups: Dict[int, int] = {}
+    for pid, sig in items:
+        group = pid
+        if sig is not None:
+            best = threshold
+            for cand in sorted({c for k in keys[pid] for c in buckets.get(k, ()) if c != pid and c in known}):
+                score = similarity(sig, known[cand][0])
+                if score > best or (score == best and group == pid):
+                    best, group = score, known[cand][1]
+            known[pid] = (sig, group)
+            for k in keys[pid]:
+                buckets.setdefault(k, []).append(pid)
+        groups[pid] = group
+
+    conn.executemany(
+        "INSERT OR REPLACE INTO prompt_minhash (prompt_id, group_id, signature) VALUES (?, ?, ?)",
+        [(pid, groups[pid], sig) for pid, sig in items if sig is not None],
+    )
+    conn.executemany(
+        "INSERT INTO minhash_buckets (band, bucket, prompt_id) VALUES (?, ?, ?)",
+        [(band, bucket, pid) for pid, ks in keys.items() for band, bucket in ks],
+    )
+    return groups
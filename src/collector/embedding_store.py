@@ -0,0 +1,151 @@
+import hashlib
+import os
+import re
+import sqlite3
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .sqlutil import chunked
+
+CREATE_STORE_TABLES = """
+CREATE TABLE IF NOT EXISTS embedding_stores (
+    model_name TEXT PRIMARY KEY,
+    dim INTEGER NOT NULL,
+    dtype TEXT NOT NULL,
+    n_rows INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS embedding_index (
+    model_name TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    PRIMARY KEY (model_name, prompt_hash)
+);
+"""
+
+def normalize_prompt(text: str) -> str:
+    """キャッシュキー用の正規化（空白の圧縮とカンマ周りの空白統一）。埋め込みもこの文字列で行う"""
+    text = re.sub(r"\s+", " ", (text or "").strip())
+    return re.sub(r"\s*,\s*", ", ", text)
+
+
+def prompt_hash(text: str) -> str:
+    return hashlib.sha1(normalize_prompt(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    (model_name, sha1(正規化プロンプト)) -> ベクトル の永続キャッシュ。
+    - ベクトルは DB と同じディレクトリの追記専用バイナリ（float16/float32）に置き、np.memmap で読む
+    - ハッシュ -> 行番号の対応と有効行数は SQLite（embedding_index / embedding_stores）に持つ
+    - 追記はファイル書き込み -> インデックスのコミットの順。途中で落ちた場合の余分な末尾は次回切り詰める
+    """
+
+    def __init__(self, db_path: str, model_name: str = "all-mpnet-base-v2", dtype: str = "float16",
+                 vector_path: Optional[str] = None):
+        if vector_path is None:
+            if db_path == ":memory:":
+                raise ValueError("vector_path is required for an in-memory DB")
+            slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+            vector_path = str(Path(db_path).with_suffix("")) + f".{slug}.vec"
+        self.db_path = db_path
+        self.model_name = model_name
+        self.vector_path = vector_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(CREATE_STORE_TABLES)
+        row = self.conn.execute(
+            "SELECT dim, dtype, n_rows FROM embedding_stores WHERE model_name = ?", (model_name,)
+        ).fetchone()
+        if row:
+            self.dim, stored_dtype, self.n_rows = row
+            self.dtype = np.dtype(stored_dtype)
+        else:
+            self.dim, self.n_rows = None, 0
+            self.dtype = np.dtype(dtype)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def vectors(self) -> np.ndarray:
+        """保存済みの全ベクトル（読み取り専用 memmap、コピー無し）"""
+        if not self.n_rows:
+            return np.zeros((0, self.dim or 0), dtype=self.dtype)
+        return np.memmap(self.vector_path, dtype=self.dtype, mode="r", shape=(self.n_rows, self.dim))
+
+    def lookup(self, hashes: Sequence[str]) -> Dict[str, int]:
+        """hash -> 行番号（未登録のものは含まない）"""
+        found: Dict[str, int] = {}
+        hashes = list(hashes)
+        for chunk in chunked(hashes):
+            placeholders = ",".join("?" * len(chunk))
+            found.update(self.conn.execute(
+                f"SELECT prompt_hash, row FROM embedding_index WHERE model_name = ? AND prompt_hash IN ({placeholders})",
+                [self.model_name, *chunk],
+            ).fetchall())
+        return found
+
+    def add(self, hashes: Sequence[str], vectors: np.ndarray) -> List[int]:
+        """ベクトルを追記して行番号を返す（hashes と vectors は同じ順序・重複なし）"""
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype)
+        if vectors.ndim != 2 or len(vectors) != len(hashes):
+            raise ValueError("vectors must be a 2-D array with one row per hash")
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"dimension mismatch: store has {self.dim}, got {vectors.shape[1]}")
+
+        start = self.n_rows
+        row_bytes = self.dim * self.dtype.itemsize
+        mode = "r+b" if os.path.exists(self.vector_path) else "wb"
+        with open(self.vector_path, mode) as f:
+            # 前回コミットされなかった末尾を捨ててから追記する
+            f.truncate(start * row_bytes)
+            f.seek(start * row_bytes)
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        rows = list(range(start, start + len(hashes)))
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embedding_index (model_name, prompt_hash, row) VALUES (?, ?, ?)",
+                [(self.model_name, h, r) for h, r in zip(hashes, rows)],
+            )
+            self.conn.execute(
+                "INSERT INTO embedding_stores (model_name, dim, dtype, n_rows) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(model_name) DO UPDATE SET n_rows = excluded.n_rows",
+                (self.model_name, self.dim, self.dtype.name, start + len(hashes)),
+            )
+        self.n_rows = start + len(hashes)
+        return rows
+
+    def get_or_compute(self, texts: Sequence[str], encode: Optional[Callable[[List[str]], np.ndarray]] = None) -> np.ndarray:
+        """
+        texts の埋め込みを入力順で返す（float32）。未登録のプロンプトだけを encode して追記する。
+        encode 省略時は embeddings.embed_texts(model_name=self.model_name) を使う。
+        """
+        if encode is None:
+            from .embeddings import embed_texts
+
+            def encode(batch):
+                return embed_texts(batch, model_name=self.model_name)
+
+        hashes = [prompt_hash(t) for t in texts]
+        rows = self.lookup(set(hashes))
+        missing: Dict[str, str] = {}
+        for h, t in zip(hashes, texts):
+            if h not in rows and h not in missing:
+                missing[h] = normalize_prompt(t)
+        if missing:
+            new_hashes = list(missing)
+            new_vecs = np.asarray(encode([missing[h] for h in new_hashes]))
+            rows.update(zip(new_hashes, self.add(new_hashes, new_vecs)))
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.asarray(self.vectors()[[rows[h] for h in hashes]], dtype=np.float32)
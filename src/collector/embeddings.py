@@ -1,18 +1,54 @@
-from typing import List
+import threading
+from typing import Any, Dict, List, Optional
 import numpy as np
 
-def embed_texts(texts: List[str], model_name: str = "all-mpnet-base-v2"):
-    """
-    sentence-transformers を使ってテキストリストを埋め込み化して返す。
-    実行前に sentence_transformers パッケージをインストールしてください。
-    """
+from .config import EMBED_BATCH_SIZE, EMBED_NUM_THREADS
+
+# プロセス内で共有するモデル（model_name -> SentenceTransformer）
+_MODEL_CACHE: Dict[str, Any] = {}
+_MODEL_LOCK = threading.Lock()
+
+
+def get_model(model_name: str = "all-mpnet-base-v2"):
+    """SentenceTransformer をプロセスごとに 1 回だけロードして使い回す"""
+    model = _MODEL_CACHE.get(model_name)
+    if model is not None:
+        return model
     try:
         from sentence_transformers import SentenceTransformer
     except Exception as e:
         raise RuntimeError("sentence-transformers が必要です。pip install sentence-transformers") from e
+    with _MODEL_LOCK:
+        if model_name not in _MODEL_CACHE:
+            _MODEL_CACHE[model_name] = SentenceTransformer(model_name)
+        return _MODEL_CACHE[model_name]
+
+
+def embed_texts(texts: List[str], model_name: str = "all-mpnet-base-v2", batch_size: Optional[int] = None,
+                num_threads: Optional[int] = None):
+    """
+    sentence-transformers を使ってテキストリストを埋め込み化して返す（L2 正規化済み、入力順）。
+    実行前に sentence_transformers パッケージをインストールしてください。
+    - 同一テキストは 1 回だけ encode して結果を元の位置に配る
+    - 長さ順に並べてから encode し、バッチ内のパディングを減らす
+    - batch_size / num_threads 省略時は config.EMBED_BATCH_SIZE / EMBED_NUM_THREADS
+    """
+    model = get_model(model_name)
+    num_threads = num_threads or EMBED_NUM_THREADS
+    if num_threads:
+        import torch
+        torch.set_num_threads(int(num_threads))
+
+    # 重複除去: unique[i] の位置 -> inverse で元の並びに戻す
+    positions: Dict[str, int] = {}
+    inverse = [positions.setdefault(t, len(positions)) for t in texts]
+    unique = list(positions)
+    order = sorted(range(len(unique)), key=lambda i: len(unique[i]))
 
-    model = SentenceTransformer(model_name)
-    embeddings = model.encode(texts, show_progress_bar=False, convert_to_numpy=True)
+    encoded = model.encode([unique[i] for i in order], batch_size=batch_size or EMBED_BATCH_SIZE,
+                           show_progress_bar=False, convert_to_numpy=True)
+    embeddings = np.empty_like(encoded)
+    embeddings[order] = encoded
     norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
     norms[norms == 0] = 1.0
-    return embeddings / norms
\ No newline at end of file
+    return (embeddings / norms)[inverse]
@@ -0,0 +1,170 @@
+"""
+civitai_prompts を分析用に Parquet へ書き出す。
+
+- raw_metadata は含めず、id 順ではなく (collected_at, id) 順にチャンクで読み出して逐次書く（全件をメモリに載せない）
+- 出力は <out>/model_id=<id>/collected_date=<YYYY-MM-DD>/part-<run>-<n>.parquet の hive 形式パーティション
+- model_name は辞書型（pandas では category）、categories は prompt_categories のカテゴリ名の list、
+  cluster は civitai_prompts.categories の「|cluster:N」から取った int（無ければ null）
+- 書き出したチャンクごとに export_watermarks を進めるので、次回は前回以降に収集（UPSERT）された行だけを書く。
+  再収集された行はもう一度出力されるので、読む側は civitai_id ごとに collected_at が最新の行を使う
+
+    python -m collector.export_parquet --db civitai_dataset.db --out exports/prompts
+"""
+import argparse
+import re
+import sqlite3
+import uuid
+from datetime import datetime
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from . import schema
+from .sqlutil import chunked
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+EXPORT_COLUMNS = [
+    "id", "civitai_id", "full_prompt", "negative_prompt", "quality_score", "reaction_count", "comment_count",
+    "download_count", "prompt_length", "tag_count", "model_name", "model_id", "collected_at", "content_hash",
+]
+
+CREATE_EXPORT_TABLES = """
+CREATE TABLE IF NOT EXISTS export_watermarks (
+    name TEXT PRIMARY KEY,
+    collected_at TEXT NOT NULL,
+    last_id INTEGER NOT NULL,
+    updated_at TIMESTAMP
+);
+"""
+
+_CLUSTER = re.compile(r"\|cluster:(-?\d+)")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("Parquet 出力には pyarrow が必要です: pip install pyarrow") from e
+    return pyarrow, pyarrow.parquet
+
+
+def load_watermark(conn: sqlite3.Connection, name: str) -> Tuple[str, int]:
+    row = conn.execute("SELECT collected_at, last_id FROM export_watermarks WHERE name = ?", (name,)).fetchone()
+    return (row[0], row[1]) if row else ("", 0)
+
+
+def save_watermark(conn: sqlite3.Connection, name: str, collected_at: str, last_id: int):
+    with conn:
+        conn.execute(
+            "INSERT INTO export_watermarks (name, collected_at, last_id, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET collected_at=excluded.collected_at, last_id=excluded.last_id, "
+            "updated_at=excluded.updated_at",
+            (name, collected_at, last_id, datetime.now().isoformat()),
+        )
+
+
+def iter_export_chunks(conn: sqlite3.Connection, since: Tuple[str, int] = ("", 0),
+                       chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict[str, list]]:
+    """
+    since（collected_at, id）より後の行を列ごとのリストの dict で chunk_size 件ずつ返す。
+    EXPORT_COLUMNS に加えて collected_date / categories（list）/ cluster（int or None）を持つ。
+    """
+    has_labels = "categories" in [r[1] for r in conn.execute("PRAGMA table_info(civitai_prompts)")]
+    cols = ", ".join(EXPORT_COLUMNS) + (", categories" if has_labels else "")
+    collected_at, last_id = since
+    while True:
+        rows = conn.execute(
+            f"SELECT {cols} FROM civitai_prompts "
+            "WHERE collected_at > ? OR (collected_at = ? AND id > ?) ORDER BY collected_at, id LIMIT ?",
+            (collected_at, collected_at, last_id, chunk_size),
+        ).fetchall()
+        if not rows:
+            return
+        cats: Dict[int, List[str]] = {}
+        ids = [r[0] for r in rows]
+        for part in chunked(ids):
+            for pid, category in conn.execute(
+                f"SELECT prompt_id, category FROM prompt_categories WHERE prompt_id IN ({','.join('?' * len(part))}) "
+                "ORDER BY prompt_id, category",
+                part,
+            ):
+                cats.setdefault(pid, []).append(category)
+
+        chunk = {name: [r[i] for r in rows] for i, name in enumerate(EXPORT_COLUMNS)}
+        chunk["model_id"] = [m or "unknown" for m in chunk["model_id"]]
+        chunk["collected_date"] = [(c or "")[:10] or "unknown" for c in chunk["collected_at"]]
+        chunk["categories"] = [cats.get(pid, []) for pid in ids]
+        labels = [r[len(EXPORT_COLUMNS)] for r in rows] if has_labels else [None] * len(rows)
+        chunk["cluster"] = [int(m.group(1)) if (m := _CLUSTER.search(s or "")) else None for s in labels]
+        yield chunk
+        collected_at, last_id = rows[-1][EXPORT_COLUMNS.index("collected_at")] or "", rows[-1][0]
+
+
+def _to_table(pa, chunk: Dict[str, list]):
+    dict_str = pa.dictionary(pa.int32(), pa.string())
+    types = {
+        "id": pa.int64(), "quality_score": pa.int32(), "reaction_count": pa.int64(), "comment_count": pa.int64(),
+        "download_count": pa.int64(), "prompt_length": pa.int32(), "tag_count": pa.int32(),
+        "model_name": dict_str, "cluster": pa.int32(),
+    }
+    arrays, names = [], []
+    for name, values in chunk.items():
+        t = types.get(name, pa.string())
+        if name == "categories":
+            # 値を平らにして辞書化し、オフセットで list に戻す
+            flat = pa.array([c for cs in values for c in cs], type=pa.string()).dictionary_encode()
+            offsets = pa.array(list(accumulate((len(cs) for cs in values), initial=0)), type=pa.int32())
+            arrays.append(pa.ListArray.from_arrays(offsets, flat))
+        elif t == dict_str:
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, type=t))
+        names.append(name)
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def export_parquet(db_path: str, out_dir: str, chunk_size: int = DEFAULT_CHUNK_SIZE, full: bool = False,
+                   name: Optional[str] = None) -> int:
+    """
+    前回のウォーターマーク以降の行を out_dir に追記する（full=True で先頭から）。返却: 書き出した行数。
+    ウォーターマークは出力先ごと（name 省略時は out_dir）に持つ。
+    """
+    pa, pq = _pyarrow()
+    name = name or str(out_dir)
+    conn = sqlite3.connect(db_path)
+    try:
+        # キーセット走査・カテゴリの引き当てに使う索引は schema のマイグレーションが作る
+        schema.migrate(conn)
+        conn.executescript(CREATE_EXPORT_TABLES)
+        since = ("", 0) if full else load_watermark(conn, name)
+        run = uuid.uuid4().hex[:8]
+        done = 0
+        for n, chunk in enumerate(iter_export_chunks(conn, since, chunk_size)):
+            pq.write_to_dataset(
+                _to_table(pa, chunk), root_path=str(out_dir), partition_cols=["model_id", "collected_date"],
+                basename_template=f"part-{run}-{n}-{{i}}.parquet", existing_data_behavior="overwrite_or_ignore",
+                compression="zstd",
+            )
+            # ファイルを書いてからウォーターマークを進める（途中で落ちたらそのチャンクは次回もう一度出る）
+            save_watermark(conn, name, chunk["collected_at"][-1] or "", chunk["id"][-1])
+            done += len(chunk["id"])
+            print(f"[export_parquet] wrote {done} rows")
+        return done
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="civitai_prompts を model_id / 収集日で分割した Parquet に書き出す")
+    p.add_argument("--db", default="civitai_dataset.db")
+    p.add_argument("--out", default="exports/prompts")
+    p.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    p.add_argument("--full", action="store_true", help="ウォーターマークを無視して全件を書き出す")
+    args = p.parse_args(argv)
+    n = export_parquet(args.db, args.out, chunk_size=args.chunk_size, full=args.full)
+    print(f"[export_parquet] done: {n} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+# 件数がこれを超えるか、全件 UMAP/HDBSCAN の推定メモリが空きメモリの半分を超えたら large モード
+LARGE_CORPUS_THRESHOLD = 50_000
+DEFAULT_SAMPLE_SIZE = 20_000
+DEFAULT_CHUNK_SIZE = 10_000
+# 層化抽出に使う粗いクラスタ数
+N_STRATA = 64
+
+
+def available_memory() -> Optional[int]:
+    """空き物理メモリ（バイト）。取得できない環境では None"""
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def estimate_full_bytes(n_samples: int, dim: int, n_neighbors: int = 15) -> int:
+    """全件 UMAP + HDBSCAN のおおよその必要メモリ（埋め込みの複製・kNN グラフ・HDBSCAN の作業領域）"""
+    return n_samples * (dim * 4 * 3 + n_neighbors * 8 * 4 + 256)
+
+
+def choose_mode(n_samples: int, dim: int, n_neighbors: int = 15) -> str:
+    if n_samples > LARGE_CORPUS_THRESHOLD:
+        return "large"
+    avail = available_memory()
+    if avail is not None and estimate_full_bytes(n_samples, dim, n_neighbors) > avail // 2:
+        return "large"
+    return "full"
+
+
+def _chunks(n: int, size: int):
+    for start in range(0, n, size):
+        yield start, min(n, start + size)
+
+
+def stratified_sample(embs, sample_size: int, chunk_size: int = DEFAULT_CHUNK_SIZE, seed: int = 42) -> np.ndarray:
+    """
+    粗い MiniBatchKMeans の各クラスタから件数比例で抽出した行番号（昇順）。
+    小さな領域も最低 1 件は含める。埋め込みはチャンク単位でしか読まない（memmap 可）。
+    """
+    n = len(embs)
+    if sample_size >= n:
+        return np.arange(n)
+    from sklearn.cluster import MiniBatchKMeans
+
+    strata = MiniBatchKMeans(n_clusters=min(N_STRATA, sample_size), random_state=seed, batch_size=4096, n_init=3)
+    for start, end in _chunks(n, chunk_size):
+        strata.partial_fit(np.asarray(embs[start:end], dtype=np.float32))
+    groups = np.concatenate([strata.predict(np.asarray(embs[s:e], dtype=np.float32)) for s, e in _chunks(n, chunk_size)])
+
+    rng = np.random.default_rng(seed)
+    picked = []
+    for g in np.unique(groups):
+        members = np.flatnonzero(groups == g)
+        take = max(1, int(round(len(members) * sample_size / n)))
+        picked.append(rng.choice(members, size=min(take, len(members)), replace=False))
+    return np.sort(np.concatenate(picked))
+
+
+def cluster_large(embs, min_cluster_size: int = 5, umap_n_neighbors: int = 15, umap_n_components: int = 5,
+                  sample_size: int = DEFAULT_SAMPLE_SIZE, chunk_size: int = DEFAULT_CHUNK_SIZE) -> np.ndarray:
+    """
+    大規模コーパス用: 層化サンプルで UMAP + HDBSCAN を学習し、残りはチャンクごとに transform して
+    最寄りのクラスタ重心に割り当てる。HDBSCAN が使えない/全件 noise の場合は MiniBatchKMeans に切り替える。
+    """
+    from .categorizer import reduce_and_cluster
+
+    n = len(embs)
+    sample_idx = stratified_sample(embs, sample_size, chunk_size=chunk_size)
+    sample = np.asarray(embs[sample_idx], dtype=np.float32)
+    sample_labels, sample_low, reducer, _clusterer = reduce_and_cluster(
+        sample, min_cluster_size=min_cluster_size, umap_n_neighbors=umap_n_neighbors, umap_n_components=umap_n_components
+    )
+    sample_labels = np.asarray(sample_labels)
+    print(f"[cluster_large] n={n} sample={len(sample_idx)}")
+
+    def transform(block):
+        return reducer.transform(block) if reducer is not None else block
+
+    cluster_ids = [l for l in np.unique(sample_labels) if l != -1]
+    if cluster_ids:
+        centroids = np.stack([sample_low[sample_labels == l].mean(axis=0) for l in cluster_ids])
+        cluster_ids = np.array(cluster_ids)
+
+        def assign(low):
+            d = ((low[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+            return cluster_ids[d.argmin(axis=1)]
+    else:
+        # サンプルでもクラスタが出なければ、メモリ一定の MiniBatchKMeans で全件を分ける
+        from sklearn.cluster import MiniBatchKMeans
+        k = max(2, min(256, int(np.sqrt(n / 2))))
+        print(f"[cluster_large] HDBSCAN found no clusters, falling back to MiniBatchKMeans(k={k})")
+        km = MiniBatchKMeans(n_clusters=k, random_state=42, batch_size=4096, n_init=3)
+        for start, end in _chunks(n, chunk_size):
+            km.partial_fit(transform(np.asarray(embs[start:end], dtype=np.float32)))
+        assign = km.predict
+        sample_labels = None
+
+    labels = np.empty(n, dtype=int)
+    for start, end in _chunks(n, chunk_size):
+        labels[start:end] = assign(transform(np.asarray(embs[start:end], dtype=np.float32)))
+    if sample_labels is not None:
+        # 学習に使ったサンプル自身は HDBSCAN のラベル（noise を含む）をそのまま使う
+        labels[sample_idx] = sample_labels
+    return labels
@@ -0,0 +1,74 @@
+import re
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+def _trie_regex(words: Iterable[str]) -> str:
+    """キーワード群を接頭辞共有のトライ型正規表現に変換する（各位置で最長一致を返す）"""
+    trie: Dict[str, dict] = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        terminal = "" in node
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if terminal:
+            # ここで語が終わってもよい -> 以降は貪欲な省略可能部分（長い語を優先）
+            body = ("(?:" + body + ")?") if len(alts) == 1 else body + "?"
+        return body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    カテゴリ辞書 {category: [keyword, ...]} から一度だけ構築する単一パスのキーワード照合器。
+    - 全キーワードを 1 本のトライ型正規表現にまとめ、テキストを先頭から 1 回走査して各開始位置の最長一致を拾う
+    - 同じ位置から始まる短い語や、一致語の内部に含まれる語は事前計算した包含関係で補う
+    照合は小文字化したテキストに対する部分一致（従来の `kw in text` / `re.search(kw)` と同じ意味）。
+    """
+
+    def __init__(self, categories: Dict[str, List[str]]):
+        self.categories = {cat: [kw.lower() for kw in kws if kw] for cat, kws in categories.items()}
+        keywords = sorted({kw for kws in self.categories.values() for kw in kws})
+        # 一致した語 -> その語に部分文字列として含まれる語（自身を含む）
+        self._implied: Dict[str, Set[str]] = {
+            kw: {other for other in keywords if other in kw} for kw in keywords
+        }
+        self._regex = re.compile(_trie_regex(keywords)) if keywords else None
+        # キーワード -> [(category, 定義順 index)]
+        self._owners: Dict[str, List[Tuple[str, int]]] = {}
+        for cat, kws in self.categories.items():
+            for i, kw in enumerate(kws):
+                self._owners.setdefault(kw, []).append((cat, i))
+
+    def find_keywords(self, text: str) -> Set[str]:
+        """text に現れるキーワードの集合（小文字）"""
+        if self._regex is None or not text:
+            return set()
+        text = text.lower()
+        found: Set[str] = set()
+        implied = self._implied
+        search = self._regex.search
+        m = search(text)
+        while m is not None:
+            kw = m.group()
+            if kw not in found:
+                found |= implied[kw]
+            # 重なりを取りこぼさないよう、次は一致開始位置の直後から探す
+            m = search(text, m.start() + 1)
+        return found
+
+    def match(self, text: str) -> Dict[str, List[str]]:
+        """{category: [一致したキーワード（定義順）]}。一致の無いカテゴリは含めない"""
+        hits: Dict[str, List[Tuple[int, str]]] = {}
+        for kw in self.find_keywords(text):
+            for cat, i in self._owners[kw]:
+                hits.setdefault(cat, []).append((i, kw))
+        # カテゴリ順・キーワード順は辞書の定義順に揃える
+        return {cat: [kw for _, kw in sorted(hits[cat])] for cat in self.categories if cat in hits}
@@ -0,0 +1,122 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Mapping, Optional
+
+# 既定値: 上限 2 req/s から半分の速度で開始し、健全なら上限まで戻す
+DEFAULT_MAX_RATE = 2.0
+DEFAULT_MIN_RATE = 0.05
+DEFAULT_MAX_BACKOFF = 300.0
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Retry-After ヘッダー（秒数 or HTTP-date）を待機秒数に変換。解釈できなければ None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
+
+
+def _reset_delay(headers: Mapping[str, str]) -> Optional[float]:
+    """X-RateLimit-* / RateLimit-* で残数 0 のとき、リセットまでの秒数を返す"""
+    for prefix in ("X-RateLimit-", "RateLimit-"):
+        remaining = headers.get(prefix + "Remaining")
+        reset = headers.get(prefix + "Reset")
+        if remaining is None or reset is None:
+            continue
+        try:
+            if int(float(remaining)) > 0:
+                return None
+            reset_value = float(reset)
+        except ValueError:
+            continue
+        # 大きな値は epoch 秒、小さな値は残り秒数とみなす
+        if reset_value > 1e9:
+            reset_value -= time.time()
+        return max(0.0, reset_value)
+    return None
+
+
+class AdaptiveRateLimiter:
+    """
+    トークンバケット + AIMD の適応型レートリミッター（スレッドセーフ）。
+    - acquire(): 送信前に呼ぶ。トークンが無ければ補充されるまで待つ
+    - on_response(): 応答ごとに呼ぶ。健全なら上限へ加算的に回復、429/5xx なら半減
+    - backoff(): リトライ待機秒数（Retry-After 優先、無ければジッター付き指数バックオフ）
+    """
+
+    def __init__(self, max_rate: float = DEFAULT_MAX_RATE, min_rate: float = DEFAULT_MIN_RATE,
+                 initial_rate: Optional[float] = None, burst: float = 1.0,
+                 backoff_base: float = 2.0, max_backoff: float = DEFAULT_MAX_BACKOFF,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.max_rate = float(max_rate)
+        self.min_rate = float(min(min_rate, max_rate))
+        self.rate = float(initial_rate if initial_rate is not None else max_rate / 2.0)
+        self.rate = min(self.max_rate, max(self.min_rate, self.rate))
+        self.burst = float(burst)
+        self.backoff_base = float(backoff_base)
+        self.max_backoff = float(max_backoff)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._last = clock()
+        self._blocked_until = 0.0
+
+    def set_max_rate(self, max_rate: float):
+        with self._lock:
+            self.max_rate = float(max_rate)
+            self.rate = min(self.rate, self.max_rate)
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self) -> float:
+        """トークンを 1 つ予約し、必要な分だけ待つ。待機した秒数を返す"""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._tokens -= 1.0
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            wait = max(wait, self._blocked_until - now)
+        if wait > 0:
+            self._sleep(wait)
+        return max(0.0, wait)
+
+    def block_for(self, seconds: float):
+        """サーバー指示などで一定時間すべての送信を止める"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+    def on_response(self, status_code: int, headers: Optional[Mapping[str, str]] = None):
+        headers = headers or {}
+        throttled = status_code == 429 or status_code >= 500
+        with self._lock:
+            if throttled:
+                self.rate = max(self.min_rate, self.rate / 2.0)
+            elif 200 <= status_code < 300:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+        reset = _reset_delay(headers)
+        if reset:
+            self.block_for(reset)
+
+    def backoff(self, attempt: int, headers: Optional[Mapping[str, str]] = None) -> float:
+        """attempt 回目のリトライまでの待機秒数。Retry-After があれば従う"""
+        retry_after = parse_retry_after((headers or {}).get("Retry-After"))
+        if retry_after is not None:
+            delay = min(self.max_backoff, retry_after)
+        else:
+            # full jitter: [0, base * 2^attempt] から一様に選ぶ
+            delay = random.uniform(0, min(self.max_backoff, self.backoff_base * (2 ** attempt)))
+        self.block_for(delay)
+        return delay
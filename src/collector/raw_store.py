@@ -0,0 +1,234 @@
+"""
+raw_metadata（API 項目の JSON 全体）を圧縮して別テーブルに置くストア。
+
+- civitai_prompts からは外し、prompt_raw(prompt_id, codec, dict_id, data) に圧縮して保存する
+  （civitai_prompts の全件走査で大きな JSON を読まずに済む）
+- 圧縮は zstandard があれば zstd、無ければ zlib。どちらも項目同士がよく似ているので共有辞書を使う
+  （zstd は train_dictionary、zlib はサンプルを連結した preset dictionary）
+- 辞書は最初の train_samples 件で学習して raw_dicts に保存し、それ以降の行に使う。読み出し時に必要な分だけ展開する
+
+    python -m collector.raw_store --db civitai_dataset.db [--vacuum]   # 既存 DB の raw_metadata を移行
+"""
+import argparse
+import json
+import sqlite3
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+CREATE_RAW_TABLES = """
+CREATE TABLE IF NOT EXISTS raw_dicts (
+    id INTEGER PRIMARY KEY,
+    codec TEXT NOT NULL,
+    data BLOB NOT NULL,
+    created_at TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS prompt_raw (
+    prompt_id INTEGER PRIMARY KEY,
+    codec TEXT NOT NULL,
+    dict_id INTEGER,
+    data BLOB NOT NULL
+);
+"""
+
+DEFAULT_TRAIN_SAMPLES = 500
+ZSTD_DICT_SIZE = 64 * 1024
+ZSTD_LEVEL = 10
+# zlib の preset dictionary は末尾 32KB までしか使われない
+ZLIB_DICT_SIZE = 32 * 1024
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("zstd で圧縮された raw_metadata を読むには zstandard が必要です: pip install zstandard") from e
+    return zstandard
+
+
+def default_codec() -> str:
+    try:
+        import zstandard  # noqa: F401
+        return "zstd"
+    except ImportError:
+        return "zlib"
+
+
+def _to_bytes(raw: Union[str, bytes]) -> bytes:
+    return raw.encode("utf-8") if isinstance(raw, str) else bytes(raw)
+
+
+def train_dictionary(codec: str, samples: Sequence[bytes]) -> Optional[bytes]:
+    """サンプルから共有辞書を作る（サンプル不足などで作れなければ None）"""
+    if not samples:
+        return None
+    if codec == "zstd":
+        zstandard = _zstd()
+        try:
+            return zstandard.train_dictionary(ZSTD_DICT_SIZE, list(samples)).as_bytes()
+        except zstandard.ZstdError as e:
+            print(f"[raw_store] dictionary training failed ({e}), compressing without a dictionary")
+            return None
+    # zlib は辞書の後ろほど参照されやすいので、新しいサンプルが末尾に来るように連結する
+    return b"".join(samples)[-ZLIB_DICT_SIZE:]
+
+
+class RawMetadataStore:
+    """
+    1 本の接続上で prompt_raw を読み書きする。put_many は呼び出し側のトランザクション内で使う想定。
+    """
+
+    def __init__(self, conn: sqlite3.Connection, codec: Optional[str] = None,
+                 train_samples: int = DEFAULT_TRAIN_SAMPLES):
+        self.conn = conn
+        self.codec = codec or default_codec()
+        self.train_samples = train_samples
+        conn.executescript(CREATE_RAW_TABLES)
+        self._samples: List[bytes] = []
+        self._dicts: Dict[int, bytes] = {}
+        self._load_dictionary()
+
+    def _load_dictionary(self):
+        row = self.conn.execute(
+            "SELECT id, data FROM raw_dicts WHERE codec = ? ORDER BY id DESC LIMIT 1", (self.codec,)
+        ).fetchone()
+        self.dict_id, self._dict = (row[0], bytes(row[1])) if row else (None, None)
+        self._compressor = None
+
+    def _check_dictionary(self):
+        """辞書を入れたトランザクションがロールバックされていたら、DB にある辞書（無ければ辞書なし）に戻す"""
+        if self.dict_id is None:
+            return
+        if self.conn.execute("SELECT 1 FROM raw_dicts WHERE id = ?", (self.dict_id,)).fetchone() is None:
+            self._dicts.pop(self.dict_id, None)
+            self._load_dictionary()
+
+    # --- 圧縮 ---
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == "zstd":
+            if self._compressor is None:
+                zstandard = _zstd()
+                dict_data = zstandard.ZstdCompressionDict(self._dict) if self._dict else None
+                self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data)
+            return self._compressor.compress(data)
+        c = zlib.compressobj(9, zdict=self._dict) if self._dict else zlib.compressobj(9)
+        return c.compress(data) + c.flush()
+
+    def _maybe_train(self, pending: Sequence[bytes]):
+        """辞書がまだ無ければサンプルを貯め、十分集まったら学習して raw_dicts に保存する"""
+        if self.dict_id is not None:
+            return
+        self._samples.extend(pending[:max(0, self.train_samples - len(self._samples))])
+        if len(self._samples) < self.train_samples:
+            return
+        self.set_dictionary(train_dictionary(self.codec, self._samples))
+        self._samples = []
+
+    def set_dictionary(self, dict_data: Optional[bytes]):
+        if not dict_data:
+            return
+        cur = self.conn.execute(
+            "INSERT INTO raw_dicts (codec, data, created_at) VALUES (?, ?, ?)",
+            (self.codec, dict_data, datetime.now().isoformat()),
+        )
+        self.dict_id, self._dict, self._compressor = cur.lastrowid, dict_data, None
+
+    def put_many(self, items: Sequence[Tuple[int, Union[str, bytes, None]]]):
+        """[(prompt_id, raw JSON（str/bytes）), ...] を圧縮して保存する"""
+        items = [(pid, _to_bytes(raw)) for pid, raw in items if raw is not None]
+        if not items:
+            return
+        self._check_dictionary()
+        self._maybe_train([data for _, data in items])
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO prompt_raw (prompt_id, codec, dict_id, data) VALUES (?, ?, ?, ?)",
+            [(pid, self.codec, self.dict_id, self._compress(data)) for pid, data in items],
+        )
+
+    # --- 展開 ---
+    def _dictionary(self, dict_id: int) -> bytes:
+        if dict_id not in self._dicts:
+            self._dicts[dict_id] = bytes(self.conn.execute("SELECT data FROM raw_dicts WHERE id = ?", (dict_id,)).fetchone()[0])
+        return self._dicts[dict_id]
+
+    def decompress(self, codec: str, dict_id: Optional[int], data: bytes) -> bytes:
+        dict_data = self._dictionary(dict_id) if dict_id is not None else None
+        if codec == "zstd":
+            zstandard = _zstd()
+            d = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(dict_data) if dict_data else None)
+            return d.decompress(data)
+        if codec == "zlib":
+            d = zlib.decompressobj(zdict=dict_data) if dict_data else zlib.decompressobj()
+            return d.decompress(data) + d.flush()
+        raise ValueError(f"unknown codec: {codec}")
+
+    def get(self, prompt_id: int) -> Optional[str]:
+        """prompt_id の raw_metadata（JSON 文字列）。無ければ None"""
+        row = self.conn.execute("SELECT codec, dict_id, data FROM prompt_raw WHERE prompt_id = ?", (prompt_id,)).fetchone()
+        if row is None:
+            return None
+        return self.decompress(row[0], row[1], bytes(row[2])).decode("utf-8")
+
+
+def load_raw_metadata(conn: sqlite3.Connection, prompt_id: int, store: Optional[RawMetadataStore] = None) -> Optional[dict]:
+    """prompt_raw（無ければ civitai_prompts.raw_metadata）から API 項目を読み出す"""
+    store = store or RawMetadataStore(conn)
+    raw = store.get(prompt_id)
+    if raw is None:
+        row = conn.execute("SELECT raw_metadata FROM civitai_prompts WHERE id = ?", (prompt_id,)).fetchone()
+        raw = row[0] if row else None
+    return json.loads(raw) if raw else None
+
+
+def migrate_raw_metadata(conn: sqlite3.Connection, codec: Optional[str] = None, chunk_size: int = 2000,
+                         train_samples: int = DEFAULT_TRAIN_SAMPLES, vacuum: bool = False) -> int:
+    """
+    civitai_prompts.raw_metadata を prompt_raw に圧縮して移し、元の列は NULL にする。
+    チャンクごとに 1 トランザクションなので、途中で止めても再実行で続きから進む。返却: 移行件数
+    """
+    store = RawMetadataStore(conn, codec=codec, train_samples=train_samples)
+    if store.dict_id is None:
+        # 先頭に偏らないよう id を飛び飛びに拾って辞書を学習する
+        total = conn.execute("SELECT COUNT(*) FROM civitai_prompts WHERE raw_metadata IS NOT NULL").fetchone()[0]
+        step = max(1, total // max(1, train_samples))
+        samples = [_to_bytes(r[0]) for r in conn.execute(
+            "SELECT raw_metadata FROM civitai_prompts WHERE raw_metadata IS NOT NULL AND id % ? = 0 LIMIT ?",
+            (step, train_samples),
+        )]
+        with conn:
+            store.set_dictionary(train_dictionary(store.codec, samples))
+
+    done, last = 0, 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, raw_metadata FROM civitai_prompts WHERE id > ? AND raw_metadata IS NOT NULL ORDER BY id LIMIT ?",
+            (last, chunk_size),
+        ).fetchall()
+        if not rows:
+            break
+        with conn:
+            store.put_many(rows)
+            conn.executemany("UPDATE civitai_prompts SET raw_metadata = NULL WHERE id = ?", [(r[0],) for r in rows])
+        last = rows[-1][0]
+        done += len(rows)
+        print(f"[raw_store] migrated {done} rows")
+    if vacuum:
+        conn.execute("VACUUM")
+    return done
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="civitai_prompts.raw_metadata を圧縮して prompt_raw に移す")
+    p.add_argument("--db", default="civitai_dataset.db")
+    p.add_argument("--codec", choices=["zstd", "zlib"], default=None, help="省略時は zstandard があれば zstd")
+    p.add_argument("--vacuum", action="store_true", help="移行後に VACUUM してファイルを縮める")
+    args = p.parse_args(argv)
+    conn = sqlite3.connect(args.db)
+    try:
+        print(f"[raw_store] done: {migrate_raw_metadata(conn, codec=args.codec, vacuum=args.vacuum)} rows")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+キーワード辞書を変更した後に、保存済みプロンプトのカテゴリを一括で付け直すジョブ。
+
+- civitai_prompts（v8 スキーマ）または prompts（簡易スキーマ）を rowid 順に固定サイズで読み出す
+- 分類はプロセスプールで並列実行（同時に保持するチャンク数を制限してメモリを一定に保つ）
+- 書き込みはチャンクごとに 1 トランザクションで置き換える
+
+    python -m collector.recategorize --db civitai_dataset.db --workers 4
+"""
+import argparse
+import os
+import sqlite3
+import time
+from collections import deque
+from multiprocessing import Pool
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .category_counts import has_simple, rebuild_simple
+
+DEFAULT_CHUNK_SIZE = 5000
+
+_worker_categorizer = None
+
+
+def _init_worker(schema: str):
+    global _worker_categorizer
+    if schema == "v8":
+        from .civitai_collector_v8 import V8Categorizer
+        _worker_categorizer = V8Categorizer()
+    else:
+        _worker_categorizer = None
+
+
+def _categorize_chunk(args: Tuple[str, List[Tuple[Any, str]]]):
+    """ワーカー側: (schema, [(rowid, text), ...]) -> 書き込み用の行"""
+    schema, rows = args
+    if schema == "v8":
+        if _worker_categorizer is None:
+            _init_worker(schema)
+        out = []
+        for prompt_id, text in rows:
+            out.extend(_worker_categorizer.category_rows(prompt_id, text))
+        return out
+    from .categorizer import keyword_categorize
+    return [(",".join(keyword_categorize(text)), rowid) for rowid, text in rows]
+
+
+def _iter_chunks(conn: sqlite3.Connection, schema: str, chunk_size: int) -> Iterator[Tuple[int, int, List[Tuple[Any, str]]]]:
+    """rowid のキーセットページングでチャンクを順に返す: (下限 rowid(含まない), 上限 rowid, 行)"""
+    if schema == "v8":
+        sql = "SELECT id, full_prompt FROM civitai_prompts WHERE id > ? ORDER BY id LIMIT ?"
+    else:
+        sql = "SELECT rowid, prompt FROM prompts WHERE rowid > ? ORDER BY rowid LIMIT ?"
+    last = 0
+    while True:
+        rows = conn.execute(sql, (last, chunk_size)).fetchall()
+        if not rows:
+            return
+        lo, last = last, rows[-1][0]
+        yield lo, last, [(r[0], r[1] or "") for r in rows]
+
+
+def _write_chunk(conn: sqlite3.Connection, schema: str, lo: int, hi: int, out: List[tuple]):
+    with conn:
+        if schema == "v8":
+            conn.execute("DELETE FROM prompt_categories WHERE prompt_id > ? AND prompt_id <= ?", (lo, hi))
+            conn.executemany(
+                "INSERT INTO prompt_categories (prompt_id, category, keywords, confidence) VALUES (?, ?, ?, ?)",
+                out,
+            )
+        else:
+            conn.executemany("UPDATE prompts SET categories = ? WHERE rowid = ?", out)
+
+
+def recategorize(db_path: str, schema: str = "v8", chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 workers: Optional[int] = None, max_inflight: Optional[int] = None) -> Dict[str, float]:
+    """
+    全行のカテゴリを付け直す。
+    - schema: "v8"（prompt_categories を置き換え）/ "simple"（prompts.categories を更新）
+    - workers: プロセス数（None で CPU 数、0/1 でプール無しの逐次実行）
+    返却: {"rows": 件数, "elapsed": 秒, "rows_per_sec": 件/秒}
+    """
+    if schema not in ("v8", "simple"):
+        raise ValueError(f"unknown schema: {schema}")
+    conn = sqlite3.connect(db_path)
+    table = "civitai_prompts" if schema == "v8" else "prompts"
+    total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    done = 0
+    start = time.perf_counter()
+
+    def report(lo, hi, rows, out):
+        nonlocal done
+        _write_chunk(conn, schema, lo, hi, out)
+        done += len(rows)
+        elapsed = time.perf_counter() - start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        print(f"[recategorize] {done}/{total} rows ({rate:.0f} rows/sec)")
+
+    try:
+        if workers is not None and workers <= 1:
+            _init_worker(schema)
+            for lo, hi, rows in _iter_chunks(conn, schema, chunk_size):
+                report(lo, hi, rows, _categorize_chunk((schema, rows)))
+        else:
+            with Pool(processes=workers, initializer=_init_worker, initargs=(schema,)) as pool:
+                # Pool.imap は入力を先読みし切るので、投入数を制限して読み出しを分類に追従させる
+                limit = max_inflight or 2 * (workers or os.cpu_count() or 1)
+                inflight = deque()
+                for lo, hi, rows in _iter_chunks(conn, schema, chunk_size):
+                    inflight.append((lo, hi, rows, pool.apply_async(_categorize_chunk, ((schema, rows),))))
+                    while len(inflight) >= limit:
+                        lo0, hi0, rows0, res = inflight.popleft()
+                        report(lo0, hi0, rows0, res.get())
+                while inflight:
+                    lo0, hi0, rows0, res = inflight.popleft()
+                    report(lo0, hi0, rows0, res.get())
+        if schema == "simple" and has_simple(conn):
+            # prompts.categories を直接更新したので集計テーブルを作り直す（v8 はトリガで追従済み）
+            rebuild_simple(conn)
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    return {"rows": done, "elapsed": elapsed, "rows_per_sec": done / elapsed if elapsed > 0 else 0.0}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="保存済みプロンプトのカテゴリを一括で付け直す")
+    p.add_argument("--db", default="civitai_dataset.db")
+    p.add_argument("--schema", choices=["v8", "simple"], default="v8")
+    p.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    p.add_argument("--workers", type=int, default=None, help="プロセス数（省略で CPU 数、1 で逐次）")
+    args = p.parse_args(argv)
+    res = recategorize(args.db, schema=args.schema, chunk_size=args.chunk_size, workers=args.workers)
+    print(f"[recategorize] done: {res['rows']} rows in {res['elapsed']:.1f}s ({res['rows_per_sec']:.0f} rows/sec)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+SQLite の接続設定（PRAGMA）と v8 スキーマのバージョン管理。
+
+- apply_pragmas: WAL / synchronous=NORMAL / 64MB のページキャッシュ / 256MB の mmap / 一時表はメモリ
+- migrate: PRAGMA user_version を見て MIGRATIONS のうち未適用のものだけを順に流す。
+  テーブル自体は setup_database の CREATE TABLE IF NOT EXISTS が作り、ここでは索引・集計テーブルなど後から足すものを扱う。
+  既存 DB に索引を足したときは ANALYZE までしてプランナに使わせる
+- optimize: 大量投入の後に呼ぶ（統計が無ければ ANALYZE、あれば PRAGMA optimize）
+"""
+import sqlite3
+from typing import List
+
+from . import category_counts
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+
+# MIGRATIONS[i] を流すと user_version が i + 1 になる（追加は末尾にだけ行う）
+MIGRATIONS: List[str] = [
+    # 1: カテゴリの付け替え（DELETE ... WHERE prompt_id = ?）・カテゴリ別集計・モデル別の絞り込み用
+    """
+    CREATE INDEX IF NOT EXISTS idx_prompt_categories_prompt_id ON prompt_categories(prompt_id);
+    CREATE INDEX IF NOT EXISTS idx_prompt_categories_category ON prompt_categories(category);
+    CREATE INDEX IF NOT EXISTS idx_civitai_prompts_model ON civitai_prompts(model_id, model_name);
+    """,
+    # 2: category_counts とトリガ。既存 DB の値は捨てて prompt_categories から数え直す
+    category_counts.V8_MIGRATION,
+    # 3: export_parquet の (collected_at, id) 順のキーセット走査用
+    """
+    CREATE INDEX IF NOT EXISTS idx_civitai_prompts_collected ON civitai_prompts(collected_at, id);
+    """,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# 後から civitai_prompts に足した列。MIGRATIONS はこれらがある前提で書いているので、
+# setup_database を通らない呼び出し元（移行スクリプト・export_parquet）でも migrate の前に揃える
+ADDED_COLUMNS = (
+    ("civitai_prompts", "content_hash", "TEXT"),
+    # ほぼ同じプロンプトの代表行の id（dedup.link_groups が設定）
+    ("civitai_prompts", "group_id", "INTEGER"),
+)
+
+
+def apply_pragmas(conn: sqlite3.Connection):
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def ensure_columns(conn: sqlite3.Connection):
+    """ADDED_COLUMNS のうち既存 DB に無い列を追加する"""
+    for table, column, coltype in ADDED_COLUMNS:
+        if column not in [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {coltype}")
+    conn.commit()
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """未適用のマイグレーションを流して user_version を進める。返却: 適用した数"""
+    current = schema_version(conn)
+    if current > SCHEMA_VERSION:
+        raise RuntimeError(f"DB のスキーマ（version {current}）がこのコードより新しい（version {SCHEMA_VERSION}）")
+    pending = MIGRATIONS[current:]
+    if pending:
+        ensure_columns(conn)
+    for version, script in enumerate(pending, start=current + 1):
+        # executescript は先に COMMIT するので、バージョン更新まで 1 本のスクリプトにして途中で止まらないようにする
+        try:
+            conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;")
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        print(f"[schema] migrated to version {version}")
+    if pending and conn.execute("SELECT EXISTS (SELECT 1 FROM civitai_prompts)").fetchone()[0]:
+        conn.execute("ANALYZE")
+    return len(pending)
+
+
+def optimize(conn: sqlite3.Connection):
+    """大量投入の後に統計を更新する"""
+    has_stats = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is not None
+    conn.execute("PRAGMA optimize" if has_stats else "ANALYZE")
+    conn.commit()
@@ -0,0 +1,153 @@
+"""
+civitai_prompts の全文検索（SQLite FTS5）。
+
+- 索引するのは civitai_prompts.search_prompt / search_negative（tags.parse_tags で正規化したタグを ", " で連結した列）。
+  重み「:1.2」・括弧・<lora:...>・BREAK は保存前に外すので、重みの数字がトークンとして索引に入らない
+- civitai_prompts_fts はその 2 列を content に持つ外部コンテンツ表で、FTS 側には本文を持たない
+- INSERT / UPDATE / DELETE のトリガで同期するので、バッチ保存・UPSERT のどちらから書いても追従する
+- トークナイザは unicode61（アクセント除去）+ 前方一致用の prefix インデックス
+- クエリはカンマ区切りのタグごとに同じ正規化をしてフレーズ検索し、AND で結ぶ
+"""
+import re
+import sqlite3
+from typing import Dict, List, Optional
+
+from .tags import normalize_tag, parse_tags
+
+FTS_TABLE = "civitai_prompts_fts"
+# 検索で指定する列名 -> 索引する正規化済みの列
+SEARCH_COLUMNS = {"full_prompt": "search_prompt", "negative_prompt": "search_negative"}
+
+CREATE_FTS = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    search_prompt,
+    search_negative,
+    content='civitai_prompts',
+    content_rowid='id',
+    tokenize="unicode61 remove_diacritics 2",
+    prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS civitai_prompts_fts_ai AFTER INSERT ON civitai_prompts BEGIN
+    INSERT INTO {FTS_TABLE}(rowid, search_prompt, search_negative)
+    VALUES (new.id, new.search_prompt, new.search_negative);
+END;
+CREATE TRIGGER IF NOT EXISTS civitai_prompts_fts_ad AFTER DELETE ON civitai_prompts BEGIN
+    INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_prompt, search_negative)
+    VALUES ('delete', old.id, old.search_prompt, old.search_negative);
+END;
+CREATE TRIGGER IF NOT EXISTS civitai_prompts_fts_au AFTER UPDATE OF search_prompt, search_negative ON civitai_prompts BEGIN
+    INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_prompt, search_negative)
+    VALUES ('delete', old.id, old.search_prompt, old.search_negative);
+    INSERT INTO {FTS_TABLE}(rowid, search_prompt, search_negative)
+    VALUES (new.id, new.search_prompt, new.search_negative);
+END;
+"""
+
+DROP_FTS = f"""
+DROP TRIGGER IF EXISTS civitai_prompts_fts_ai;
+DROP TRIGGER IF EXISTS civitai_prompts_fts_ad;
+DROP TRIGGER IF EXISTS civitai_prompts_fts_au;
+DROP TABLE IF EXISTS {FTS_TABLE};
+"""
+
+# bm25 の列の重み（full_prompt を重視）
+BM25_WEIGHTS = (1.0, 0.3)
+_COLUMNS = {"full_prompt": 0, "negative_prompt": 1}
+
+
+def search_text(text: str) -> str:
+    """索引用の正規化済みテキスト（タグを ", " で連結）"""
+    return ", ".join(parse_tags(text))
+
+
+def create_fts(conn: sqlite3.Connection):
+    """
+    正規化済みの列・FTS 表・同期トリガを作る。
+    列を追加したとき、または FTS 表が無い・旧定義（full_prompt を直接索引）のときは既存行から組み立て直す。
+    """
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(civitai_prompts)")]
+    added = [c for c in SEARCH_COLUMNS.values() if c not in cols]
+    for col in added:
+        conn.execute(f"ALTER TABLE civitai_prompts ADD COLUMN {col} TEXT")
+    fts_cols = [r[1] for r in conn.execute(f"PRAGMA table_info({FTS_TABLE})")]
+    rebuild = fts_cols != list(SEARCH_COLUMNS.values())
+    if rebuild:
+        # トリガを外してから埋めると、行ごとの索引更新をせずに最後にまとめて作れる
+        conn.executescript(DROP_FTS)
+    if added or rebuild:
+        backfill_search_text(conn)
+    conn.executescript(CREATE_FTS)
+    if rebuild:
+        rebuild_fts(conn)
+
+
+def backfill_search_text(conn: sqlite3.Connection, chunk_size: int = 5000) -> int:
+    """search_prompt が NULL の行に正規化済みテキストを入れる。返却: 更新件数"""
+    done, last = 0, 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, full_prompt, negative_prompt FROM civitai_prompts "
+            "WHERE id > ? AND search_prompt IS NULL ORDER BY id LIMIT ?",
+            (last, chunk_size),
+        ).fetchall()
+        if not rows:
+            return done
+        with conn:
+            conn.executemany(
+                "UPDATE civitai_prompts SET search_prompt = ?, search_negative = ? WHERE id = ?",
+                [(search_text(p), search_text(n), pid) for pid, p, n in rows],
+            )
+        last = rows[-1][0]
+        done += len(rows)
+
+
+def rebuild_fts(conn: sqlite3.Connection):
+    with conn:
+        conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def build_match_query(query: str) -> str:
+    """'silver hair, (blue eyes:1.2), castl*' -> '"silver hair" AND "blue eyes" AND "castl"*'"""
+    terms = []
+    for raw in query.split(","):
+        prefix = raw.strip().endswith("*")
+        tag = normalize_tag(raw.strip().rstrip("*"))
+        # FTS5 の演算子として解釈されないよう、トークンだけを残してフレーズにする
+        words = re.findall(r"\w+", tag)
+        if words:
+            terms.append('"' + " ".join(words) + '"' + ("*" if prefix else ""))
+    return " AND ".join(terms)
+
+
+def search_prompts(conn: sqlite3.Connection, query: str, limit: int = 20, model_id: Optional[str] = None,
+                   column: Optional[str] = None, raw: bool = False, snippet_tokens: int = 12) -> List[Dict]:
+    """
+    全文検索して関連度順（bm25、小さいほど上位）に返す。
+    - query: カンマ区切りのタグ。raw=True のときは FTS5 のクエリ構文をそのまま使う
+    - column: "full_prompt" / "negative_prompt" で検索列を限定
+    返却: [{"id", "civitai_id", "model_name", "model_id", "rank", "snippet"}, ...]
+    """
+    match = query if raw else build_match_query(query)
+    if not match:
+        return []
+    if column is not None:
+        if column not in _COLUMNS:
+            raise ValueError(f"unknown column: {column}")
+        match = f"{SEARCH_COLUMNS[column]} : ({match})"
+    snippet_col = _COLUMNS.get(column, -1)
+    sql = (
+        f"SELECT p.id, p.civitai_id, p.model_name, p.model_id, bm25({FTS_TABLE}, ?, ?) AS rank, "
+        f"snippet({FTS_TABLE}, ?, '[', ']', '…', ?) "
+        f"FROM {FTS_TABLE} JOIN civitai_prompts p ON p.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH ?"
+    )
+    params: list = [*BM25_WEIGHTS, snippet_col, snippet_tokens, match]
+    if model_id is not None:
+        sql += " AND p.model_id = ?"
+        params.append(str(model_id))
+    sql += " ORDER BY rank LIMIT ?"
+    params.append(limit)
+    return [
+        {"id": r[0], "civitai_id": r[1], "model_name": r[2], "model_id": r[3], "rank": r[4], "snippet": r[5]}
+        for r in conn.execute(sql, params)
+    ]
@@ -0,0 +1,100 @@
+"""
+JSON のエンコード/デコードを 1 か所にまとめた層。
+
+- msgspec / orjson がインストールされていればそれを使い、無ければ標準の json にフォールバックする
+  （COLLECTOR_JSON_BACKEND=msgspec|orjson|json で固定も可）
+- decode_page はレスポンス本文の bytes を直接デコードする。msgspec のときは各 item の元の bytes も
+  RawItem.raw として残し、raw_metadata に再エンコードせずそのまま使えるようにする
+- 出力はどのバックエンドでも UTF-8 のまま（ensure_ascii=False 相当）
+"""
+import json
+import os
+from typing import Any, List, Optional, Tuple, Union
+
+
+class RawItem(dict):
+    """API の item（dict）に、レスポンス中の元の JSON バイト列を持たせたもの"""
+    __slots__ = ("raw",)
+
+    def __init__(self, data, raw: Optional[bytes] = None):
+        super().__init__(data)
+        self.raw = raw
+
+
+def _select_backend() -> str:
+    wanted = os.getenv("COLLECTOR_JSON_BACKEND")
+    for name in ([wanted] if wanted else ["msgspec", "orjson"]):
+        if name == "json":
+            return name
+        try:
+            __import__(name)
+            return name
+        except ImportError:
+            continue
+    return "json"
+
+
+BACKEND = _select_backend()
+
+# 壊れた本文を読んだときに decode_page / loads が投げる例外
+# （orjson / json の JSONDecodeError は ValueError のサブクラス。msgspec は独自の DecodeError）
+DECODE_ERRORS: Tuple[type, ...] = (ValueError,)
+
+if BACKEND == "msgspec":
+    import msgspec
+
+    _decoder = msgspec.json.Decoder()
+    _encoder = msgspec.json.Encoder()
+
+    class _Page(msgspec.Struct):
+        items: List[msgspec.Raw] = []
+        metadata: dict = {}
+
+    _raw_page_decoder = msgspec.json.Decoder(type=_Page)
+    DECODE_ERRORS = (ValueError, msgspec.DecodeError)
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return _decoder.decode(data)
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return _encoder.encode(obj)
+
+elif BACKEND == "orjson":
+    import orjson
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+else:
+    def loads(data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def dumps(obj: Any) -> str:
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def decode_page(body: Union[bytes, str]) -> Tuple[list, dict]:
+    """
+    /images のレスポンス本文を (items, metadata) にする。
+    msgspec のときは items の各要素が RawItem で、.raw に元の bytes を持つ。
+    """
+    if BACKEND == "msgspec":
+        page = _raw_page_decoder.decode(body)
+        return [RawItem(_decoder.decode(r), bytes(r)) for r in page.items], page.metadata or {}
+    data = loads(body)
+    if not isinstance(data, dict):
+        raise ValueError(f"unexpected page body: {type(data).__name__}")
+    return data.get("items", []) or [], data.get("metadata", {}) or {}
+
+
+def item_bytes(item: dict) -> bytes:
+    """raw_metadata 用の JSON バイト列（元の bytes があればそれを再利用する）"""
+    raw = getattr(item, "raw", None)
+    return raw if raw is not None else dumps_bytes(item)
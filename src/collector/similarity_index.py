@@ -0,0 +1,246 @@
+"""
+保存済みプロンプトの類似検索用インデックス（IVF: k-means の粗い量子化 + 転置リスト）。
+
+- ベクトルは EmbeddingStore の memmap（DB 横の .vec）をそのまま使い、複製しない
+- クラスタ重心は DB 横の <stem>.<model>.ivf.npy、転置リスト（prompt -> リスト番号）は SQLite の ann_postings
+- 新規・変更行は update で最寄りの重心のリストに追記する（件数が学習時の数倍になったら作り直す）
+- 検索は近い nprobe 個のリストの候補だけをコサイン類似度で並べる
+
+    python -m collector.similarity_index --db civitai_dataset.db build
+    python -m collector.similarity_index --db civitai_dataset.db search "1girl, silver hair, night city" -k 10
+"""
+import argparse
+import os
+import re
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .embedding_store import EmbeddingStore, normalize_prompt, prompt_hash
+
+CREATE_ANN_TABLES = """
+CREATE TABLE IF NOT EXISTS ann_indexes (
+    model_name TEXT PRIMARY KEY,
+    nlist INTEGER NOT NULL,
+    n_trained INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ann_postings (
+    model_name TEXT NOT NULL,
+    prompt_id INTEGER NOT NULL,
+    civitai_id TEXT,
+    content_hash TEXT,
+    emb_row INTEGER NOT NULL,
+    list_id INTEGER NOT NULL,
+    PRIMARY KEY (model_name, prompt_id)
+);
+CREATE INDEX IF NOT EXISTS idx_ann_postings_list ON ann_postings(model_name, list_id);
+"""
+
+DEFAULT_NPROBE = 16
+DEFAULT_CHUNK_SIZE = 10_000
+# 重心の学習に使う最大件数
+MAX_TRAIN = 100_000
+# 件数が学習時のこの倍数を超えたら update で作り直す
+REBUILD_GROWTH = 4
+
+
+def default_nlist(n: int) -> int:
+    return max(1, min(n, 65536, int(4 * np.sqrt(n))))
+
+
+def _unit_rows(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+class SimilarityIndex:
+    """
+    civitai_prompts の full_prompt に対する永続 IVF インデックス。
+    encode 省略時は embeddings.embed_texts(model_name=model_name) で埋め込む。
+    """
+
+    def __init__(self, db_path: str, model_name: str = "all-mpnet-base-v2",
+                 encode: Optional[Callable[[List[str]], np.ndarray]] = None, index_path: Optional[str] = None):
+        self.store = EmbeddingStore(db_path, model_name=model_name)
+        self.conn = self.store.conn
+        self.conn.executescript(CREATE_ANN_TABLES)
+        self.model_name = model_name
+        self.encode = encode
+        if index_path is None:
+            slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+            index_path = str(Path(db_path).with_suffix("")) + f".{slug}.ivf.npy"
+        self.index_path = index_path
+        self._centroids = None
+
+    def close(self):
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- 内部 ---
+    def _embed_rows(self, texts: Sequence[str]) -> List[int]:
+        """texts を埋め込みキャッシュに載せ、それぞれの .vec 行番号を返す"""
+        self.store.get_or_compute(list(texts), encode=self.encode)
+        hashes = [prompt_hash(t) for t in texts]
+        found = self.store.lookup(set(hashes))
+        return [found[h] for h in hashes]
+
+    def _iter_prompts(self, only_pending: bool, chunk_size: int):
+        """(id, civitai_id, full_prompt, content_hash) を id 順にチャンクで返す。only_pending は未登録・内容変更分のみ"""
+        if only_pending:
+            sql = (
+                "SELECT p.id, p.civitai_id, p.full_prompt, p.content_hash FROM civitai_prompts p "
+                "LEFT JOIN ann_postings a ON a.model_name = ? AND a.prompt_id = p.id "
+                "WHERE p.id > ? AND (a.prompt_id IS NULL OR a.content_hash IS NOT p.content_hash) "
+                "ORDER BY p.id LIMIT ?"
+            )
+            params = (self.model_name,)
+        else:
+            sql = "SELECT id, civitai_id, full_prompt, content_hash FROM civitai_prompts WHERE id > ? ORDER BY id LIMIT ?"
+            params = ()
+        last = 0
+        while True:
+            rows = self.conn.execute(sql, (*params, last, chunk_size)).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield rows
+
+    def centroids(self) -> Optional[np.ndarray]:
+        if self._centroids is None and os.path.exists(self.index_path):
+            self._centroids = np.load(self.index_path)
+        return self._centroids
+
+    def _assign(self, emb_rows: Sequence[int]) -> np.ndarray:
+        vecs = _unit_rows(self.store.vectors()[np.asarray(emb_rows)])
+        return np.argmax(vecs @ self.centroids().T, axis=1)
+
+    def _write_postings(self, rows, emb_rows, list_ids):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO ann_postings (model_name, prompt_id, civitai_id, content_hash, emb_row, list_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.model_name, r[0], r[1], r[3], int(e), int(l)) for r, e, l in zip(rows, emb_rows, list_ids)],
+            )
+
+    # --- 構築・追加 ---
+    def build(self, nlist: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE, seed: int = 42) -> int:
+        """全件を埋め込み、重心を学習して転置リストを作り直す。返却: 登録件数"""
+        from sklearn.cluster import MiniBatchKMeans
+
+        chunks = []
+        for rows in self._iter_prompts(only_pending=False, chunk_size=chunk_size):
+            emb_rows = self._embed_rows([r[2] or "" for r in rows])
+            # 本文は埋め込み後は不要なので保持しない
+            chunks.append(([(r[0], r[1], None, r[3]) for r in rows], emb_rows))
+        n = sum(len(rows) for rows, _ in chunks)
+        with self.conn:
+            self.conn.execute("DELETE FROM ann_postings WHERE model_name = ?", (self.model_name,))
+        if not n:
+            return 0
+
+        all_rows = np.concatenate([np.asarray(e) for _, e in chunks])
+        nlist = min(nlist or default_nlist(n), n)
+        rng = np.random.default_rng(seed)
+        train = np.sort(rng.choice(all_rows, size=min(n, MAX_TRAIN), replace=False))
+        km = MiniBatchKMeans(n_clusters=nlist, random_state=seed, batch_size=4096, n_init=3)
+        km.fit(_unit_rows(self.store.vectors()[train]))
+        self._centroids = _unit_rows(km.cluster_centers_)
+        tmp = self.index_path + ".tmp.npy"
+        np.save(tmp, self._centroids)
+        os.replace(tmp, self.index_path)
+
+        for rows, emb_rows in chunks:
+            self._write_postings(rows, emb_rows, self._assign(emb_rows))
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ann_indexes (model_name, nlist, n_trained) VALUES (?, ?, ?)",
+                (self.model_name, nlist, n),
+            )
+        print(f"[similarity_index] built {n} prompts into {nlist} lists")
+        return n
+
+    def update(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """未登録・内容が変わった行だけを追加する。返却: 追加件数"""
+        meta = self.conn.execute("SELECT n_trained FROM ann_indexes WHERE model_name = ?", (self.model_name,)).fetchone()
+        if meta is None or self.centroids() is None:
+            return self.build(chunk_size=chunk_size)
+        added = 0
+        for rows in self._iter_prompts(only_pending=True, chunk_size=chunk_size):
+            emb_rows = self._embed_rows([r[2] or "" for r in rows])
+            self._write_postings(rows, emb_rows, self._assign(emb_rows))
+            added += len(rows)
+        total = self.conn.execute("SELECT COUNT(*) FROM ann_postings WHERE model_name = ?", (self.model_name,)).fetchone()[0]
+        if total > REBUILD_GROWTH * meta[0]:
+            print(f"[similarity_index] {total} prompts vs {meta[0]} trained, rebuilding")
+            self.build(chunk_size=chunk_size)
+        return added
+
+    # --- 検索 ---
+    def search_similar(self, text: str, k: int = 10, nprobe: int = DEFAULT_NPROBE) -> List[Tuple[str, float]]:
+        """text に近い保存済みプロンプトを [(civitai_id, コサイン類似度), ...] の降順で返す"""
+        centroids = self.centroids()
+        if centroids is None:
+            raise RuntimeError("similarity index is not built; run build first")
+        if self.encode is None:
+            from .embeddings import embed_texts
+            q = embed_texts([normalize_prompt(text)], model_name=self.model_name)
+        else:
+            q = self.encode([normalize_prompt(text)])
+        q = _unit_rows(np.asarray(q).reshape(1, -1))[0]
+
+        nprobe = min(nprobe, len(centroids))
+        probe = np.argpartition(-(centroids @ q), nprobe - 1)[:nprobe]
+        placeholders = ",".join("?" * len(probe))
+        cand = self.conn.execute(
+            f"SELECT emb_row, civitai_id FROM ann_postings WHERE model_name = ? AND list_id IN ({placeholders}) "
+            "ORDER BY emb_row",
+            [self.model_name, *map(int, probe)],
+        ).fetchall()
+        if not cand:
+            return []
+        emb_rows = np.array([c[0] for c in cand])
+        scores = _unit_rows(self.store.vectors()[emb_rows]) @ q
+        top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(cand[i][1], float(scores[i])) for i in top]
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="保存済みプロンプトの類似検索インデックス")
+    p.add_argument("--db", default="civitai_dataset.db")
+    p.add_argument("--model", default="all-mpnet-base-v2")
+    sub = p.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="全件からインデックスを作り直す")
+    b.add_argument("--nlist", type=int, default=None)
+    sub.add_parser("update", help="新規・変更行だけを追加する")
+    s = sub.add_parser("search", help="類似プロンプトを検索する")
+    s.add_argument("text")
+    s.add_argument("-k", type=int, default=10)
+    s.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE)
+    args = p.parse_args(argv)
+
+    with SimilarityIndex(args.db, model_name=args.model) as index:
+        if args.command == "build":
+            index.build(nlist=args.nlist)
+        elif args.command == "update":
+            print(f"[similarity_index] added {index.update()} prompts")
+        else:
+            start = time.perf_counter()
+            hits = index.search_similar(args.text, k=args.k, nprobe=args.nprobe)
+            elapsed = (time.perf_counter() - start) * 1000
+            for civitai_id, score in hits:
+                print(f"{score:.4f}\t{civitai_id}")
+            print(f"[similarity_index] {len(hits)} hits in {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
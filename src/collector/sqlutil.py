@@ -0,0 +1,13 @@
+"""
+SQLite まわりで複数のモジュールが使う小さな共通処理。
+"""
+from typing import Iterator, Sequence
+
+# SQLite のバインド変数上限（古いビルドは 999）に収まるよう IN 句を分割するサイズ
+IN_CHUNK = 500
+
+
+def chunked(seq: Sequence, size: int = IN_CHUNK) -> Iterator[Sequence]:
+    """IN 句に渡す値の列を size 件ずつに分ける"""
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
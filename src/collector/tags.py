@@ -0,0 +1,146 @@
+"""
+プロンプトのタグ正規化と、タグ -> プロンプトの転置テーブル。
+
+- (masterpiece:1.2) / ((best quality)) / [foo] / {bar} の括弧・重みを外し、<lora:...> などの埋め込み指定と BREAK は捨てる
+- 小文字化・アンダースコアを空白に・空白の圧縮。\\( \\) でエスケープされた括弧はタグ名の一部として残す
+- tags(id, name) にタグを 1 度だけ登録し、prompt_tags(tag_id, prompt_id, model_id, position) に出現を持つ
+
+    python -m collector.tags --db civitai_dataset.db   # 既存 DB の prompt_tags を作り直して頻出タグを表示
+"""
+import argparse
+import re
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .sqlutil import chunked
+
+CREATE_TAG_TABLES = """
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS prompt_tags (
+    tag_id INTEGER NOT NULL,
+    prompt_id INTEGER NOT NULL,
+    model_id TEXT,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (tag_id, prompt_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_prompt_tags_prompt ON prompt_tags(prompt_id);
+CREATE INDEX IF NOT EXISTS idx_prompt_tags_model_tag ON prompt_tags(model_id, tag_id);
+"""
+
+_EXTRA_NETWORK = re.compile(r"<[^<>]*>")
+_WEIGHT = re.compile(r":\s*-?\d+(?:\.\d+)?\s*$")
+_BRACKETS = re.compile(r"[()\[\]{}]")
+_ESCAPED_OPEN, _ESCAPED_CLOSE = "\x00", "\x01"
+
+
+def normalize_tag(tag: str) -> str:
+    """1 つのタグを正規化する（空文字列になったら捨てる対象）"""
+    tag = tag.replace("\\(", _ESCAPED_OPEN).replace("\\)", _ESCAPED_CLOSE)
+    tag = _EXTRA_NETWORK.sub(" ", tag)
+    tag = _BRACKETS.sub(" ", tag)
+    tag = _WEIGHT.sub("", tag.strip())
+    tag = tag.replace(_ESCAPED_OPEN, "(").replace(_ESCAPED_CLOSE, ")")
+    tag = re.sub(r"\s+", " ", tag.replace("_", " ")).strip().lower()
+    return "" if tag == "break" else tag
+
+
+def parse_tags(text: str) -> List[str]:
+    """カンマ・改行区切りのプロンプトを正規化済みタグのリストにする（出現順・重複なし）"""
+    seen: Dict[str, None] = {}
+    for raw in re.split(r"[,\n]|\bBREAK\b", text or ""):
+        tag = normalize_tag(raw)
+        if tag:
+            seen.setdefault(tag, None)
+    return list(seen)
+
+
+def create_tables(conn: sqlite3.Connection):
+    conn.executescript(CREATE_TAG_TABLES)
+
+
+def intern_tags(conn: sqlite3.Connection, names: Iterable[str]) -> Dict[str, int]:
+    """タグ名 -> tags.id（未登録のものは追加する）"""
+    names = sorted(set(names))
+    conn.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", [(n,) for n in names])
+    ids: Dict[str, int] = {}
+    for chunk in chunked(names):
+        ids.update(conn.execute(
+            f"SELECT name, id FROM tags WHERE name IN ({','.join('?' * len(chunk))})", list(chunk)
+        ).fetchall())
+    return ids
+
+
+def store_prompt_tags(conn: sqlite3.Connection, items: Sequence[Tuple[int, Optional[str], Sequence[str]]]):
+    """items: [(prompt_id, model_id, タグのリスト), ...] で prompt_tags を置き換える（呼び出し側のトランザクション内）"""
+    conn.executemany("DELETE FROM prompt_tags WHERE prompt_id = ?", [(pid,) for pid, _, _ in items])
+    ids = intern_tags(conn, (t for _, _, tags in items for t in tags))
+    conn.executemany(
+        "INSERT OR IGNORE INTO prompt_tags (tag_id, prompt_id, model_id, position) VALUES (?, ?, ?, ?)",
+        [(ids[t], pid, model_id, pos) for pid, model_id, tags in items for pos, t in enumerate(tags)],
+    )
+
+
+def prompts_with_tag(conn: sqlite3.Connection, tag: str, model_id: Optional[str] = None,
+                     limit: Optional[int] = None) -> List[int]:
+    """正規化後に tag と一致するタグを含むプロンプトの id（model_id 指定でそのモデルに限定）"""
+    sql = "SELECT pt.prompt_id FROM prompt_tags pt JOIN tags t ON t.id = pt.tag_id WHERE t.name = ?"
+    params: list = [normalize_tag(tag)]
+    if model_id is not None:
+        sql += " AND pt.model_id = ?"
+        params.append(str(model_id))
+    sql += " ORDER BY pt.prompt_id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return [r[0] for r in conn.execute(sql, params)]
+
+
+def tag_frequencies(conn: sqlite3.Connection, model_id: Optional[str] = None, limit: int = 50) -> List[Tuple[str, int]]:
+    """[(タグ名, 出現プロンプト数), ...] を多い順に返す"""
+    if model_id is None:
+        sql = ("SELECT t.name, c.cnt FROM (SELECT tag_id, COUNT(*) AS cnt FROM prompt_tags GROUP BY tag_id) c "
+               "JOIN tags t ON t.id = c.tag_id ORDER BY c.cnt DESC, t.name LIMIT ?")
+        params: list = [limit]
+    else:
+        sql = ("SELECT t.name, c.cnt FROM (SELECT tag_id, COUNT(*) AS cnt FROM prompt_tags WHERE model_id = ? "
+               "GROUP BY tag_id) c JOIN tags t ON t.id = c.tag_id ORDER BY c.cnt DESC, t.name LIMIT ?")
+        params = [str(model_id), limit]
+    return conn.execute(sql, params).fetchall()
+
+
+def rebuild_prompt_tags(conn: sqlite3.Connection, chunk_size: int = 5000) -> int:
+    """既存の civitai_prompts から prompt_tags を作り直す（id 順のチャンクごとに 1 トランザクション）"""
+    create_tables(conn)
+    last, done = 0, 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, model_id, full_prompt FROM civitai_prompts WHERE id > ? ORDER BY id LIMIT ?", (last, chunk_size)
+        ).fetchall()
+        if not rows:
+            return done
+        with conn:
+            store_prompt_tags(conn, [(pid, model_id, parse_tags(text)) for pid, model_id, text in rows])
+        last = rows[-1][0]
+        done += len(rows)
+        print(f"[tags] indexed {done} prompts")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="既存 DB のタグ転置テーブルを作り直す")
+    p.add_argument("--db", default="civitai_dataset.db")
+    p.add_argument("--top", type=int, default=20, help="表示する頻出タグの数")
+    args = p.parse_args(argv)
+    conn = sqlite3.connect(args.db)
+    try:
+        rebuild_prompt_tags(conn)
+        for name, cnt in tag_frequencies(conn, limit=args.top):
+            print(f"{cnt}\t{name}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,54 @@
 import sqlite3
 import matplotlib.pyplot as plt
-from typing import List, Optional
+from typing import Dict, List, Optional
 
-def _load_counts(db_path: str, models_to_plot: Optional[List[str]] = None):
+from .category_counts import SPLIT_COUNT_SQL, has_simple, load_simple_counts
+
+def _load_counts(db_path: str, models_to_plot: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+    """
+    {model_id: {category: 件数}} を返す。models_to_plot（model_id のリスト）を渡すとそのモデルだけを集計する。
+    simple_category_counts があればそれを、無ければ prompts を SQL で分割・集計する（どちらも Python 側で全行を読まない）
+    """
     conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT categories FROM prompts")
-    rows = cur.fetchall()
-    conn.close()
-    counts = {}
-    for (cats,) in rows:
-        if not cats:
-            continue
-        for c in cats.split(","):
-            counts[c] = counts.get(c, 0) + 1
+    try:
+        if has_simple(conn):
+            rows = load_simple_counts(conn, models=models_to_plot)
+        else:
+            params: list = []
+            flt = ""
+            if models_to_plot is not None:
+                flt = f"AND model_id IN ({','.join('?' * len(models_to_plot))})"
+                params = [str(m) for m in models_to_plot]
+            rows = conn.execute(SPLIT_COUNT_SQL.format(filter=flt), params).fetchall()
+    finally:
+        conn.close()
+    counts: Dict[str, Dict[str, int]] = {}
+    for model_id, category, cnt in rows:
+        counts.setdefault(model_id or "Unknown", {})[category] = cnt
     return counts
 
 def visualize_category_distribution(db_path: str, models_to_plot: Optional[List[str]] = None, normalize_percent: bool = True, show: bool = True):
+    """model_id ごとのカテゴリ分布を積み上げ棒グラフで表示し、{model_id: {category: 件数}} を返す"""
     counts = _load_counts(db_path, models_to_plot)
     if not counts:
         print("可視化対象のデータが見つかりません")
         return counts
-    labels = list(counts.keys())
-    values = list(counts.values())
-    if normalize_percent:
-        total = sum(values)
-        values = [v * 100.0 / total for v in values]
-        ylabel = "割合 (%)"
-    else:
-        ylabel = "件数"
-    plt.figure(figsize=(8, 4))
-    plt.bar(labels, values)
+    models = [str(m) for m in models_to_plot if str(m) in counts] if models_to_plot is not None else sorted(counts)
+    categories = sorted({c for per_model in counts.values() for c in per_model})
+    plt.figure(figsize=(max(6, len(models) * 1.2), 4))
+    bottoms = [0.0] * len(models)
+    for cat in categories:
+        values = []
+        for m in models:
+            v = counts[m].get(cat, 0)
+            total = sum(counts[m].values())
+            values.append(v * 100.0 / total if normalize_percent and total else v)
+        plt.bar(models, values, bottom=bottoms, label=cat)
+        bottoms = [b + v for b, v in zip(bottoms, values)]
     plt.xticks(rotation=45, ha="right")
-    plt.ylabel(ylabel)
+    plt.ylabel("割合 (%)" if normalize_percent else "件数")
     plt.title("カテゴリ分布")
+    plt.legend(fontsize="small", bbox_to_anchor=(1.02, 1), loc="upper left")
     plt.tight_layout()
     if show:
         plt.show()
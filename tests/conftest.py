@@ -5,3 +5,19 @@ import sys
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
+
+import pytest
+
+
+def _api_item(i, prompt="masterpiece, best quality, portrait, cinematic lighting", negative=None,
+              model="test-model", model_id=42, stats=None):
+    """/images の 1 項目を模した dict（extract_prompt_data にそのまま渡せる）"""
+    meta = {"prompt": prompt, "Model": model}
+    if negative is not None:
+        meta["negativePrompt"] = negative
+    return {"id": i, "modelId": model_id, "meta": meta, "stats": stats or {}}
+
+
+@pytest.fixture
+def api_item():
+    return _api_item
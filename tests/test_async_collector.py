@@ -0,0 +1,45 @@
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector.civitai_collector_v8 import CivitaiPromptCollector
+from collector.async_collector import AsyncCollectionEngine
+from collector.ratelimit import AdaptiveRateLimiter
+
+
+def _page(model_id, start, n):
+    return [
+        {"id": f"{model_id}-{i}", "modelId": model_id, "meta": {"prompt": f"portrait, masterpiece {i}"}, "stats": {}}
+        for i in range(start, start + n)
+    ]
+
+
+def test_engine_collects_models_concurrently(tmp_path):
+    c = CivitaiPromptCollector(db_path=str(tmp_path / "async.db"))
+
+    def fake_fetch(url_or_params, max_retries=3):
+        if isinstance(url_or_params, dict):
+            mid = url_or_params["modelVersionId"]
+            return _page(mid, 0, 3), f"https://civitai.com/next?m={mid}", True
+        mid = url_or_params.rsplit("=", 1)[1]
+        return _page(mid, 3, 3), None, True
+
+    c.fetch_page = fake_fetch
+    c.rate_limiter = AdaptiveRateLimiter(max_rate=1000, initial_rate=1000)
+    engine = AsyncCollectionEngine(c, max_concurrency=2, requests_per_second=1000)
+    res = engine.run({"a": "1", "b": "2"}, max_per_model=5)
+    assert res == {"a": {"collected": 5, "saved": 5}, "b": {"collected": 5, "saved": 5}}
+    assert c._get_conn().execute("SELECT COUNT(*) FROM civitai_prompts").fetchone()[0] == 10
+    c.close()
+
+
+def test_collect_for_models_caps_rate_on_both_paths(tmp_path):
+    c = CivitaiPromptCollector(db_path=str(tmp_path / "rps.db"))
+    c.fetch_page = lambda url_or_params, max_retries=3: ([], None, True)
+    # 逐次（concurrency=1）でも requests_per_second が共有レートリミッターの上限になる
+    c.collect_for_models({"a": "1"}, max_per_model=5, requests_per_second=0.5)
+    assert c.rate_limiter.max_rate == 0.5
+    c.collect_for_models({"a": "1", "b": "2"}, max_per_model=5, concurrency=2, requests_per_second=0.25)
+    assert c.rate_limiter.max_rate == 0.25
+    c.close()
@@ -16,3 +16,11 @@ def test_batch_api_smoke():
     res = categorize_prompts_batch(samples, use_clustering=False)
     assert "keyword" in res
     assert len(res["keyword"]) == 3
+
+def test_summarize_clusters_vectorised():
+    from collector.categorizer import summarize_clusters
+    prompts = ["red dragon castle", "red dragon armor", "blue ocean wave", "blue ocean beach", "random noise text"]
+    out = summarize_clusters(prompts, [0, 0, 1, 1, -1], top_n=2, ngram_range=(1, 1))
+    assert out[-1] == "noise"
+    assert set(out[0].split(", ")) == {"dragon", "red"}
+    assert set(out[1].split(", ")) == {"blue", "ocean"}
@@ -0,0 +1,106 @@
+import sqlite3
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector import category_counts, schema
+from collector.civitai_collector_v8 import CivitaiPromptCollector
+from collector.collector import CivitaiPromptCollector as WrapperCollector
+from collector.db import init_db, save_prompt
+from collector.recategorize import recategorize
+from collector.visualizer import _load_counts
+
+BASE = "masterpiece, best quality, 1girl, silver hair, blue eyes, school uniform, cherry blossoms, " \
+       "depth of field, cinematic lighting, ultra detailed"
+
+
+def _from_scratch(conn):
+    return sorted(conn.execute(
+        "SELECT p.model_name, c.category, COUNT(*), SUM(p.group_id IS NULL OR p.group_id = p.id) "
+        "FROM civitai_prompts p JOIN prompt_categories c ON p.id = c.prompt_id GROUP BY 1, 2"
+    ).fetchall())
+
+
+def _maintained(conn):
+    unique = dict(((m, c), n) for m, c, n in category_counts.load_counts(conn, unique=True))
+    return sorted((m, c, n, unique.get((m, c), 0)) for m, c, n in category_counts.load_counts(conn))
+
+
+def test_v8_counts_follow_every_write(api_item, tmp_path):
+    db = str(tmp_path / "v8.db")
+    c = CivitaiPromptCollector(db_path=db)
+    conn = c._get_conn()
+    c.save_prompt_batch([c.extract_prompt_data(api_item(1, BASE + ", smile")),
+                         c.extract_prompt_data(api_item(2, "anime, nude", model="m2", model_id=2))])
+    # ほぼ同じプロンプト（別グループの代表にはならない）・モデル名の変更・本文の変更
+    c.save_prompt_batch([c.extract_prompt_data(api_item(3, BASE + ", wink")),
+                         c.extract_prompt_data(api_item(2, "photorealistic, portrait", model="m3", model_id=3))])
+    assert _maintained(conn) == _from_scratch(conn)
+    assert dict(((m, cat), u) for m, cat, n, u in _maintained(conn))[("test-model", "technical")] == 1
+    c.close()
+
+    recategorize(db, schema="v8", workers=1)
+    conn = sqlite3.connect(db)
+    assert _maintained(conn) == _from_scratch(conn)
+    with conn:
+        conn.execute("DELETE FROM civitai_prompts WHERE civitai_id = '1'")
+        conn.execute("DELETE FROM prompt_categories WHERE prompt_id NOT IN (SELECT id FROM civitai_prompts)")
+    assert _maintained(conn) == _from_scratch(conn)
+    conn.close()
+
+
+def _downgrade_to_v1(db):
+    """category_counts が入る前（user_version 1）の v8 DB にする"""
+    conn = sqlite3.connect(db)
+    conn.executescript("DROP TRIGGER category_counts_ai; DROP TRIGGER category_counts_ad; "
+                       "DROP TRIGGER category_counts_prompt_au; DROP TRIGGER category_counts_prompt_bd; "
+                       "DROP TABLE category_counts; PRAGMA user_version = 1;")
+    conn.close()
+
+
+def test_existing_v8_db_is_backfilled(api_item, tmp_path):
+    db = str(tmp_path / "v8.db")
+    c = CivitaiPromptCollector(db_path=db)
+    c.save_prompt_batch([c.extract_prompt_data(api_item(1, "anime, nude"))])
+    c.close()
+    _downgrade_to_v1(db)
+    c = CivitaiPromptCollector(db_path=db)
+    assert schema.schema_version(c._get_conn()) == schema.SCHEMA_VERSION
+    assert _maintained(c._get_conn()) == _from_scratch(c._get_conn()) != []
+    c.close()
+
+
+def test_wrapper_counts_existing_v8_data_and_bulk_writers_keep_it(api_item, tmp_path):
+    db = str(tmp_path / "v8.db")
+    c = CivitaiPromptCollector(db_path=db)
+    c.save_prompt_batch([c.extract_prompt_data(api_item(i, BASE if i % 2 else "anime, nude")) for i in range(1, 6)])
+    c.close()
+    _downgrade_to_v1(db)
+
+    # 簡易スキーマの init_db が先に走っても v8 の集計は既存データから組み立てられる
+    w = WrapperCollector(db_path=db)
+    conn = w._v8._get_conn()
+    assert _maintained(conn) == _from_scratch(conn) != []
+    # 簡易スキーマの一括更新は v8 の集計に触れない
+    save_prompt(conn, {"id": "x", "model_id": "1", "prompt": "p", "categories": "style"})
+    recategorize(db, schema="simple", workers=1)
+    assert _maintained(conn) == _from_scratch(conn) != []
+    assert sorted(category_counts.load_simple_counts(conn)) == \
+        sorted(conn.execute(category_counts.SPLIT_COUNT_SQL.format(filter="")).fetchall())
+    w._v8.close()
+
+
+def test_simple_schema_deltas(tmp_path):
+    db = str(tmp_path / "simple.db")
+    init_db(db)
+    conn = sqlite3.connect(db)
+    save_prompt(conn, {"id": "a", "model_id": "1", "prompt": "p", "categories": "style,nsfw_safe"})
+    save_prompt(conn, {"id": "b", "model_id": "1", "prompt": "p", "categories": "style|cluster:2"})
+    save_prompt(conn, {"id": "a", "model_id": "2", "prompt": "p", "categories": "style"})
+    assert sorted(category_counts.load_simple_counts(conn)) == [("1", "style", 1), ("2", "style", 1)]
+    conn.execute("DELETE FROM simple_category_counts")
+    category_counts.rebuild_simple(conn)
+    assert sorted(category_counts.load_simple_counts(conn)) == [("1", "style", 1), ("2", "style", 1)]
+    conn.close()
+    assert _load_counts(db) == {"1": {"style": 1}, "2": {"style": 1}}
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector.cluster_model import ClusterModel
+
+
+def _blobs(n=60, seed=0):
+    rng = np.random.default_rng(seed)
+    a = rng.normal([1, 0, 0, 0], 0.05, size=(n, 4))
+    b = rng.normal([0, 1, 0, 0], 0.05, size=(n, 4))
+    return np.vstack([a, b]).astype(np.float32)
+
+
+def test_nearest_centroid_assign_and_drift(tmp_path):
+    model = ClusterModel(
+        reducer=None, clusterer=None,
+        centroids={0: np.array([1, 0, 0, 0.0]), 1: np.array([0, 1, 0, 0.0])},
+        embedding_mean=np.array([0.5, 0.5, 0, 0.0]), noise_ratio=0.0, n_fit=120,
+    )
+    new = np.array([[0.9, 0.1, 0, 0], [0.1, 0.9, 0, 0]], dtype=np.float32)
+    assert model.assign(new).tolist() == [0, 1]
+    assert not model.needs_refit(np.array([0, 1]), new)
+    # 学習時と全く違う方向の埋め込みが来たら再学習
+    far = np.array([[0, 0, 1, 0], [0, 0, 0, 1]], dtype=np.float32)
+    assert model.needs_refit(model.assign(far), far)
+
+    path = str(tmp_path / "m.pkl")
+    model.save(path)
+    assert ClusterModel.load(path).assign(new).tolist() == [0, 1]
+
+
+def test_fit_then_approximate_predict():
+    pytest.importorskip("hdbscan")
+    pytest.importorskip("umap")
+    embs = _blobs()
+    model = ClusterModel.fit(embs, min_cluster_size=5)
+    assert len(model.labels_) == len(embs)
+    labels = model.assign(_blobs(n=5, seed=1))
+    assert len(labels) == 10
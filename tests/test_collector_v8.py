@@ -0,0 +1,205 @@
+import json
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector.civitai_collector_v8 import CivitaiPromptCollector
+
+
+def test_save_prompt_batch_upserts_and_replaces_categories(api_item, tmp_path):
+    c = CivitaiPromptCollector(db_path=str(tmp_path / "v8.db"))
+    rows = [c.extract_prompt_data(api_item(i)) for i in range(5)]
+    res = c.save_prompt_batch(rows)
+    assert res["saved"] == 5
+    assert res["rows_per_sec"] > 0
+
+    # 再保存しても行・カテゴリは重複しない
+    rows[0]["full_prompt"] = "anime, nude"
+    res = c.save_prompt_batch(rows)
+    assert res["saved"] == 5
+    conn = c._get_conn()
+    assert conn.execute("SELECT COUNT(*) FROM civitai_prompts").fetchone()[0] == 5
+    cats = conn.execute(
+        "SELECT c.category FROM prompt_categories c JOIN civitai_prompts p ON p.id = c.prompt_id "
+        "WHERE p.civitai_id = '0' ORDER BY c.category"
+    ).fetchall()
+    assert [r[0] for r in cats] == ["nsfw_explicit", "style"]
+    c.close()
+
+
+def test_save_prompt_data_single_item_memory_db(api_item):
+    c = CivitaiPromptCollector(db_path=":memory:")
+    assert c.save_prompt_data(c.extract_prompt_data(api_item(1))) is True
+    assert c._get_conn().execute("SELECT COUNT(*) FROM civitai_prompts").fetchone()[0] == 1
+
+
+class _FakeResponse:
+    def __init__(self, status_code, payload=None, headers=None):
+        self.status_code = status_code
+        self._payload = payload or {}
+        self.headers = headers or {}
+        self.text = ""
+        self.content = json.dumps(self._payload).encode("utf-8")
+
+    def json(self):
+        return self._payload
+
+
+class _FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None):
+        self.calls.append((url, params))
+        return self.responses.pop(0)
+
+    def close(self):
+        pass
+
+
+def test_fetch_batch_reuses_session_and_retries_429():
+    from collector.ratelimit import AdaptiveRateLimiter
+    c = CivitaiPromptCollector(db_path=":memory:")
+    assert c.session.headers["Accept"] == "application/json"
+    waits = []
+    c.rate_limiter = AdaptiveRateLimiter(sleep=waits.append)
+    c.session = _FakeSession([
+        _FakeResponse(429, headers={"Retry-After": "7"}),
+        _FakeResponse(200, {"items": [{"id": 1}], "metadata": {"nextPage": "https://next"}}),
+    ])
+    items, next_page = c.fetch_batch({"limit": 1})
+    assert items == [{"id": 1}]
+    assert next_page == "https://next"
+    assert len(c.session.calls) == 2
+    assert waits and max(waits) <= 7.0 and max(waits) > 6.0
+
+
+
+def test_fetch_page_retries_non_json_body():
+    from collector.ratelimit import AdaptiveRateLimiter
+    c = CivitaiPromptCollector(db_path=":memory:")
+    waits = []
+    c.rate_limiter = AdaptiveRateLimiter(sleep=waits.append)
+    broken = _FakeResponse(200)
+    broken.content = b"<html>oops"
+    c.session = _FakeSession([broken, _FakeResponse(200, {"items": [{"id": 1}], "metadata": {}})])
+    items, next_page, ok = c.fetch_page({"limit": 1})
+    assert (items, next_page, ok) == ([{"id": 1}], None, True)
+    assert len(c.session.calls) == 2 and len(waits) == 1
+
+    # 何度読んでも壊れていれば失敗として返し、例外は外に出さない
+    c.session = _FakeSession([broken] * 3)
+    assert c.fetch_page({"limit": 1}, max_retries=3) == ([], None, False)
+
+def test_collect_dataset_resumes_from_checkpoint(api_item, tmp_path):
+    db = str(tmp_path / "resume.db")
+    pages = {
+        "p1": ([api_item(i) for i in range(0, 3)], "p2"),
+        "p2": ([api_item(i) for i in range(3, 6)], "p3"),
+        "p3": ([api_item(i) for i in range(6, 9)], None),
+    }
+    calls = []
+
+    def make_fetch(fail_on=None):
+        def fetch(url_or_params, max_retries=3):
+            key = "p1" if isinstance(url_or_params, dict) else url_or_params
+            calls.append(key)
+            if key == fail_on:
+                return [], None, False
+            items, nxt = pages[key]
+            return items, nxt, True
+        return fetch
+
+    c = CivitaiPromptCollector(db_path=db)
+    c.fetch_page = make_fetch(fail_on="p3")
+    res = c.collect_dataset(model_id="42", max_items=100)
+    assert res["saved"] == 6
+    assert c.load_checkpoint("42") == {"next_page": "p3", "collected": 6}
+    c.close()
+
+    # 再起動後は p3 から再開し、完走したらチェックポイントは消える
+    calls.clear()
+    c = CivitaiPromptCollector(db_path=db)
+    c.fetch_page = make_fetch()
+    res = c.collect_dataset(model_id="42", max_items=100)
+    assert calls == ["p3"]
+    assert res == {"collected": 9, "saved": 3}
+    assert c.load_checkpoint("42") is None
+    c.close()
+
+
+
+def test_failed_fetch_keeps_cursor_with_pages_per_commit(api_item, tmp_path):
+    db = str(tmp_path / "resume_ppc.db")
+    pages = {
+        "p1": ([api_item(i) for i in range(0, 3)], "p2"),
+        "p2": ([api_item(i) for i in range(3, 6)], "p3"),
+    }
+
+    def fetch(url_or_params, max_retries=3):
+        key = "p1" if isinstance(url_or_params, dict) else url_or_params
+        if key not in pages:
+            return [], None, False
+        items, nxt = pages[key]
+        return items, nxt, True
+
+    c = CivitaiPromptCollector(db_path=db)
+    c.fetch_page = fetch
+    # p3 の取得に失敗しても、未コミット分の最後のフラッシュで p3 のカーソルが残る
+    res = c.collect_dataset(model_id="42", max_items=100, pages_per_commit=5)
+    assert res["saved"] == 6
+    assert c.load_checkpoint("42") == {"next_page": "p3", "collected": 6}
+    c.close()
+
+def test_incremental_stops_at_known_ids_and_skips_unchanged(api_item, tmp_path):
+    c = CivitaiPromptCollector(db_path=str(tmp_path / "inc.db"))
+    c.save_prompt_batch([c.extract_prompt_data(api_item(i)) for i in range(10, 20)])
+    pages = {
+        "p1": ([api_item(i) for i in range(20, 25)], "p2"),
+        "p2": ([api_item(i) for i in range(15, 20)], "p3"),
+        "p3": ([api_item(i) for i in range(10, 15)], None),
+    }
+    calls = []
+
+    def fetch(url_or_params, max_retries=3):
+        key = "p1" if isinstance(url_or_params, dict) else url_or_params
+        calls.append(url_or_params)
+        items, nxt = pages[key]
+        return items, nxt, True
+
+    c.fetch_page = fetch
+    res = c.collect_dataset(model_id="42", max_items=100, incremental=True)
+    assert calls[0]["sort"] == "Newest"
+    assert calls[1:] == ["p2"]
+    # p2 は本文が同じなので UPSERT されない
+    assert res == {"collected": 10, "saved": 5}
+    c.close()
+
+
+def test_near_duplicate_prompts_share_a_group(api_item, tmp_path):
+    c = CivitaiPromptCollector(db_path=str(tmp_path / "v8.db"))
+    base = "masterpiece, best quality, 1girl, silver hair, blue eyes, school uniform, cherry blossoms, " \
+           "depth of field, cinematic lighting, ultra detailed"
+    c.save_prompt_batch([c.extract_prompt_data(api_item(1, base + ", smile"))])
+    c.save_prompt_batch([c.extract_prompt_data(api_item(2, base + ", wink")),
+                         c.extract_prompt_data(api_item(3, "cyberpunk city, neon lights, rain, night"))])
+    rows = dict(c._get_conn().execute("SELECT civitai_id, group_id FROM civitai_prompts").fetchall())
+    ids = dict(c._get_conn().execute("SELECT civitai_id, id FROM civitai_prompts").fetchall())
+    assert rows["1"] == rows["2"] == ids["1"]
+    assert rows["3"] == ids["3"]
+    c.close()
+
+
+def test_batch_writer_maintains_tag_postings(api_item, tmp_path):
+    from collector.tags import prompts_with_tag
+
+    c = CivitaiPromptCollector(db_path=str(tmp_path / "v8.db"))
+    c.save_prompt_batch([c.extract_prompt_data(api_item(1, "(masterpiece:1.2), <lora:x:1>, castle")),
+                         c.extract_prompt_data(api_item(2, "masterpiece, forest"))])
+    conn = c._get_conn()
+    ids = dict(conn.execute("SELECT civitai_id, id FROM civitai_prompts").fetchall())
+    assert prompts_with_tag(conn, "masterpiece", model_id="42") == [ids["1"], ids["2"]]
+    assert prompts_with_tag(conn, "lora") == []
+    c.close()
@@ -0,0 +1,54 @@
+from pathlib import Path
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector import category_counts
+from collector.db import PromptStore, count_prompts, init_db, save_prompt
+
+
+def _rec(i, model="1", cats="style"):
+    return {"id": str(i), "model_id": model, "prompt": f"p{i}", "categories": cats, "created_at": "2025-01-01"}
+
+
+def test_prompt_store_save_many_and_pragmas(tmp_path):
+    db = str(tmp_path / "s.db")
+    with PromptStore(db) as store:
+        assert store.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert store.conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert store.save_many([_rec(i) for i in range(5)]) == 5
+        # 同じバッチ内の重複 id は後勝ちで、集計もずれない
+        store.save_many([_rec(0, model="2", cats="nsfw"), _rec(0, model="2", cats="style,nsfw")])
+        assert store.count() == 5
+        counts = category_counts.load_simple_counts(store.conn)
+    assert sorted(counts) == [("1", "style", 4), ("2", "nsfw", 1), ("2", "style", 1)]
+    assert count_prompts(db) == 5
+
+
+def test_prompt_store_missing_id_writes_nothing(tmp_path):
+    db = str(tmp_path / "s.db")
+    init_db(db)
+    with PromptStore(db) as store:
+        with pytest.raises(ValueError):
+            store.save_many([_rec(1), {"id": None}])
+        assert store.count() == 0
+
+
+def test_prompt_store_closes_only_its_own_connection(tmp_path):
+    db = str(tmp_path / "s.db")
+    init_db(db)
+    conn = sqlite3.connect(db)
+    save_prompt(conn, _rec(1))
+    with PromptStore(conn) as store:
+        store.save(_rec(2))
+    assert conn.execute("SELECT COUNT(*) FROM prompts").fetchone()[0] == 2
+    conn.close()
+
+    store = PromptStore(db)
+    store.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        store.count()
@@ -0,0 +1,46 @@
+import sqlite3
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector import dedup
+
+TEMPLATE = "masterpiece, best quality, 1girl, silver hair, blue eyes, school uniform, cherry blossoms, " \
+           "depth of field, cinematic lighting, ultra detailed, 8k, {}"
+
+
+def test_signature_tracks_tag_jaccard():
+    a = dedup.minhash_signature(TEMPLATE.format("smile"))
+    b = dedup.minhash_signature(TEMPLATE.format("crying"))
+    c = dedup.minhash_signature("cyberpunk city, neon lights, rain, night, flying cars")
+    assert dedup.minhash_signature(" ,  ") is None
+    assert dedup.similarity(a, dedup.minhash_signature("  " + TEMPLATE.format("SMILE").replace(", ", ",  "))) == 1.0
+    assert dedup.similarity(a, b) > 0.6
+    assert dedup.similarity(a, c) < 0.2
+
+
+def test_link_groups_persists_and_links_new_items():
+    conn = sqlite3.connect(":memory:")
+    dedup.create_tables(conn)
+    sigs = {1: TEMPLATE.format("smile"), 2: TEMPLATE.format("smile, wink"), 3: "cyberpunk city, neon lights, rain"}
+    groups = dedup.link_groups(conn, [(pid, dedup.minhash_signature(t)) for pid, t in sigs.items()], threshold=0.7)
+    assert groups == {1: 1, 2: 1, 3: 3}
+
+    # 後から来たバッチも保存済みのグループに入る。署名の無い行は自分が代表
+    groups = dedup.link_groups(conn, [(4, dedup.minhash_signature(TEMPLATE.format("smile, grin"))), (5, None)],
+                               threshold=0.7)
+    assert groups == {4: 1, 5: 5}
+    assert conn.execute("SELECT COUNT(DISTINCT prompt_id) FROM minhash_buckets").fetchone()[0] == 4
+
+
+def test_bucket_lookup_uses_band_bucket_index():
+    conn = sqlite3.connect(":memory:")
+    dedup.create_tables(conn)
+    conn.executemany(
+        "INSERT INTO minhash_buckets (band, bucket, prompt_id) VALUES (?, ?, ?)",
+        [(i % dedup.BANDS, i, i) for i in range(2000)],
+    )
+    conn.execute("ANALYZE")
+    plan = " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + dedup.bucket_query(3), [0, 1, 2, 3]))
+    assert "idx_minhash_buckets_key (band=? AND bucket=?)" in plan
@@ -0,0 +1,51 @@
+import numpy as np
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector.embedding_store import EmbeddingStore, normalize_prompt
+
+
+class _Encoder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(t), t.count(","), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_only_new_prompts_are_encoded_and_persisted(tmp_path):
+    db = str(tmp_path / "emb.db")
+    enc = _Encoder()
+    with EmbeddingStore(db, model_name="fake") as store:
+        out = store.get_or_compute(["a,  b", "c", "a, b"], encode=enc)
+        assert enc.calls == [["a, b", "c"]]
+        assert out.dtype == np.float32
+        assert np.array_equal(out[0], out[2])
+
+    with EmbeddingStore(db, model_name="fake") as store:
+        out = store.get_or_compute(["c", "d"], encode=enc)
+        assert enc.calls[-1] == ["d"]
+        assert store.vectors().shape == (3, 3)
+        assert out[0].tolist() == [1.0, 0.0, 1.0]
+
+
+def test_uncommitted_tail_is_truncated(tmp_path):
+    db = str(tmp_path / "emb.db")
+    enc = _Encoder()
+    with EmbeddingStore(db, model_name="fake") as store:
+        store.get_or_compute(["x"], encode=enc)
+        path = store.vector_path
+    # インデックスに載らなかった書きかけの行を模擬
+    with open(path, "ab") as f:
+        f.write(b"\0" * 100)
+    with EmbeddingStore(db, model_name="fake") as store:
+        out = store.get_or_compute(["y", "x"], encode=enc)
+        assert out[1].tolist() == [1.0, 0.0, 1.0]
+        assert Path(path).stat().st_size == 2 * 3 * 2
+
+
+def test_normalize_prompt():
+    assert normalize_prompt("  a ,b,\n c ") == "a, b, c"
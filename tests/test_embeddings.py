@@ -11,3 +11,25 @@ def test_embed_texts_importable():
     embs = embed_texts(samples, model_name="all-mpnet-base-v2")
     assert embs.shape[0] == 2
     assert embs.shape[1] > 0
+
+
+class _FakeModel:
+    def __init__(self):
+        self.seen = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, convert_to_numpy=True):
+        import numpy as np
+        self.seen.append((list(texts), batch_size))
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_embed_texts_dedupes_and_restores_order(monkeypatch):
+    import numpy as np
+    from collector import embeddings
+    fake = _FakeModel()
+    monkeypatch.setitem(embeddings._MODEL_CACHE, "fake-model", fake)
+    out = embeddings.embed_texts(["ccc", "a", "ccc", "bb"], model_name="fake-model", batch_size=8)
+    assert fake.seen == [(["a", "bb", "ccc"], 8)]
+    expected = np.array([[3, 1], [1, 1], [3, 1], [2, 1]], dtype=np.float32)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    assert np.allclose(out, expected)
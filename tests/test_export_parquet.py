@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector.civitai_collector_v8 import CivitaiPromptCollector
+from collector.export_parquet import (
+    CREATE_EXPORT_TABLES, export_parquet, iter_export_chunks, load_watermark, save_watermark,
+)
+
+
+NSFW = "masterpiece, portrait, nude"
+
+
+def _collect(db, items):
+    c = CivitaiPromptCollector(db_path=db)
+    c.save_prompt_batch([c.extract_prompt_data(it) for it in items])
+    c.close()
+
+
+def test_chunks_join_categories_and_follow_watermark(api_item, tmp_path):
+    db = str(tmp_path / "v8.db")
+    _collect(db, [api_item(i, NSFW) for i in range(5)])
+    conn = sqlite3.connect(db)
+    conn.executescript(CREATE_EXPORT_TABLES)
+    conn.execute("ALTER TABLE civitai_prompts ADD COLUMN categories TEXT")
+    conn.execute("UPDATE civitai_prompts SET categories = 'style|cluster:3' WHERE civitai_id = '2'")
+    conn.commit()
+
+    chunks = list(iter_export_chunks(conn, chunk_size=2))
+    assert [len(c["id"]) for c in chunks] == [2, 2, 1]
+    first = chunks[0]
+    assert "raw_metadata" not in first
+    assert "nsfw_explicit" in first["categories"][0]
+    assert first["categories"][0] == sorted(first["categories"][0])
+    assert first["collected_date"][0] == first["collected_at"][0][:10]
+    assert [cl for c in chunks for cl in c["cluster"]] == [None, None, 3, None, None]
+
+    last = chunks[-1]
+    save_watermark(conn, "out", last["collected_at"][-1], last["id"][-1])
+    assert list(iter_export_chunks(conn, load_watermark(conn, "out"))) == []
+    conn.close()
+
+    # 新しく収集した行だけが次回の対象になる
+    _collect(db, [api_item(9, NSFW, model_id=7)])
+    conn = sqlite3.connect(db)
+    rest = list(iter_export_chunks(conn, load_watermark(conn, "out")))
+    assert [c["civitai_id"] for c in rest] == [["9"]]
+    conn.close()
+
+
+def test_export_writes_partitioned_parquet(api_item, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    db = str(tmp_path / "v8.db")
+    out = tmp_path / "out"
+    _collect(db, [api_item(1, NSFW), api_item(2, NSFW, model_id=7)])
+    assert export_parquet(db, str(out)) == 2
+    assert export_parquet(db, str(out)) == 0
+    assert sorted(p.name for p in out.iterdir()) == ["model_id=42", "model_id=7"]
+    table = pq.read_table(str(out))
+    assert table.num_rows == 2
+    assert str(table.schema.field("model_name").type).startswith("dictionary")
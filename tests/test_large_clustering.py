@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector import categorizer, large_clustering
+
+
+def _blobs(sizes=(900, 90, 10), seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.eye(4)[:len(sizes)]
+    return np.vstack([rng.normal(c, 0.03, size=(n, 4)) for c, n in zip(centers, sizes)]).astype(np.float32)
+
+
+def test_choose_mode_by_size():
+    assert large_clustering.choose_mode(100, 768) == "full"
+    assert large_clustering.choose_mode(large_clustering.LARGE_CORPUS_THRESHOLD + 1, 768) == "large"
+
+
+def test_stratified_sample_keeps_small_regions():
+    embs = _blobs()
+    idx = large_clustering.stratified_sample(embs, sample_size=100, chunk_size=128)
+    assert len(idx) < len(embs)
+    assert np.all(np.diff(idx) > 0)
+    # 10 件しかない塊もサンプルに含まれる
+    assert np.any(idx >= 990)
+
+
+def test_cluster_large_falls_back_to_minibatch_kmeans(monkeypatch):
+    # サンプルのクラスタリングが全件 noise になった場合
+    monkeypatch.setattr(categorizer, "reduce_and_cluster",
+                        lambda embs, **kw: (np.full(len(embs), -1), embs, None, None))
+    embs = _blobs()
+    labels = large_clustering.cluster_large(embs, sample_size=100, chunk_size=128)
+    assert len(labels) == len(embs)
+    assert -1 not in labels
+    # 別の塊が同じラベルに混ざらない
+    assert not set(labels[:900].tolist()) & set(labels[900:990].tolist())
+
+
+def test_cluster_large_assigns_rest_to_sample_centroids(monkeypatch):
+    def fake(embs, **kw):
+        return np.argmax(embs, axis=1), embs, None, None
+    monkeypatch.setattr(categorizer, "reduce_and_cluster", fake)
+    embs = _blobs()
+    labels = large_clustering.cluster_large(embs, sample_size=100, chunk_size=128)
+    assert labels.tolist() == np.argmax(embs, axis=1).tolist()
+
+
+def test_cluster_prompts_large_mode_keeps_contract():
+    pytest.importorskip("umap")
+    pytest.importorskip("hdbscan")
+    embs = _blobs()
+    res = categorizer.cluster_prompts(["p"] * len(embs), embeddings=embs, mode="large", sample_size=200)
+    assert set(res) == {"labels", "embedding", "cluster_info"}
+    assert len(res["labels"]) == len(embs)
+    assert sum(res["cluster_info"].values()) == len(embs)
@@ -0,0 +1,36 @@
+import random
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector.matcher import KeywordMatcher
+from collector.civitai_collector_v8 import CivitaiPromptCollector
+
+
+def _naive(categories, text):
+    text = text.lower()
+    out = {}
+    for cat, kws in categories.items():
+        hits = [kw.lower() for kw in kws if kw.lower() in text]
+        if hits:
+            out[cat] = hits
+    return out
+
+
+def test_overlapping_and_nested_keywords():
+    cats = {"a": ["realistic", "photorealistic", "realistic skin"], "b": ["skin texture", "tex"]}
+    m = KeywordMatcher(cats)
+    assert m.match("Photorealistic skin texture") == {"a": ["realistic", "photorealistic", "realistic skin"], "b": ["skin texture", "tex"]}
+    assert m.match("realistic skin") == {"a": ["realistic", "realistic skin"]}
+    assert m.match("") == {}
+
+
+def test_matches_naive_substring_scan_on_v8_dictionary():
+    cats = CivitaiPromptCollector(db_path=":memory:").categories
+    m = KeywordMatcher(cats)
+    vocab = [kw for kws in cats.values() for kw in kws] + ["1girl", "solo", "smile", "darkness", "xnsfw"]
+    rng = random.Random(0)
+    for _ in range(500):
+        text = ", ".join(rng.choice(vocab) for _ in range(rng.randint(1, 30)))
+        assert m.match(text) == _naive(cats, text)
@@ -0,0 +1,98 @@
+from pathlib import Path
+import sqlite3
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT))
+
+from collector import category_counts
+from collector.civitai_collector_v8 import CivitaiPromptCollector
+from collector.db import init_db
+import migrate_v8_to_simple
+
+
+def _v8_db(api_item, tmp_path, n=7):
+    db = str(tmp_path / "v8.db")
+    c = CivitaiPromptCollector(db_path=db)
+    c.save_prompt_batch([c.extract_prompt_data(api_item(i, "anime, nude" if i % 2 else "portrait")) for i in range(n)])
+    expected = {}
+    conn = c._get_conn()
+    for pid, civitai_id in conn.execute("SELECT id, civitai_id FROM civitai_prompts"):
+        cats = sorted({r[0] for r in conn.execute("SELECT category FROM prompt_categories WHERE prompt_id = ?", (pid,))})
+        expected[civitai_id] = ",".join(cats) or None
+    c.close()
+    return db, expected
+
+
+def _prompts(db):
+    conn = sqlite3.connect(db)
+    try:
+        return dict(conn.execute("SELECT id, categories FROM prompts").fetchall())
+    finally:
+        conn.close()
+
+
+def test_migrate_in_chunks(api_item, tmp_path):
+    db, expected = _v8_db(api_item, tmp_path)
+    assert migrate_v8_to_simple.migrate(db, chunk_size=3) == 7
+    assert _prompts(db) == expected
+    # 完了後の再実行は全件を同期し直す（重複はしない）
+    assert migrate_v8_to_simple.migrate(db, chunk_size=3) == 7
+    assert _prompts(db) == expected
+
+
+def test_migrate_resumes_from_state(api_item, tmp_path):
+    db, expected = _v8_db(api_item, tmp_path)
+    conn = sqlite3.connect(db)
+    conn.executescript(migrate_v8_to_simple.CREATE_STATE_TABLE)
+    third = conn.execute("SELECT id FROM civitai_prompts ORDER BY id LIMIT 1 OFFSET 2").fetchone()[0]
+    # 3 行目までのチャンクを書いたところで止まった状態
+    conn.execute("INSERT INTO migration_state (name, last_id) VALUES (?, ?)", (migrate_v8_to_simple.STATE_NAME, third))
+    conn.commit()
+    conn.close()
+
+    assert migrate_v8_to_simple.migrate(db, chunk_size=3) == 4
+    assert len(_prompts(db)) == 4
+    assert migrate_v8_to_simple.migrate(db, chunk_size=3, restart=True) == 7
+    assert _prompts(db) == expected
+
+
+def test_migrate_rebuilds_simple_counts(api_item, tmp_path):
+    db, expected = _v8_db(api_item, tmp_path)
+    init_db(db)
+    migrate_v8_to_simple.migrate(db)
+    conn = sqlite3.connect(db)
+    counts = {}
+    for cats in expected.values():
+        for cat in (cats or "").split(","):
+            if cat:
+                counts[("42", cat)] = counts.get(("42", cat), 0) + 1
+    assert {(m, c): n for m, c, n in category_counts.load_simple_counts(conn)} == counts
+    conn.close()
+
+
+def test_migrate_legacy_v8_schema(tmp_path):
+    # 列追加（content_hash / group_id）前の v8 スキーマを手で作る
+    db = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(db)
+    conn.executescript("""
+    CREATE TABLE civitai_prompts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, civitai_id TEXT UNIQUE, full_prompt TEXT, negative_prompt TEXT,
+        quality_score INTEGER, reaction_count INTEGER, comment_count INTEGER, download_count INTEGER,
+        prompt_length INTEGER, tag_count INTEGER, model_name TEXT, model_id TEXT, collected_at TIMESTAMP,
+        raw_metadata TEXT
+    );
+    CREATE TABLE prompt_categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, prompt_id INTEGER, category TEXT, keywords TEXT, confidence REAL
+    );
+    INSERT INTO civitai_prompts (civitai_id, full_prompt, model_name, model_id) VALUES ('a', 'castle', 'm', '1'), ('b', 'moon', 'm', '1');
+    INSERT INTO prompt_categories (prompt_id, category) VALUES (1, 'style'), (1, 'lighting'), (2, 'style');
+    """)
+    conn.close()
+
+    assert migrate_v8_to_simple.migrate(db) == 2
+    assert _prompts(db) == {"a": "lighting,style", "b": "style"}
+    conn = sqlite3.connect(db)
+    assert sorted(category_counts.load_counts(conn)) == [("m", "lighting", 1), ("m", "style", 2)]
+    conn.close()
@@ -0,0 +1,53 @@
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector.ratelimit import AdaptiveRateLimiter, parse_retry_after
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, s):
+        self.now += s
+
+
+def test_parse_retry_after_seconds_and_date():
+    assert parse_retry_after("12") == 12.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480.0) == 10.0
+    assert parse_retry_after("garbage") is None
+
+
+def test_token_bucket_paces_to_rate():
+    clock = _Clock()
+    rl = AdaptiveRateLimiter(max_rate=2.0, initial_rate=2.0, clock=clock, sleep=clock.sleep)
+    for _ in range(5):
+        rl.acquire()
+    # burst 1 の後は 0.5 秒間隔
+    assert abs(clock.now - 2.0) < 1e-9
+
+
+def test_backoff_halves_rate_and_recovers_to_ceiling():
+    clock = _Clock()
+    rl = AdaptiveRateLimiter(max_rate=4.0, initial_rate=4.0, clock=clock, sleep=clock.sleep)
+    rl.on_response(429, {})
+    assert rl.rate == 2.0
+    assert rl.backoff(1, {"Retry-After": "30"}) == 30.0
+    rl.acquire()
+    assert clock.now >= 30.0
+    for _ in range(20):
+        rl.on_response(200, {})
+    assert rl.rate == 4.0
+
+
+def test_rate_limit_headers_block_until_reset():
+    clock = _Clock()
+    rl = AdaptiveRateLimiter(max_rate=10.0, initial_rate=10.0, clock=clock, sleep=clock.sleep)
+    rl.on_response(200, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "5"})
+    rl.acquire()
+    assert clock.now >= 5.0
@@ -0,0 +1,86 @@
+import json
+import sqlite3
+
+import pytest
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector.civitai_collector_v8 import CivitaiPromptCollector
+from collector.raw_store import RawMetadataStore, migrate_raw_metadata
+
+
+def _raw(i):
+    return json.dumps({
+        "id": i, "url": f"https://image.civitai.com/xG1nkqKTMzGDvpLrqFT7WA/{i}/width=512/{i}.jpeg",
+        "stats": {"cryCount": 0, "laughCount": i % 3, "likeCount": i * 7, "heartCount": 2, "commentCount": 1},
+        "meta": {"prompt": f"masterpiece, best quality, 1girl, silver hair, seed word {i}", "negativePrompt": "lowres",
+                 "sampler": "DPM++ 2M Karras", "cfgScale": 7, "steps": 30, "seed": 1000 + i, "Size": "512x768"},
+    }, ensure_ascii=False)
+
+
+@pytest.mark.parametrize("codec", ["zlib", "zstd"])
+def test_roundtrip_and_dictionary(codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    conn = sqlite3.connect(":memory:")
+    store = RawMetadataStore(conn, codec=codec, train_samples=20)
+    with conn:
+        store.put_many([(i, _raw(i)) for i in range(10)])
+        store.put_many([(i, _raw(i)) for i in range(10, 40)])
+    assert store.dict_id is not None
+    # 辞書を学習した後の行は辞書付きで、無しより小さい
+    sizes = dict(conn.execute("SELECT dict_id IS NOT NULL, AVG(LENGTH(data)) FROM prompt_raw GROUP BY 1").fetchall())
+    assert sizes[1] < sizes[0] < len(_raw(0))
+
+    fresh = RawMetadataStore(conn, codec=codec)
+    assert fresh.dict_id == store.dict_id
+    assert fresh.get(3) == _raw(3) and fresh.get(33) == _raw(33)
+    assert fresh.get(99) is None
+
+
+def test_dictionary_from_rolled_back_transaction_is_dropped():
+    conn = sqlite3.connect(":memory:")
+    store = RawMetadataStore(conn, codec="zlib", train_samples=20)
+    with pytest.raises(sqlite3.OperationalError):
+        with conn:
+            store.put_many([(i, _raw(i)) for i in range(30)])
+            raise sqlite3.OperationalError("database is locked")
+    assert conn.execute("SELECT COUNT(*) FROM raw_dicts").fetchone()[0] == 0
+
+    # 消えた辞書は使わず、学習し直した辞書で保存する
+    with conn:
+        store.put_many([(i, _raw(i)) for i in range(30)])
+    assert conn.execute("SELECT COUNT(*) FROM raw_dicts").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM prompt_raw WHERE dict_id NOT IN (SELECT id FROM raw_dicts)").fetchone()[0] == 0
+    assert RawMetadataStore(conn, codec="zlib").get(25) == _raw(25)
+
+
+def test_migration_moves_inline_column_and_is_resumable(tmp_path):
+    db = str(tmp_path / "old.db")
+    CivitaiPromptCollector(db_path=db, raw_storage="inline").close()
+    conn = sqlite3.connect(db)
+    conn.executemany("INSERT INTO civitai_prompts (civitai_id, full_prompt, raw_metadata) VALUES (?, ?, ?)",
+                     [(str(i), "p", _raw(i)) for i in range(50)])
+    conn.commit()
+    assert migrate_raw_metadata(conn, codec="zlib", chunk_size=16, train_samples=10) == 50
+    assert conn.execute("SELECT COUNT(*) FROM civitai_prompts WHERE raw_metadata IS NOT NULL").fetchone()[0] == 0
+    assert migrate_raw_metadata(conn, codec="zlib") == 0
+    conn.close()
+
+    c = CivitaiPromptCollector(db_path=db)
+    assert c.get_raw_metadata("7")["meta"]["seed"] == 1007
+    c.close()
+
+
+def test_collector_stores_raw_metadata_compressed(tmp_path):
+    c = CivitaiPromptCollector(db_path=str(tmp_path / "v8.db"))
+    item = {"id": 5, "modelId": 1, "meta": {"prompt": "castle, night", "seed": 42}, "stats": {}}
+    c.save_prompt_batch([c.extract_prompt_data(item)])
+    conn = c._get_conn()
+    assert conn.execute("SELECT raw_metadata FROM civitai_prompts").fetchone()[0] is None
+    assert conn.execute("SELECT COUNT(*) FROM prompt_raw").fetchone()[0] == 1
+    assert c.get_raw_metadata("5") == item
+    assert c.get_raw_metadata("missing") is None
+    c.close()
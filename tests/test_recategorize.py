@@ -0,0 +1,50 @@
+import sqlite3
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector.civitai_collector_v8 import CivitaiPromptCollector
+from collector.db import init_db, save_prompt
+from collector.recategorize import recategorize
+
+
+def _seed_v8(db):
+    c = CivitaiPromptCollector(db_path=db)
+    items = [
+        {"id": i, "modelId": 1, "meta": {"prompt": p}, "stats": {}}
+        for i, p in enumerate(["anime, portrait", "nude", "golden hour, masterpiece"] * 4)
+    ]
+    c.save_prompt_batch([c.extract_prompt_data(it) for it in items])
+    conn = c._get_conn()
+    expected = conn.execute("SELECT prompt_id, category, keywords FROM prompt_categories ORDER BY 1, 2").fetchall()
+    # 古いカテゴリが残っている状態を作る
+    with conn:
+        conn.execute("DELETE FROM prompt_categories")
+        conn.execute("INSERT INTO prompt_categories (prompt_id, category) VALUES (1, 'stale')")
+    c.close()
+    return expected
+
+
+def test_recategorize_v8_inline_and_pool(tmp_path):
+    db = str(tmp_path / "v8.db")
+    expected = _seed_v8(db)
+    for workers in (1, 2):
+        res = recategorize(db, chunk_size=5, workers=workers)
+        assert res["rows"] == 12
+        conn = sqlite3.connect(db)
+        got = conn.execute("SELECT prompt_id, category, keywords FROM prompt_categories ORDER BY 1, 2").fetchall()
+        conn.close()
+        assert got == expected
+
+
+def test_recategorize_simple_schema(tmp_path):
+    db = str(tmp_path / "simple.db")
+    init_db(db)
+    conn = sqlite3.connect(db)
+    save_prompt(conn, {"id": "a", "prompt": "anime girl at sunset", "categories": "old"})
+    conn.close()
+    recategorize(db, schema="simple", workers=1)
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT categories FROM prompts").fetchone()[0] == "lighting,style"
+    conn.close()
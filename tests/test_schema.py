@@ -0,0 +1,68 @@
+from pathlib import Path
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector import schema
+from collector.civitai_collector_v8 import CivitaiPromptCollector
+
+
+def _indexes(conn, table):
+    return {r[1] for r in conn.execute(f"PRAGMA index_list({table})")}
+
+
+def test_new_db_is_tuned_and_versioned(tmp_path):
+    c = CivitaiPromptCollector(db_path=str(tmp_path / "v8.db"))
+    conn = c._get_conn()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+    assert schema.schema_version(conn) == schema.SCHEMA_VERSION
+    assert {"idx_prompt_categories_prompt_id", "idx_prompt_categories_category"} <= _indexes(conn, "prompt_categories")
+    assert {"idx_civitai_prompts_model", "idx_civitai_prompts_collected"} <= _indexes(conn, "civitai_prompts")
+
+    plan = " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN DELETE FROM prompt_categories WHERE prompt_id = 1"))
+    assert "idx_prompt_categories_prompt_id" in plan
+    c.close()
+
+
+def test_existing_db_is_migrated_and_analyzed(api_item, tmp_path):
+    db = str(tmp_path / "v8.db")
+    c = CivitaiPromptCollector(db_path=db)
+    c.save_prompt_batch([c.extract_prompt_data(api_item(i)) for i in range(5)])
+    conn = c._get_conn()
+    # 索引の無い古い DB を再現する
+    for name in ("idx_prompt_categories_prompt_id", "idx_prompt_categories_category", "idx_civitai_prompts_model"):
+        conn.execute(f"DROP INDEX {name}")
+    conn.execute("PRAGMA user_version = 0")
+    conn.commit()
+    c.close()
+
+    c = CivitaiPromptCollector(db_path=db)
+    conn = c._get_conn()
+    assert schema.schema_version(conn) == schema.SCHEMA_VERSION
+    assert "idx_prompt_categories_category" in _indexes(conn, "prompt_categories")
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_stat1 WHERE tbl = 'prompt_categories'").fetchone()[0] > 0
+    # 2 回目は何も流さない
+    assert schema.migrate(conn) == 0
+    c.close()
+
+
+def test_newer_schema_is_rejected():
+    conn = sqlite3.connect(":memory:")
+    conn.execute(f"PRAGMA user_version = {schema.SCHEMA_VERSION + 1}")
+    with pytest.raises(RuntimeError):
+        schema.migrate(conn)
+
+
+def test_optimize_analyzes_after_load(api_item):
+    c = CivitaiPromptCollector(db_path=":memory:")
+    c.save_prompt_batch([c.extract_prompt_data(api_item(i)) for i in range(5)])
+    c.optimize_database()
+    conn = c._get_conn()
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+    c.optimize_database()
+    c.close()
@@ -0,0 +1,82 @@
+import sqlite3
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector import search
+from collector.civitai_collector_v8 import CivitaiPromptCollector
+
+
+def test_build_match_query_quotes_tags():
+    assert search.build_match_query("silver hair, (blue_eyes:1.2), castl*") == \
+        '"silver hair" AND "blue eyes" AND "castl"*'
+    assert search.build_match_query(' , "NOT" ') == '"not"'
+
+
+def test_fts_follows_upserts_and_ranks(api_item, tmp_path):
+    c = CivitaiPromptCollector(db_path=str(tmp_path / "v8.db"))
+    c.save_prompt_batch([
+        c.extract_prompt_data(api_item(1, "1girl, (silver hair:1.2), castle, night")),
+        c.extract_prompt_data(api_item(2, "silver armor, hair ornament, castle")),
+        c.extract_prompt_data(api_item(3, "forest, river", negative="silver hair", model_id=7)),
+    ])
+    hits = c.search_prompts("silver hair")
+    assert [h["civitai_id"] for h in hits] == ["1", "3"]
+    assert "[silver hair]" in hits[0]["snippet"]
+    assert [h["civitai_id"] for h in c.search_prompts("silver hair", column="negative_prompt")] == ["3"]
+    assert {h["civitai_id"] for h in c.search_prompts("castle", model_id="42")} == {"1", "2"}
+    assert {h["civitai_id"] for h in c.search_prompts("cast*")} == {"1", "2"}
+
+    # UPSERT で本文が変わると索引も追従する
+    c.save_prompt_batch([c.extract_prompt_data(api_item(1, "desert, camel"))])
+    assert [h["civitai_id"] for h in c.search_prompts("castle")] == ["2"]
+    assert [h["civitai_id"] for h in c.search_prompts("camel")] == ["1"]
+    c.close()
+
+
+def test_existing_db_is_backfilled(tmp_path):
+    db = str(tmp_path / "old.db")
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE civitai_prompts (id INTEGER PRIMARY KEY, civitai_id TEXT UNIQUE, full_prompt TEXT, "
+                 "negative_prompt TEXT, model_name TEXT, model_id TEXT)")
+    conn.execute("INSERT INTO civitai_prompts VALUES (1, 'a', 'old castle', '', 'm', '1')")
+    conn.commit()
+    search.create_fts(conn)
+    assert [h["civitai_id"] for h in search.search_prompts(conn, "castle")] == ["a"]
+    conn.close()
+
+
+def test_weights_and_extra_networks_are_not_indexed(api_item, tmp_path):
+    c = CivitaiPromptCollector(db_path=str(tmp_path / "v8.db"))
+    c.save_prompt_batch([
+        c.extract_prompt_data(api_item(1, "(masterpiece:1.2), <lora:detail:0.8>, ((blue_eyes)), 1girl")),
+        c.extract_prompt_data(api_item(2, "2 cats, sunset", negative="(worst quality:1.4)")),
+    ])
+    conn = c._get_conn()
+    assert conn.execute("SELECT search_prompt FROM civitai_prompts WHERE civitai_id = '1'").fetchone()[0] == \
+        "masterpiece, blue eyes, 1girl"
+    # 重みの数字や lora 名では引っかからず、タグに含まれる数字はそのまま引ける
+    assert [h["civitai_id"] for h in c.search_prompts("1", raw=True)] == []
+    assert [h["civitai_id"] for h in c.search_prompts("lora OR detail OR 4", raw=True)] == []
+    assert [h["civitai_id"] for h in c.search_prompts("2", raw=True)] == ["2"]
+    assert [h["civitai_id"] for h in c.search_prompts("blue eyes, 1girl")] == ["1"]
+    assert [h["civitai_id"] for h in c.search_prompts("worst quality", column="negative_prompt")] == ["2"]
+    c.close()
+
+
+def test_old_fts_definition_is_rebuilt_on_normalised_columns(tmp_path):
+    db = str(tmp_path / "old.db")
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE civitai_prompts (id INTEGER PRIMARY KEY, civitai_id TEXT UNIQUE, full_prompt TEXT, "
+                 "negative_prompt TEXT, model_name TEXT, model_id TEXT)")
+    conn.execute("INSERT INTO civitai_prompts VALUES (1, 'a', '(castle:1.3), moon', '', 'm', '1')")
+    # 以前の定義（full_prompt / negative_prompt を直接索引）
+    conn.executescript("CREATE VIRTUAL TABLE civitai_prompts_fts USING fts5(full_prompt, negative_prompt, "
+                       "content='civitai_prompts', content_rowid='id');"
+                       "INSERT INTO civitai_prompts_fts(civitai_prompts_fts) VALUES ('rebuild');")
+    conn.commit()
+    search.create_fts(conn)
+    assert [h["civitai_id"] for h in search.search_prompts(conn, "castle")] == ["a"]
+    assert search.search_prompts(conn, "3", raw=True) == []
+    conn.close()
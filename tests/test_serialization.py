@@ -0,0 +1,52 @@
+import importlib
+import json
+
+import pytest
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+import collector.serialization as serialization
+
+PAGE = {
+    "items": [{"id": 1, "meta": {"prompt": "桜, masterpiece"}, "stats": {"likeCount": 3}},
+              {"id": 2, "meta": None, "stats": {}}],
+    "metadata": {"nextPage": "https://civitai.com/api/v1/images?cursor=abc"},
+}
+
+
+@pytest.fixture(params=["json", "orjson", "msgspec"])
+def backend(request, monkeypatch):
+    if request.param != "json":
+        pytest.importorskip(request.param)
+    monkeypatch.setenv("COLLECTOR_JSON_BACKEND", request.param)
+    mod = importlib.reload(serialization)
+    assert mod.BACKEND == request.param
+    yield mod
+    monkeypatch.delenv("COLLECTOR_JSON_BACKEND")
+    importlib.reload(serialization)
+
+
+def test_decode_page_and_item_bytes(backend):
+    body = json.dumps(PAGE, ensure_ascii=False).encode("utf-8")
+    items, metadata = backend.decode_page(body)
+    assert items == PAGE["items"]
+    assert metadata["nextPage"].endswith("cursor=abc")
+    raw = backend.item_bytes(items[0])
+    assert json.loads(raw) == PAGE["items"][0]
+    assert "桜".encode("utf-8") in raw
+    assert backend.dumps(["桜", "a"]).replace(" ", "") == '["桜","a"]'
+    assert backend.decode_page(b'{"items": []}') == ([], {})
+
+
+
+@pytest.mark.parametrize("body", [b"<html>oops", b'{"items": [', b"[]"])
+def test_decode_page_rejects_broken_body(backend, body):
+    with pytest.raises(backend.DECODE_ERRORS):
+        backend.decode_page(body)
+
+def test_raw_item_bytes_are_reused():
+    item = serialization.RawItem({"id": 1}, raw=b'{"id":1}')
+    assert serialization.item_bytes(item) is item.raw
+    assert item == {"id": 1}
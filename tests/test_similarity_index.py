@@ -0,0 +1,51 @@
+import sqlite3
+import zlib
+
+import numpy as np
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector.similarity_index import SimilarityIndex
+
+
+def _encode(texts):
+    # 先頭タグごとに決まった方向 + 残りのタグで小さく揺らす
+    out = []
+    for t in texts:
+        tags = [s.strip() for s in t.split(",")]
+        v = np.random.default_rng(zlib.crc32(tags[0].encode())).normal(size=16)
+        v += 0.1 * np.random.default_rng(zlib.crc32(t.encode())).normal(size=16)
+        out.append(v)
+    return np.asarray(out, dtype=np.float32)
+
+
+def _make_db(path, prompts, start=1):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS civitai_prompts (id INTEGER PRIMARY KEY, civitai_id TEXT, "
+                 "full_prompt TEXT, content_hash TEXT)")
+    conn.executemany("INSERT INTO civitai_prompts VALUES (?, ?, ?, ?)",
+                     [(start + i, f"c{start + i}", p, str(hash(p))) for i, p in enumerate(prompts)])
+    conn.commit()
+    conn.close()
+
+
+def test_build_search_and_incremental_update(tmp_path):
+    db = str(tmp_path / "sim.db")
+    heads = ["castle", "forest", "robot", "ocean", "desert"]
+    _make_db(db, [f"{h}, detail {i}" for h in heads for i in range(20)])
+
+    with SimilarityIndex(db, model_name="fake", encode=_encode) as index:
+        assert index.build(nlist=5) == 100
+        hits = index.search_similar("robot, detail 3", k=5, nprobe=2)
+        assert hits[0] == ("c44", hits[0][1])
+        assert hits[0][1] > 0.99
+        assert all(40 < int(cid[1:]) <= 60 for cid, _ in hits)
+        assert [s for _, s in hits] == sorted((s for _, s in hits), reverse=True)
+
+    _make_db(db, ["robot, brand new"], start=101)
+    with SimilarityIndex(db, model_name="fake", encode=_encode) as index:
+        assert index.update() == 1
+        assert index.update() == 0
+        assert index.search_similar("robot, brand new", k=1)[0][0] == "c101"
@@ -0,0 +1,41 @@
+import sqlite3
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector import tags
+
+
+def test_parse_tags_strips_weights_and_extra_networks():
+    text = ("((masterpiece)), (best_quality:1.2), [blurry], <lora:detailTweaker:0.8>, "
+            "hatsune miku \\(cosplay\\),  Silver   Hair ,BREAK, {smile}, masterpiece\nnight")
+    assert tags.parse_tags(text) == [
+        "masterpiece", "best quality", "blurry", "hatsune miku (cosplay)", "silver hair", "smile", "night",
+    ]
+    assert tags.parse_tags("(masterpiece, best quality:1.3)") == ["masterpiece", "best quality"]
+    assert tags.parse_tags("") == []
+
+
+def test_store_and_query_postings():
+    conn = sqlite3.connect(":memory:")
+    tags.create_tables(conn)
+    with conn:
+        tags.store_prompt_tags(conn, [
+            (1, "10", tags.parse_tags("1girl, (smile:1.1), night")),
+            (2, "10", tags.parse_tags("1girl, castle")),
+            (3, "20", tags.parse_tags("1girl, smile")),
+        ])
+    assert tags.prompts_with_tag(conn, "(Smile:1.4)") == [1, 3]
+    assert tags.prompts_with_tag(conn, "smile", model_id="10") == [1]
+    assert tags.tag_frequencies(conn, limit=2) == [("1girl", 3), ("smile", 2)]
+    assert tags.tag_frequencies(conn, model_id="10", limit=1) == [("1girl", 2)]
+
+    # 再保存でタグは置き換わり、tags は重複登録されない
+    with conn:
+        tags.store_prompt_tags(conn, [(1, "10", ["castle"])])
+    assert tags.prompts_with_tag(conn, "smile") == [3]
+    assert conn.execute("SELECT COUNT(*) FROM tags").fetchone()[0] == 4
+    plan = " ".join(r[-1] for r in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT prompt_id FROM prompt_tags WHERE model_id = '10' AND tag_id = 1"))
+    assert "idx_prompt_tags_model_tag" in plan
@@ -0,0 +1,44 @@
+import sqlite3
+
+import matplotlib
+matplotlib.use("Agg")
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from collector.db import CREATE_PROMPTS_TABLE, init_db, save_prompt
+from collector.visualizer import _load_counts, visualize_category_distribution
+
+ROWS = [
+    {"id": "a", "model_id": "1", "prompt": "p", "categories": "style,nsfw_safe"},
+    {"id": "b", "model_id": "1", "prompt": "p", "categories": "style|cluster:4"},
+    {"id": "c", "model_id": "2", "prompt": "p", "categories": "character"},
+    {"id": "d", "model_id": None, "prompt": "p", "categories": ""},
+]
+EXPECTED = {"1": {"style": 2, "nsfw_safe": 1}, "2": {"character": 1}}
+
+
+def test_sql_split_without_summary_table(tmp_path):
+    db = str(tmp_path / "plain.db")
+    conn = sqlite3.connect(db)
+    conn.executescript(CREATE_PROMPTS_TABLE)
+    for r in ROWS:
+        save_prompt(conn, r)
+    plan = " ".join(r[-1] for r in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT categories FROM prompts WHERE model_id IN ('1')"))
+    conn.close()
+    assert "idx_prompts_model_id" in plan
+    assert _load_counts(db) == EXPECTED
+    assert _load_counts(db, ["2"]) == {"2": {"character": 1}}
+
+
+def test_summary_table_and_plot(tmp_path):
+    db = str(tmp_path / "simple.db")
+    init_db(db)
+    conn = sqlite3.connect(db)
+    for r in ROWS:
+        save_prompt(conn, r)
+    conn.close()
+    assert _load_counts(db) == EXPECTED
+    assert visualize_category_distribution(db, models_to_plot=["1"], show=False) == {"1": EXPECTED["1"]}